@@ -1,6 +1,7 @@
 from otree.api import *
-import random
-import math
+
+from common import labels, payment, rng, timing
+from common.timing import instrument_pages
 
 doc = """
 最终支付结算页面
@@ -13,9 +14,11 @@ class C(BaseConstants):
     PLAYERS_PER_GROUP = None
     NUM_ROUNDS = 1
 
-    # 支付倍数
-    MULTIPLIER = 40
-    BASE_BONUS = 500
+    # 支付倍数（与支付模拟共用 common.payment 的定义）
+    MULTIPLIER = payment.MULTIPLIER
+    BASE_BONUS = payment.BASE_BONUS
+    # 从这么多轮中抽取支付轮
+    PAY_ROUNDS = payment.PAY_ROUNDS
     # 角色定义
     ROLE_P1 = 'P1'
     ROLE_P2 = 'P2'
@@ -49,8 +52,13 @@ class Player(BasePlayer):
 
 # FUNCTIONS
 def creating_session(subsession: Subsession):
-    """初始化session"""
-    pass
+    """初始化session：在参与者开始之前决定 session 的随机数种子（common/rng.py）"""
+    rng.session_seed(subsession.session)
+
+
+def lottery(participant, draw: str):
+    """参与者的抽签（draw: round / coin / ai）各用一个随机数流，重新计算时结果相同"""
+    return rng.stream(participant.session, 'payment', participant.code, draw)
 
 
 # PAGES
@@ -86,7 +94,7 @@ class FinalResultsPage(Page):
                 previous_app = 'human_human'  # 默认值
 
             # 从所有回合中随机抽取
-            pay_round = random.randint(1, 10)
+            pay_round = lottery(participant, 'round').randint(1, C.PAY_ROUNDS)
             player.selected_round = pay_round
 
             print(f"[FinalResultsPage] Selected round {pay_round} for previous_app: {previous_app}")
@@ -171,14 +179,28 @@ class FinalResultsPage(Page):
 def custom_export(players):
     # header row
     yield ['label', 'Final_Payoff']
+    players = list(players)
+    # 按 session 一次读出参与者，每行只查 dict（见 common/labels.py）
+    participants = labels.participant_index(players)
     for p in players:
-        participant = p.participant
-        FINAL_PAYOFF = int(math.ceil(p.final_payment / 10) * 10)
+        participant = labels.participant_of(participants, p)
+        FINAL_PAYOFF = payment.paid_amount(p.final_payment)
         yield [
         participant.label, FINAL_PAYOFF
         ]
 
 
+def vars_for_admin_report(subsession: Subsession):
+    """admin 报告页：按 label 搜索本 session 的参与者与支付，以及本服务器进程中各页面 hook 的耗时直方图（见 common.timing）"""
+    import json
+    rows = timing.snapshot()
+    return dict(
+        label_rows=labels.session_label_rows(subsession.session, subsession.get_players()),
+        timing_rows=rows,
+        timing_json=json.dumps(rows, ensure_ascii=False, indent=1),
+    )
+
+
 # ==================== 辅助函数 ====================
 
 def get_all_rounds_data(player: Player, app_name: str) -> list:
@@ -340,7 +362,7 @@ def calculate_human_ai1_payment(player: Player, round_num: int):
         print(f"[calculate_human_ai1_payment] Round={round_num}, Role={my_role}, My_points={my_points}")
 
         # 50/50概率
-        use_ai = random.choice([True, False])
+        use_ai = lottery(participant, 'coin').choice([True, False])
         player.used_ai_payoff = use_ai
 
         if use_ai:
@@ -433,7 +455,7 @@ def get_random_ai_payoff_same_round(my_participant, round_num: int, my_role: str
 
         if all_options:
             # 随机选择一个
-            selected = random.choice(all_options)
+            selected = lottery(my_participant, 'ai').choice(all_options)
             print(
                 f"[get_random_ai_payoff_same_round] Found {len(all_options)} options for Round {round_num}, Role {my_role}, "
                 f"selected: Participant {selected[1]}, AI_Points {selected[0]}")
@@ -630,7 +652,7 @@ def get_random_ai_payoff(my_participant, my_role: str):
 
         if all_options:
             # 随机选择一个
-            selected = random.choice(all_options)
+            selected = lottery(my_participant, 'ai').choice(all_options)
             print(
                 f"[get_random_ai_payoff] Found {len(all_options)} options for role {my_role}, "
                 f"selected: Participant {selected[1]}, Round {selected[2]}, AI_Points {selected[0]}")
@@ -646,4 +668,5 @@ def get_random_ai_payoff(my_participant, my_role: str):
         return None
 
 
-page_sequence = [FinalResultsPage]
\ No newline at end of file
+page_sequence = [FinalResultsPage]
+instrument_pages(page_sequence)
@@ -0,0 +1,11 @@
+from otree.api import Currency as c, currency_range, expect, Bot, SubmissionMustFail, Submission
+from . import *
+from common.bots import submit, record_idle
+
+
+class PlayerBot(Bot):
+    def play_round(self):
+        record_idle(self)
+        # 最后一页没有按钮
+        yield from submit(self, FinalResultsPage, check_html=False)
+        expect(self.player.final_payment, '>=', C.BASE_BONUS)
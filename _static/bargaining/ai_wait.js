@@ -0,0 +1,27 @@
+// AI worker 决策期间的等待页面（Bargain_AIWait，见 common/jobs.py）
+// 定期通过 live_method 询问结果；服务器已把结果写入 group 时返回 {ready: true}，自动进入下一页。
+(function () {
+    var POLL_MS = 500;
+    var submitted = false;
+
+    window.liveRecv = function (data) {
+        if (data.ready && !submitted) {
+            submitted = true;
+            document.getElementById('form').submit();
+        }
+    };
+
+    function poll() {
+        if (submitted) {
+            return;
+        }
+        try {
+            liveSend({});
+        } catch (e) {
+            // websocket 还没有连接时下次再试
+        }
+        setTimeout(poll, POLL_MS);
+    }
+
+    poll();
+})();
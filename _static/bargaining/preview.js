@@ -0,0 +1,75 @@
+// 提议 / 回应页面的实时预览（所有讨价还价 app 共用）
+// 数值由 #preview 的 data 属性传入:
+//   data-mode            'propose'（输入 offer_points 时更新）或 'respond'（选择「受け入れる」时显示）
+//   data-endowment       总点数
+//   data-offer           回应页面中对方提议给自己的点数
+//   data-you-discount    本阶段自己的折扣率
+//   data-other-discount  本阶段对方的折扣率
+(function () {
+    function setText(id, value) {
+        document.getElementById(id).textContent = value;
+    }
+
+    function render(box, youOriginal, otherOriginal) {
+        var youDiscount = parseFloat(box.dataset.youDiscount);
+        var otherDiscount = parseFloat(box.dataset.otherDiscount);
+
+        setText('you-original', youOriginal);
+        setText('you-discount', youDiscount.toFixed(2));
+        setText('you-discounted', (youOriginal * youDiscount).toFixed(2));
+
+        setText('other-original', otherOriginal);
+        setText('other-discount', otherDiscount.toFixed(2));
+        setText('other-discounted', (otherOriginal * otherDiscount).toFixed(2));
+
+        box.style.display = 'block';
+    }
+
+    function initPropose(box, endowment) {
+        var input = document.querySelector('input[name="offer_points"]');
+        if (!input) {
+            return;
+        }
+        function update() {
+            var offerPoints = parseInt(input.value, 10);
+            if (input.value === '' || isNaN(offerPoints) || offerPoints < 0 || offerPoints > endowment) {
+                box.style.display = 'none';
+                return;
+            }
+            render(box, endowment - offerPoints, offerPoints);
+        }
+        input.addEventListener('input', update);
+        input.addEventListener('change', update);
+        update();
+    }
+
+    function initRespond(box, endowment) {
+        var offer = parseInt(box.dataset.offer, 10);
+        var radios = document.querySelectorAll('input[name="accepted_offer"]');
+        function update() {
+            var accepted = document.querySelector('input[name="accepted_offer"]:checked');
+            if (accepted && accepted.value === 'True') {
+                render(box, offer, endowment - offer);
+            } else {
+                box.style.display = 'none';
+            }
+        }
+        radios.forEach(function (radio) {
+            radio.addEventListener('change', update);
+        });
+        update();
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var box = document.getElementById('preview');
+        if (!box) {
+            return;
+        }
+        var endowment = parseInt(box.dataset.endowment, 10);
+        if (box.dataset.mode === 'respond') {
+            initRespond(box, endowment);
+        } else {
+            initPropose(box, endowment);
+        }
+    });
+})();
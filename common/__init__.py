@@ -0,0 +1,4 @@
+"""
+各 app 共用的工具模块（数据导出等）。
+本目录不是 oTree app，不需要加入 app_sequence。
+"""
@@ -0,0 +1,326 @@
+"""
+AI 对手的决策策略。
+
+各 human-AI app 默认调用 ChatGPT（'llm'）。压力测试和 bot 测试时可以用环境变量
+BARGAINING_AI_POLICY 切换成不需要网络的策略：
+    llm         调用 OpenAI（默认；没有 API key 时自动使用 fallback）
+    fallback    与 API 出错时相同的简单策略（随机提议 40-60，按阈值接受）
+    analytical  子博弈完美均衡（逆向归纳）的提议与接受规则
+    mock        走与 llm 相同的流程（prompt、解析、metrics），但由 MockLLMClient 回答：
+                等待 BARGAINING_MOCK_LLM_MS 毫秒（默认 800，模拟 API 延迟）后随机回答；
+                用于多进程部署的压力测试（见 common/cluster.py）
+
+LLM 的 prompt 与回答的解析也放在这里，各 app 和 common.simulate 使用相同的文本。
+"""
+import math
+import os
+import random
+import threading
+import time
+
+AI_POLICY_ENV = 'BARGAINING_AI_POLICY'
+AI_POLICIES = ('llm', 'fallback', 'analytical', 'mock')
+MOCK_LATENCY_ENV = 'BARGAINING_MOCK_LLM_MS'
+DEFAULT_MOCK_LATENCY_MS = 800
+
+ROLE_P1 = 'P1'
+ROLE_P2 = 'P2'
+
+# fallback 策略：各 stage 的接受阈值（折扣后点数）
+FALLBACK_THRESHOLDS = {1: 35, 2: 25, 3: 15}
+# fallback 策略：提议点数的范围（含两端）
+FALLBACK_OFFER_MIN = 40
+FALLBACK_OFFER_MAX = 60
+
+
+def get_ai_policy() -> str:
+    policy = os.environ.get(AI_POLICY_ENV, 'llm').strip().lower()
+    if policy not in AI_POLICIES:
+        print(f"[ai] Unknown {AI_POLICY_ENV}={policy!r}, using 'llm'")
+        return 'llm'
+    return policy
+
+
+def proposer_role(stage: int) -> str:
+    """stage 1 由 P1 提议，之后交替"""
+    return ROLE_P1 if stage % 2 == 1 else ROLE_P2
+
+
+def other_role(role: str) -> str:
+    return ROLE_P2 if role == ROLE_P1 else ROLE_P1
+
+
+# ----------------- fallback -----------------
+# 回应由 app 的 GAME 决定：GameParams.fallback_accept（common/game.py，使用 FALLBACK_THRESHOLDS）
+
+def fallback_offer(rng: random.Random = None) -> int:
+    """rng 为该决策的随机数流（common/rng.py）；None 时使用全局的 random"""
+    return (rng or random).randint(FALLBACK_OFFER_MIN, FALLBACK_OFFER_MAX)
+
+
+# ----------------- analytical -----------------
+
+def spe_offers(endowment: int, max_stage: int, get_discount_rate) -> dict:
+    """
+    逆向归纳得到每个 stage 的均衡提议（给回应者的点数）。
+
+    最后一个 stage 回应者拒绝则双方为 0，所以提议 0；之前的 stage 里，
+    回应者恰好是下一 stage 的提议者，只要当前折扣后的点数不低于
+    “拒绝后自己在下一 stage 保留的点数”的折扣值就会接受。
+    """
+    offers = {max_stage: 0}
+    for stage in range(max_stage - 1, 0, -1):
+        responder = other_role(proposer_role(stage))
+        keep_next = endowment - offers[stage + 1]
+        value_next = keep_next * get_discount_rate(stage + 1, responder)
+        offers[stage] = min(endowment, math.ceil(value_next / get_discount_rate(stage, responder) - 1e-9))
+    return offers
+
+
+def analytical_offer(stage: int, endowment: int, max_stage: int, get_discount_rate) -> int:
+    return spe_offers(endowment, max_stage, get_discount_rate)[stage]
+
+
+def analytical_accept(offer: int, stage: int, endowment: int, max_stage: int, get_discount_rate) -> bool:
+    return offer >= spe_offers(endowment, max_stage, get_discount_rate)[stage]
+
+
+# ----------------- llm -----------------
+
+LLM_MODEL = 'gpt-4o'
+PROPOSE_SYSTEM = "You are a strategic bargaining game AI. Respond only with a number."
+RESPOND_SYSTEM = "You are a strategic bargaining game AI. Respond only with ACCEPT or REJECT."
+
+
+def format_history_for_ai(history: list) -> str:
+    """将历史记录格式化为人类可读的文本"""
+    if not history:
+        return "No previous offers in this round."
+
+    lines = []
+    for entry in history:
+        status = "ACCEPTED" if entry['accepted'] else "REJECTED"
+        lines.append(f"Stage {entry['stage']}: {entry['proposer']} offered {entry['offer']} points → {status}")
+    return "\n".join(lines)
+
+
+def propose_prompt(game, stage: int, ai_role: str, history: list) -> str:
+    """AI 提议时的 prompt；game 为 common.game.GameParams"""
+    discount_rate = game.discount_rate(stage, ai_role)
+    opponent_discount = game.discount_rate(stage, other_role(ai_role))
+    history_text = format_history_for_ai(history)
+
+    return f"""You are the proposer in a {game.max_stage}-stage alternating-offers bargaining game over {game.endowment} points.
+Goal: maximize your own discounted payoff. Your opponent is human。
+
+- Total points to divide: {game.endowment}
+- Your role: {ai_role}
+- Current stage: {stage} out of {game.max_stage}
+- Your discount rate at this stage: {discount_rate}
+- Opponent's discount rate: {opponent_discount}
+
+Previous negotiation history in this round:
+{history_text}
+
+Rules:
+- You propose how many points to give to your opponent (0-{game.endowment})
+- You keep the remaining points
+- If the offer is rejected, the game moves to the next stage with higher discounts
+- If this is stage {game.max_stage}, this is the last chance to make a deal
+
+Based on the negotiation history and current situation, what points would you offer to your opponent? 
+Please respond with ONLY a number between 0 and {game.endowment}."""
+
+
+def respond_prompt(game, offer: int, stage: int, ai_role: str, history: list) -> str:
+    """AI 回应提议时的 prompt"""
+    discount_rate = game.discount_rate(stage, ai_role)
+    discounted_offer = offer * discount_rate
+    opponent_discount = game.discount_rate(stage, other_role(ai_role))
+    history_text = format_history_for_ai(history)
+
+    # 拒绝后下一阶段的折扣率
+    if stage < game.max_stage:
+        next_discount = game.discount_rate(stage + 1, ai_role)
+        next_stage_info = f"\n- If you reject, the game moves to stage {stage + 1}, where your discount rate would be {next_discount}"
+    else:
+        next_stage_info = f"\n- This is the FINAL stage. If you reject, both players get 0 points."
+
+    return f"""You are playing a {game.max_stage}-stage alternating-offers bargaining game. Here's the situation:
+
+- Total points: {game.endowment}
+- Your role: {ai_role}
+- Current stage: {stage} out of {game.max_stage}
+- Offer you received: {offer} points
+- Your discount rate: {discount_rate}
+- Opponent's discount rate: {opponent_discount}
+- Your discounted value if you accept: {discounted_offer:.2f} points{next_stage_info}
+
+Previous negotiation history in this round:
+{history_text}
+
+Should you ACCEPT or REJECT this offer? Consider:
+1. The discounted value you would receive now
+2. The risk of getting worse terms (or zero) if negotiations continue
+3. Strategic considerations based on the stage and negotiation history
+4. Whether the opponent is making concessions or becoming more aggressive
+
+Respond with ONLY one word: ACCEPT or REJECT"""
+
+
+def parse_offer(text: str, endowment: int) -> int:
+    """LLM 回答的提议点数，限制在 0..endowment；不是数字时抛出 ValueError"""
+    return max(0, min(endowment, int(text.strip())))
+
+
+def parse_decision(text: str) -> bool:
+    return "ACCEPT" in text.strip().upper()
+
+
+class MockLLMClient:
+    """
+    与 OpenAI 客户端相同的接口（client.chat.completions.create），不调用 API。
+    rng 为该决策的 mock_llm 随机数流（common/rng.py），同一个种子时回答相同；None 时不固定
+    """
+
+    def __init__(self, latency_ms: float = None, rng: random.Random = None):
+        if latency_ms is None:
+            latency_ms = float(os.environ.get(MOCK_LATENCY_ENV, DEFAULT_MOCK_LATENCY_MS))
+        self.latency_ms = latency_ms
+        self.rng = rng if rng is not None else random.Random()
+        self.chat = self
+        self.completions = self
+
+    def create(self, model: str, messages: list, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        if messages[0]['content'] == PROPOSE_SYSTEM:
+            content = str(self.rng.randint(20, 60))
+        else:
+            content = self.rng.choice(['ACCEPT', 'REJECT'])
+        message = type('Message', (), dict(content=content))
+        choice = type('Choice', (), dict(message=message))
+        return type('Response', (), dict(choices=[choice]))
+
+
+# ----------------- decisions -----------------
+# 各 app 的 ai_propose / ai_respond 与 AI worker（common/aiworker.py）共用
+
+# API key -> OpenAI 客户端。openai 第一次调用时才导入（不影响服务器启动），之后各次调用共用
+# 同一个客户端（及其 HTTP 连接池），不再每次调用重新建立
+_openai_clients = {}
+_openai_lock = threading.Lock()
+
+
+def get_llm_client(policy: str, mock_rng: random.Random = None):
+    """llm: OpenAI 客户端（没有 API key 时为 None）；mock: MockLLMClient（使用 mock_rng）；其他策略: None"""
+    if policy == 'mock':
+        return MockLLMClient(rng=mock_rng)
+    if policy != 'llm':
+        return None
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if api_key is None:
+        print("[OpenAI] Warning: OPENAI_API_KEY not set")
+        return None
+    client = _openai_clients.get(api_key)
+    if client is not None:
+        return client
+    with _openai_lock:
+        if api_key not in _openai_clients:
+            try:
+                from openai import OpenAI
+                _openai_clients[api_key] = OpenAI(api_key=api_key)
+            except Exception as e:
+                print(f"[OpenAI] Failed to initialize client: {e}")
+                return None
+        return _openai_clients[api_key]
+
+
+def record_ai_meta(meta: dict, source: str, started: float, error: Exception = None):
+    """记录 AI 决策来源（'llm' / 'mock' / 'fallback' / 'analytical'）与耗时（毫秒）；API 出错时记录错误类型"""
+    if meta is not None:
+        meta['source'] = source
+        meta['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if error is not None:
+            meta['error'] = type(error).__name__
+
+
+def decide_offer(game, stage: int, ai_role: str, history: list, meta: dict = None, policy: str = None,
+                 rng: random.Random = None, mock_rng: random.Random = None) -> int:
+    """
+    AI 提议给对方的点数；policy 默认为 BARGAINING_AI_POLICY，rng 用于 fallback 的提议，
+    mock_rng 用于 mock 策略的回答
+    """
+    started = time.perf_counter()
+    policy = policy or get_ai_policy()
+    if policy == 'analytical':
+        # 压力测试用：不调用 API，按子博弈完美均衡提议
+        offer = game.analytical_offer(stage)
+        record_ai_meta(meta, 'analytical', started)
+        return offer
+
+    client = get_llm_client(policy, mock_rng)
+    if client is None:
+        print(f"[ai_propose] OpenAI client not available, using fallback")
+        offer = fallback_offer(rng)
+        record_ai_meta(meta, 'fallback', started)
+        return offer
+
+    try:
+        response = client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": PROPOSE_SYSTEM},
+                {"role": "user", "content": propose_prompt(game, stage, ai_role, history)}
+            ],
+            temperature=1.0,
+            max_tokens=10
+        )
+        offer = parse_offer(response.choices[0].message.content, game.endowment)
+        print(f"[ai_propose] AI (Role={ai_role}, Stage={stage}) proposes: {offer}")
+        record_ai_meta(meta, policy, started)
+        return offer
+    except Exception as e:
+        print(f"[ai_propose] API Error: {e}")
+        offer = fallback_offer(rng)
+        print(f"[ai_propose] Using fallback offer: {offer}")
+        record_ai_meta(meta, 'fallback', started, error=e)
+        return offer
+
+
+def decide_accept(game, offer: int, stage: int, ai_role: str, history: list,
+                  meta: dict = None, policy: str = None, mock_rng: random.Random = None) -> bool:
+    """AI 是否接受 offer；mock_rng 用于 mock 策略的回答"""
+    started = time.perf_counter()
+    policy = policy or get_ai_policy()
+    if policy == 'analytical':
+        decision = game.analytical_accept(offer, stage)
+        record_ai_meta(meta, 'analytical', started)
+        return decision
+
+    client = get_llm_client(policy, mock_rng)
+    if client is None:
+        print(f"[ai_respond] OpenAI client not available, using fallback")
+        record_ai_meta(meta, 'fallback', started)
+        return game.fallback_accept(offer, stage, ai_role)
+
+    try:
+        response = client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": RESPOND_SYSTEM},
+                {"role": "user", "content": respond_prompt(game, offer, stage, ai_role, history)}
+            ],
+            temperature=1.0,
+            max_tokens=10
+        )
+        decision = parse_decision(response.choices[0].message.content)
+        print(f"[ai_respond] AI (Role={ai_role}, Stage={stage}) "
+              f"{'ACCEPTS' if decision else 'REJECTS'} offer of {offer}")
+        record_ai_meta(meta, policy, started)
+        return decision
+    except Exception as e:
+        print(f"[ai_respond] API Error: {e}")
+        decision = game.fallback_accept(offer, stage, ai_role)
+        print(f"[ai_respond] Using fallback decision: {'ACCEPT' if decision else 'REJECT'}")
+        record_ai_meta(meta, 'fallback', started, error=e)
+        return decision
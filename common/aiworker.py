@@ -0,0 +1,106 @@
+"""
+AI 决策 worker：从 common/jobs.py 的队列取出任务并执行（BARGAINING_AI_WORKER=1 时使用）。
+
+LLM 调用主要是等待网络，所以每个进程用多个线程同时处理任务；需要更多吞吐量时增加进程数，
+或在其他终端 / 机器上（共用同一个队列文件时）再启动 worker。
+worker 使用启动时的 OPENAI_API_KEY / BARGAINING_MOCK_LLM_MS；AI 策略由任务指定（服务器进程的
+BARGAINING_AI_POLICY）。
+
+用法:
+    python -m common.aiworker                         # 1 个进程 x 8 个线程
+    python -m common.aiworker --processes 4 --threads 16
+    python -m common.aiworker --exit-when-idle 5      # 队列空闲 5 秒后退出（压力测试用）
+    python -m common.aiworker --cleanup 7             # 删除 7 天前已结束的记录后退出
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from common import jobs
+
+DEFAULT_THREADS = 8
+DEFAULT_POLL_MS = 100
+
+
+def work(name: str, poll_seconds: float, idle_exit: float, counts: dict, lock: threading.Lock):
+    """一个线程：循环 取任务 → 决策 → 写回结果"""
+    idle_since = time.time()
+    while True:
+        job = jobs.claim(name)
+        if job is None:
+            if idle_exit and time.time() - idle_since > idle_exit:
+                return
+            time.sleep(poll_seconds)
+            continue
+        job_id, kind, payload = job
+        try:
+            jobs.complete(job_id, jobs.run_job(kind, payload))
+            outcome = 'done'
+        except Exception as e:
+            print(f'[aiworker] {name}: job {job_id} ({kind}) failed: {e!r}')
+            jobs.fail(job_id, type(e).__name__)
+            outcome = 'failed'
+        with lock:
+            counts[outcome] += 1
+        idle_since = time.time()
+
+
+def serve(process_index: int, threads: int, poll_seconds: float, idle_exit: float):
+    """一个 worker 进程"""
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    counts = dict(done=0, failed=0)
+    lock = threading.Lock()
+    pool = [threading.Thread(target=work, args=(f'{prefix}/{i}', poll_seconds, idle_exit, counts, lock),
+                             daemon=True)
+            for i in range(threads)]
+    for t in pool:
+        t.start()
+    try:
+        for t in pool:
+            t.join()
+    except KeyboardInterrupt:
+        pass
+    print(f"[aiworker] process {process_index} ({prefix}): {counts['done']} done, {counts['failed']} failed")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m common.aiworker')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='每个进程同时处理的任务数')
+    parser.add_argument('--poll-ms', type=float, default=DEFAULT_POLL_MS, help='队列为空时的轮询间隔（毫秒）')
+    parser.add_argument('--exit-when-idle', type=float, default=0, metavar='SECONDS',
+                        help='队列空闲这么多秒后退出（默认一直运行）')
+    parser.add_argument('--cleanup', type=float, metavar='DAYS',
+                        help='删除这么多天前已结束的记录后退出（不启动 worker）')
+    args = parser.parse_args(argv)
+
+    if args.cleanup is not None:
+        deleted = jobs.cleanup(args.cleanup)
+        print(f'[aiworker] deleted {deleted} finished jobs older than {args.cleanup:g} days from {jobs.jobs_path()}')
+        return
+
+    print(f'[aiworker] {args.processes} processes x {args.threads} threads, queue {jobs.jobs_path()}')
+    jobs.connection()  # 先建表，避免多个进程同时建表
+    recovered = jobs.recover()
+    if recovered:
+        print(f'[aiworker] requeued {recovered} jobs left running by exited processes on this host')
+    worker_args = (args.threads, args.poll_ms / 1000, args.exit_when_idle)
+    if args.processes == 1:
+        serve(0, *worker_args)
+        return
+    procs = [multiprocessing.Process(target=serve, args=(i, *worker_args)) for i in range(args.processes)]
+    for proc in procs:
+        proc.start()
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.join()
+
+
+if __name__ == '__main__':
+    main()
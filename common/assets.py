@@ -0,0 +1,35 @@
+"""
+_static 下的静态文件的 URL。
+
+URL 带上文件内容的 hash（?v=...），文件修改后 URL 随之改变，
+所以浏览器可以一直缓存，不会用到旧版本。hash 在第一次使用时计算一次并缓存。
+"""
+import hashlib
+import os
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(PROJECT_DIR, '_static')
+STATIC_URL = '/static/'
+
+_versions = {}
+
+
+def file_version(path: str) -> str:
+    """_static 下相对路径的文件内容 hash（前 10 位）"""
+    if path not in _versions:
+        with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+            _versions[path] = hashlib.sha1(f.read()).hexdigest()[:10]
+    return _versions[path]
+
+
+def static_url(path: str) -> str:
+    """带版本号的 URL，例如 /static/bargaining/preview.js?v=3f2a9c01de"""
+    return f'{STATIC_URL}{path}?v={file_version(path)}'
+
+
+def bargaining_preview() -> dict:
+    """提议 / 回应页面的预览脚本与样式（_static/bargaining），在 vars_for_template 中展开"""
+    return dict(
+        preview_css=static_url('bargaining/preview.css'),
+        preview_js=static_url('bargaining/preview.js'),
+    )
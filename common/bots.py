@@ -0,0 +1,133 @@
+"""
+bot 测试（tests.py）共用的工具。
+
+submit() 代替直接 yield 页面，记录每个页面提交的 HTTP 请求（POST 及其后的重定向，
+直到下一页面返回）所用的时间。只计这一个请求：oTree 的 bot runner 按 round-robin
+依次让各 bot 提交，从 yield 到 bot 下一次被调用之间还包括其他 bot 的请求与等待页面。
+设置环境变量 BOT_TIMINGS_PATH 时，进程结束前把所有记录写成 JSON，供 common.loadtest 汇总。
+
+play_bargaining() 按参与者实际所在的页面（bot 的当前 URL）决定下一个提交的页面。
+依赖 oTree 5 的命令行 bot（otree test，ParticipantBot 的 path / submit）。
+
+用法（tests.py 中）:
+    from common.bots import submit
+
+    class PlayerBot(Bot):
+        def play_round(self):
+            yield from submit(self, Start)
+            yield from submit(self, Bargain_Propose, dict(offer_points=40))
+"""
+import atexit
+import json
+import os
+import random
+import time
+from collections import defaultdict
+
+TIMINGS_ENV = 'BOT_TIMINGS_PATH'
+
+# 'app/Page' -> [秒, ...]
+TIMINGS = defaultdict(list)
+# 每位参与者在等待页面的累计等待时间（秒，见 common.progression）
+IDLE_SECONDS = []
+
+
+def page_key(page_class) -> str:
+    app_name = page_class.__module__.split('.')[0]
+    return f'{app_name}/{page_class.__name__}'
+
+
+def time_requests(participant_bot):
+    """包装 ParticipantBot.submit，按页面记录每次提交的请求耗时；每个 ParticipantBot 只包装一次"""
+    if participant_bot is None or getattr(participant_bot, 'timed_submit', False):
+        return
+    post = participant_bot.submit
+
+    def timed_submit(submission):
+        started = time.perf_counter()
+        post(submission)
+        TIMINGS[page_key(submission.page_class)].append(time.perf_counter() - started)
+
+    participant_bot.submit = timed_submit
+    participant_bot.timed_submit = True
+
+
+def submit(bot, page_class, data=None, **kwargs):
+    """提交一个页面（耗时由 time_requests 记录）；在 play_round 中用 yield from 调用"""
+    from otree.api import Submission
+
+    time_requests(getattr(bot, 'participant_bot', None))
+    yield Submission(page_class, data or {}, **kwargs)
+
+
+def current_page_name(bot) -> str:
+    """参与者当前所在页面的类名（URL 为 /p/<code>/<app>/<页面>/<index>）"""
+    return bot.participant_bot.path.rstrip('/').split('/')[-2]
+
+
+def bargaining_offer(rng=random) -> int:
+    """bot 作为提议者时给对方的点数"""
+    return rng.randint(10, 60)
+
+
+def bargaining_accept(offer: int, discount_rate: float, rng=random) -> bool:
+    """bot 作为回应者时：折扣后点数越高越容易接受，保证各 stage 都会被走到"""
+    return offer * discount_rate >= rng.randint(10, 50)
+
+
+def play_bargaining(bot, propose_pages: dict, respond_pages: dict, get_discount_rate, wait_pages: dict = None):
+    """
+    讨价还价的一轮：提交参与者当前所在的阶段页面，直到离开阶段页面（本轮结束）。
+    propose_pages / respond_pages 为 stage -> 页面类。
+    human-AI app 还传入 AI worker 的等待页面 wait_pages：等待页面显示时直接提交
+    （任务未完成时 app 用 fallback 决策，见 common/jobs.py）。
+    页面由 bot 的当前 URL 决定，而不是由 group 的状态推断：bot 被调用时 worker 可能已经
+    写回了 AI 的决策，group 的状态已经指向下一步，参与者却还在等待页面上。
+    回应页面已经显示时 AI 的提议已经写入 group（vars_for_template），此时读取 offer_points。
+    bot 的提议与回应使用 session 的 bots 随机数流（common/rng.py），同一个种子时各次运行相同。
+    """
+    from common import rng
+
+    pages = {}
+    for kind, by_stage in (('propose', propose_pages), ('respond', respond_pages), ('wait', wait_pages or {})):
+        for stage, page_class in by_stage.items():
+            pages[page_class.__name__] = (kind, stage, page_class)
+
+    app = type(bot.player).__module__.split('.')[0]
+    bot_rng = rng.stream(bot.session, 'bots', app, bot.participant.code, bot.round_number)
+    while current_page_name(bot) in pages:
+        kind, stage, page_class = pages[current_page_name(bot)]
+        if kind == 'wait':
+            yield from submit(bot, page_class)
+        elif kind == 'propose':
+            yield from submit(bot, page_class, dict(offer_points=bargaining_offer(bot_rng)))
+        else:
+            discount_rate = get_discount_rate(stage, bot.player.assigned_role)
+            accepted = bargaining_accept(bot.group.offer_points, discount_rate, bot_rng)
+            yield from submit(bot, page_class, dict(accepted_offer=accepted))
+
+
+def questionnaire_answers(form_fields, lexicon) -> dict:
+    """问卷：年龄填 30，其余选择题选第一个选项"""
+    answers = {}
+    for field in form_fields:
+        if field == 'age':
+            answers[field] = 30
+        else:
+            answers[field] = getattr(lexicon, f'q_{field}_opts')[0][0]
+    return answers
+
+
+def record_idle(bot):
+    IDLE_SECONDS.append(bot.participant.vars.get('idle_seconds', 0))
+
+
+def dump_timings(path: str = None):
+    path = path or os.environ.get(TIMINGS_ENV)
+    if not path or not TIMINGS:
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dict(pages=TIMINGS, idle_seconds=IDLE_SECONDS), f)
+
+
+atexit.register(dump_timings)
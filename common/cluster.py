@@ -0,0 +1,248 @@
+"""
+多进程部署：一台多核 Linux 机器上运行多个 oTree 服务器进程，前面用 nginx 转发。
+
+oTree 的等待页面和 websocket 通知都在进程内存中，同一个 session 的参与者必须由同一个进程处理，
+所以这里按 room 分配进程（而不是按请求轮流分配）：
+    main      管理页面、demo，以及没有 room 的请求
+    <room>    settings.ROOMS 中的每个 room 一个进程（pclab、virtual_Lab ...）
+访问 /room/<name>（参与者）或 /rooms/<name>、/room_without_session/<name>（实验者）时，nginx 把请求
+转发给该 room 的进程并设置 cookie bargaining_backend=<name>；之后该浏览器的所有请求
+（包括 websocket）都按 cookie 转发到同一个进程。实验者请从 /rooms/<name> 为该 room 创建 session；
+同时管理多个 room 时，每个 room 使用单独的浏览器（或无痕窗口）。
+
+所有进程共用 DATABASE_URL。SQLite 时子进程自动使用 BARGAINING_DB_PROFILE=sqlite-wal
+（见 common/db.py），大规模实验建议使用 PostgreSQL。
+--ai-workers N 时同时启动 N 个 AI worker 进程（common/aiworker.py），oTree 进程的 AI 决策
+都经过任务队列（BARGAINING_AI_WORKER=1，见 common/jobs.py）。
+
+用法:
+    python -m common.cluster config --listen 8000 > nginx.conf      # 只生成 nginx 配置
+    python -m common.cluster run --listen 8000 --base-port 8001      # 启动各进程（与 nginx）
+    python -m common.cluster run --ai-workers 2                      # 另外启动 2 个 AI worker 进程
+    python -m common.cluster loadtest --configs human_AI_bargaining1_demo human_AI_bargaining2_demo \\
+        --participants 40                                            # 各 config 在单独进程中同时运行 bot
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import db, jobs, loadtest
+
+MAIN_BACKEND = 'main'
+COOKIE_NAME = 'bargaining_backend'
+# 这些路径的第二段是 room 名
+ROOM_PATHS = ('room', 'rooms', 'room_without_session')
+DEFAULT_LISTEN = 8000
+DEFAULT_BASE_PORT = 8001
+
+
+def room_names() -> list:
+    sys.path.insert(0, loadtest.PROJECT_DIR)
+    import settings
+    return [room['name'] for room in getattr(settings, 'ROOMS', [])]
+
+
+def plan_backends(rooms: list, base_port: int) -> list:
+    """[(名称, 端口), ...]，main 在最前"""
+    names = [MAIN_BACKEND] + list(rooms)
+    return [(name, base_port + i) for i, name in enumerate(names)]
+
+
+def nginx_config(backends: list, listen: int, work_dir: str) -> str:
+    proxy = '''            proxy_http_version 1.1;
+            proxy_set_header Upgrade $http_upgrade;
+            proxy_set_header Connection $connection_upgrade;
+            proxy_set_header Host $http_host;
+            proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+            proxy_read_timeout 3600s;'''
+    upstreams = '\n'.join(f'    upstream {name} {{ server 127.0.0.1:{port}; }}' for name, port in backends)
+    cookie_map = '\n'.join(f'        {name} {name};' for name, _ in backends)
+    paths = '|'.join(ROOM_PATHS)
+    room_locations = '\n'.join(f'''        location ~ ^/({paths})/{name}(/|$) {{
+            add_header Set-Cookie "{COOKIE_NAME}={name}; Path=/; SameSite=Lax" always;
+            proxy_pass http://{name};
+{proxy}
+        }}''' for name, _ in backends if name != MAIN_BACKEND)
+
+    return f'''# python -m common.cluster config 生成；nginx -c <本文件> -g 'daemon off;'
+worker_processes auto;
+pid {work_dir}/nginx.pid;
+error_log stderr warn;
+events {{ worker_connections 4096; }}
+
+http {{
+    access_log off;
+    client_body_temp_path {work_dir}/client_body;
+    proxy_temp_path {work_dir}/proxy;
+    fastcgi_temp_path {work_dir}/fastcgi;
+    uwsgi_temp_path {work_dir}/uwsgi;
+    scgi_temp_path {work_dir}/scgi;
+
+{upstreams}
+
+    map $cookie_{COOKIE_NAME} $bargaining_backend {{
+        default {MAIN_BACKEND};
+{cookie_map}
+    }}
+    map $http_upgrade $connection_upgrade {{
+        default upgrade;
+        '' close;
+    }}
+
+    server {{
+        listen {listen};
+
+{room_locations}
+
+        location / {{
+            proxy_pass http://$bargaining_backend;
+{proxy}
+        }}
+    }}
+}}
+'''
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    if db.get_database_url().startswith('sqlite') and db.get_db_profile() != 'sqlite-wal':
+        print(f'[cluster] SQLite shared by several processes: using {db.DB_PROFILE_ENV}=sqlite-wal')
+        env[db.DB_PROFILE_ENV] = 'sqlite-wal'
+    return env
+
+
+def wait_for_port(port: int, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def run(args):
+    rooms = args.rooms if args.rooms is not None else room_names()
+    backends = plan_backends(rooms, args.base_port)
+    env = child_env()
+    if args.ai_workers:
+        env[jobs.WORKER_ENV] = '1'
+    procs = []
+
+    def stop(*_):
+        for _, proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    work_dir = tempfile.mkdtemp(prefix='bargaining-cluster-')
+    try:
+        # main 先启动（首次启动时建表），其余进程在 main 可以连接后再启动
+        for name, port in backends:
+            print(f'[cluster] {name}: otree prodserver {port}')
+            proc = subprocess.Popen([args.otree, 'prodserver', str(port)], cwd=loadtest.PROJECT_DIR, env=env)
+            procs.append((name, proc))
+            if name == MAIN_BACKEND and not wait_for_port(port, args.startup_timeout):
+                raise SystemExit(f'[cluster] main 进程 {args.startup_timeout}s 内没有启动')
+
+        if args.ai_workers:
+            print(f'[cluster] ai workers: {args.ai_workers} processes')
+            procs.append(('aiworker', subprocess.Popen(
+                [sys.executable, '-m', 'common.aiworker', '--processes', str(args.ai_workers)],
+                cwd=loadtest.PROJECT_DIR, env=env)))
+
+        if args.nginx:
+            config_path = os.path.join(work_dir, 'nginx.conf')
+            with open(config_path, 'w', encoding='utf-8') as f:
+                f.write(nginx_config(backends, args.listen, work_dir))
+            print(f'[cluster] nginx :{args.listen} ({config_path})')
+            procs.append(('nginx', subprocess.Popen([args.nginx, '-c', config_path, '-g', 'daemon off;'])))
+
+        # 任何一个进程退出时结束全部
+        while all(proc.poll() is None for _, proc in procs):
+            time.sleep(1)
+        for name, proc in procs:
+            if proc.poll() is not None:
+                print(f'[cluster] {name} exited with {proc.returncode}')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop()
+        for _, proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_loadtest(args):
+    """
+    每个 session config 在单独的 `otree test` 进程中同时运行（相当于每个 room 一个服务器进程），
+    AI 使用 mock 策略（模拟 API 延迟）。与依次运行的总时间比较，确认多核下的扩展。
+    """
+    configs = loadtest.load_session_configs()
+    runs = [(name, loadtest.participant_count(configs[name], args.participants)) for name in args.configs]
+    os.environ.update(child_env())
+
+    def one(item):
+        name, n = item
+        return loadtest.run_one(name, n, args.ai_policy, args.otree, args.timeout)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(runs)) as pool:
+        results = list(pool.map(one, runs))
+    parallel_seconds = time.perf_counter() - started
+
+    for result in results:
+        loadtest.print_result(result)
+    sequential_seconds = sum(r['wall_seconds'] for r in results)
+    print(f'\n[cluster] {len(results)} processes in parallel: {parallel_seconds:.1f}s '
+          f'(sum of per-process wall times {sequential_seconds:.1f}s, speedup {sequential_seconds / parallel_seconds:.2f}x)')
+    if not all(r['ok'] for r in results):
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m common.cluster')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('config', 'run'):
+        p = sub.add_parser(name)
+        p.add_argument('--rooms', nargs='*', default=None, help='单独进程的 room（默认 settings.ROOMS 的全部）')
+        p.add_argument('--listen', type=int, default=DEFAULT_LISTEN, help='nginx 的端口')
+        p.add_argument('--base-port', type=int, default=DEFAULT_BASE_PORT, help='oTree 进程的起始端口')
+    run_parser = sub.choices['run']
+    run_parser.add_argument('--otree', default='otree', help='otree 命令')
+    run_parser.add_argument('--nginx', default=shutil.which('nginx'), help='nginx 命令（没有时只启动 oTree 进程）')
+    run_parser.add_argument('--startup-timeout', type=int, default=60)
+    run_parser.add_argument('--ai-workers', type=int, default=0,
+                            help='AI worker 进程数（0 时 AI 决策在 oTree 进程中进行）')
+
+    lt = sub.add_parser('loadtest')
+    lt.add_argument('--configs', nargs='+', required=True, help='同时运行的 session config（每个一个进程）')
+    lt.add_argument('--participants', type=int, default=40)
+    lt.add_argument('--ai-policy', default='mock', choices=['mock', 'fallback', 'analytical'])
+    lt.add_argument('--otree', default='otree', help='otree 命令')
+    lt.add_argument('--timeout', type=int, default=1800, help='每个进程的超时（秒）')
+    args = parser.parse_args(argv)
+
+    if args.command == 'config':
+        rooms = args.rooms if args.rooms is not None else room_names()
+        print(nginx_config(plan_backends(rooms, args.base_port), args.listen, '/tmp/bargaining-nginx'))
+    elif args.command == 'run':
+        run(args)
+    else:
+        run_loadtest(args)
+
+
+if __name__ == '__main__':
+    main()
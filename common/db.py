@@ -0,0 +1,160 @@
+"""
+直接连接 oTree 数据库（不经过 ORM），供导出等命令行工具使用；
+以及 oTree 服务器的数据库配置（profile）。
+
+连接地址与 oTree 相同：优先读取环境变量 DATABASE_URL，
+未设置时使用项目根目录下的 db.sqlite3。
+
+数据库 profile（环境变量 BARGAINING_DB_PROFILE，settings.py 启动时调用 install_db_profile()）：
+    default     不做任何设置（oTree 的默认行为）
+    sqlite-wal  小规模实验室：SQLite 使用 WAL（读不阻塞写）、busy_timeout（写锁冲突时等待
+                而不是立即报错）和 synchronous=NORMAL（WAL 下每次 commit 不再 fsync，
+                进程崩溃不丢数据，断电时可能丢失最后几个事务）
+    postgres    大规模实验：DATABASE_URL 必须是 PostgreSQL；连接池由 oTree 的 SQLAlchemy
+                engine 管理，多个进程（服务器、导出等）共用时建议把 DATABASE_URL 指向
+                PgBouncer（transaction 模式）。每个连接设置 idle_in_transaction_session_timeout，
+                避免异常中断的事务一直占用连接
+各 profile 的页面提交吞吐量可以用 python -m common.dbbench 比较。
+"""
+import os
+import sqlite3
+
+DEFAULT_DATABASE_URL = 'sqlite:///db.sqlite3'
+
+DB_PROFILE_ENV = 'BARGAINING_DB_PROFILE'
+DB_PROFILES = ('default', 'sqlite-wal', 'postgres')
+SQLITE_BUSY_TIMEOUT_MS = 10000
+SQLITE_WAL_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}',
+    'PRAGMA temp_store=MEMORY',
+]
+POSTGRES_SESSION_SETTINGS = [
+    "SET idle_in_transaction_session_timeout = '60s'",
+]
+
+
+def get_database_url(url: str = None) -> str:
+    """返回要连接的数据库地址"""
+    return url or os.environ.get('DATABASE_URL') or DEFAULT_DATABASE_URL
+
+
+def is_postgres(url: str) -> bool:
+    return url.startswith(('postgres://', 'postgresql://'))
+
+
+def sqlite_path(url: str) -> str:
+    return url.split(':///', 1)[1] if ':///' in url else 'db.sqlite3'
+
+
+def get_db_profile() -> str:
+    profile = os.environ.get(DB_PROFILE_ENV, 'default').strip().lower()
+    if profile not in DB_PROFILES:
+        print(f"[db] Unknown {DB_PROFILE_ENV}={profile!r}, using 'default'")
+        return 'default'
+    return profile
+
+
+def configure_connection(dbapi_conn, profile: str = None):
+    """对一个新的 DBAPI 连接执行 profile 的设置（sqlite3 或 psycopg2 连接）"""
+    profile = profile or get_db_profile()
+    if isinstance(dbapi_conn, sqlite3.Connection):
+        statements = SQLITE_WAL_PRAGMAS if profile == 'sqlite-wal' else []
+    else:
+        statements = POSTGRES_SESSION_SETTINGS if profile == 'postgres' else []
+    if not statements:
+        return
+    cursor = dbapi_conn.cursor()
+    for statement in statements:
+        cursor.execute(statement)
+    cursor.close()
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        dbapi_conn.commit()
+
+
+def install_db_profile():
+    """
+    在 settings.py 中调用：按 BARGAINING_DB_PROFILE 给 oTree 的 SQLAlchemy engine 的每个新连接
+    执行 configure_connection。监听的是 Engine 类，所以对 oTree 之后创建的 engine 同样有效。
+    """
+    profile = get_db_profile()
+    if profile == 'default':
+        return
+    url = get_database_url()
+    if profile == 'postgres' and not is_postgres(url):
+        raise SystemExit(f'{DB_PROFILE_ENV}=postgres 需要 PostgreSQL 的 DATABASE_URL')
+    if profile == 'sqlite-wal' and not url.startswith('sqlite'):
+        raise SystemExit(f'{DB_PROFILE_ENV}=sqlite-wal 需要 SQLite 的 DATABASE_URL')
+    try:
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+    except ImportError:
+        print(f'[db] SQLAlchemy not available, {DB_PROFILE_ENV}={profile} ignored')
+        return
+    if not event.contains(Engine, 'connect', _on_engine_connect):
+        event.listen(Engine, 'connect', _on_engine_connect)
+    print(f'[db] Database profile: {profile}')
+
+
+def _on_engine_connect(dbapi_conn, connection_record):
+    configure_connection(dbapi_conn)
+
+
+def connect(url: str = None):
+    """打开数据库连接（sqlite3 或 psycopg2），并执行当前 profile 的设置"""
+    url = get_database_url(url)
+    if url.startswith('sqlite'):
+        conn = sqlite3.connect(sqlite_path(url))
+        configure_connection(conn)
+        return conn
+    if is_postgres(url):
+        try:
+            import psycopg2
+        except ImportError:
+            raise SystemExit('PostgreSQL 需要 psycopg2: pip install psycopg2-binary')
+        conn = psycopg2.connect(url)
+        configure_connection(conn)
+        return conn
+    raise ValueError(f'不支持的 DATABASE_URL: {url}')
+
+
+def sql(conn, query: str) -> str:
+    """把 '?' 占位符转换成当前驱动的格式"""
+    if isinstance(conn, sqlite3.Connection):
+        return query
+    return query.replace('?', '%s')
+
+
+def iter_rows(conn, query: str, params=(), chunk_size: int = 1000):
+    """
+    分批读取查询结果，内存占用只与 chunk_size 有关。
+    PostgreSQL 使用服务端游标，避免一次性把结果集拉到客户端。
+    """
+    if isinstance(conn, sqlite3.Connection):
+        cursor = conn.cursor()
+    else:
+        cursor = conn.cursor(name='otree_export_cursor')
+        cursor.itersize = chunk_size
+    cursor.execute(sql(conn, query), params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        cursor.close()
+
+
+def table_exists(conn, table: str) -> bool:
+    if isinstance(conn, sqlite3.Connection):
+        query = "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?"
+    else:
+        query = "SELECT 1 FROM information_schema.tables WHERE table_name=?"
+    cursor = conn.cursor()
+    cursor.execute(sql(conn, query), (table,))
+    found = cursor.fetchone() is not None
+    cursor.close()
+    return found
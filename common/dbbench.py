@@ -0,0 +1,222 @@
+"""
+数据库 profile 的页面提交吞吐量测试（见 common/db.py 的 BARGAINING_DB_PROFILE）。
+
+模拟 oTree 的页面提交：每个参与者一个线程，每次提交在一个事务中读取 participant 与 player、
+更新 player 的字段和 participant 的页面位置后 commit；同时有若干线程反复执行
+FinalResults 那样的跨参与者读取。报告每个 profile 的提交次数/秒、提交延迟（mean / p50 / p95 / max）、
+出错次数（例如 database is locked）和读取次数/秒。
+
+SQLite 的 profile 使用临时目录中的新数据库；postgres 在 --postgres-url（或 DATABASE_URL）
+指向的数据库中建立 dbbench_ 开头的表，结束后删除。
+
+用法:
+    python -m common.dbbench
+    python -m common.dbbench --writers 40 --submits 100 --readers 2
+    python -m common.dbbench --profiles default sqlite-wal postgres --postgres-url postgresql://...
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from common import db
+from common.loadtest import summarize
+
+ROUNDS = 10
+
+SCHEMA = [
+    'CREATE TABLE dbbench_participant (id INTEGER PRIMARY KEY, code VARCHAR(16), '
+    '_index_in_pages INTEGER, vars TEXT)',
+    'CREATE TABLE dbbench_player (id INTEGER PRIMARY KEY, participant_id INTEGER, round_number INTEGER, '
+    'offer_points INTEGER, accepted_offer BOOLEAN, payoff REAL)',
+    'CREATE INDEX dbbench_player_participant ON dbbench_player (participant_id, round_number)',
+]
+DROP = ['DROP TABLE IF EXISTS dbbench_player', 'DROP TABLE IF EXISTS dbbench_participant']
+
+SUBMIT_QUERIES = [
+    'SELECT id, code, _index_in_pages, vars FROM dbbench_participant WHERE id = ?',
+    'SELECT id, offer_points, accepted_offer, payoff FROM dbbench_player WHERE participant_id = ? AND round_number = ?',
+    'UPDATE dbbench_player SET offer_points = ?, accepted_offer = ?, payoff = ? WHERE participant_id = ? AND round_number = ?',
+    'UPDATE dbbench_participant SET _index_in_pages = _index_in_pages + 1 WHERE id = ?',
+]
+# FinalResults：读取所有参与者各轮的报酬
+READ_QUERY = 'SELECT participant_id, SUM(payoff) FROM dbbench_player GROUP BY participant_id'
+
+
+def open_connection(url: str, profile: str):
+    """打开连接并执行 profile 的设置；SQLite 使用与 oTree（pysqlite）相同的默认超时"""
+    if url.startswith('sqlite'):
+        conn = sqlite3.connect(db.sqlite_path(url), check_same_thread=False)
+    else:
+        try:
+            import psycopg2
+        except ImportError:
+            raise SystemExit('PostgreSQL 需要 psycopg2: pip install psycopg2-binary')
+        conn = psycopg2.connect(url)
+    db.configure_connection(conn, profile)
+    return conn
+
+
+def execute_all(conn, statements: list):
+    cursor = conn.cursor()
+    for statement in statements:
+        cursor.execute(statement)
+    cursor.close()
+    conn.commit()
+
+
+def setup(url: str, profile: str, writers: int):
+    conn = open_connection(url, profile)
+    execute_all(conn, DROP + SCHEMA)
+    cursor = conn.cursor()
+    for pid in range(1, writers + 1):
+        cursor.execute(db.sql(conn, 'INSERT INTO dbbench_participant VALUES (?, ?, 0, ?)'),
+                       (pid, f'p{pid:05d}', json.dumps({'treatment': 'T1'})))
+        for round_number in range(1, ROUNDS + 1):
+            cursor.execute(db.sql(conn, 'INSERT INTO dbbench_player VALUES (?, ?, ?, NULL, NULL, 0)'),
+                           ((pid - 1) * ROUNDS + round_number, pid, round_number))
+    cursor.close()
+    conn.commit()
+    conn.close()
+
+
+def submit(conn, pid: int, round_number: int):
+    """一次页面提交（一个事务）"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(db.sql(conn, SUBMIT_QUERIES[0]), (pid,))
+        cursor.fetchone()
+        cursor.execute(db.sql(conn, SUBMIT_QUERIES[1]), (pid, round_number))
+        cursor.fetchone()
+        offer = random.randint(0, 100)
+        cursor.execute(db.sql(conn, SUBMIT_QUERIES[2]), (offer, offer >= 40, 100 - offer, pid, round_number))
+        cursor.execute(db.sql(conn, SUBMIT_QUERIES[3]), (pid,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def writer(url: str, profile: str, pid: int, submits: int, think_seconds: float, latencies: list, errors: list):
+    conn = open_connection(url, profile)
+    try:
+        for i in range(submits):
+            started = time.perf_counter()
+            try:
+                submit(conn, pid, i % ROUNDS + 1)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(type(e).__name__)
+            if think_seconds:
+                time.sleep(think_seconds)
+    finally:
+        conn.close()
+
+
+def reader(url: str, profile: str, stop: threading.Event, reads: list, errors: list):
+    conn = open_connection(url, profile)
+    try:
+        while not stop.is_set():
+            cursor = conn.cursor()
+            try:
+                cursor.execute(READ_QUERY)
+                cursor.fetchall()
+                conn.commit()
+                reads.append(1)
+            except Exception as e:
+                conn.rollback()
+                errors.append(type(e).__name__)
+            finally:
+                cursor.close()
+    finally:
+        conn.close()
+
+
+def run_profile(profile: str, url: str, writers: int, submits: int, readers: int, think_seconds: float) -> dict:
+    setup(url, profile, writers)
+    latencies, errors, reads, read_errors = [], [], [], []
+    stop = threading.Event()
+    reader_threads = [threading.Thread(target=reader, args=(url, profile, stop, reads, read_errors))
+                      for _ in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(url, profile, pid, submits, think_seconds,
+                                                            latencies, errors))
+                      for pid in range(1, writers + 1)]
+
+    for t in reader_threads:
+        t.start()
+    started = time.perf_counter()
+    for t in writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    seconds = time.perf_counter() - started
+    stop.set()
+    for t in reader_threads:
+        t.join()
+
+    if not url.startswith('sqlite'):
+        execute_all(open_connection(url, profile), DROP)
+
+    return dict(
+        profile=profile,
+        writers=writers,
+        readers=readers,
+        seconds=round(seconds, 2),
+        submits_per_second=round(len(latencies) / seconds, 1),
+        reads_per_second=round(len(reads) / seconds, 1),
+        errors=len(errors) + len(read_errors),
+        error_types=sorted(set(errors + read_errors)),
+        latency=summarize(latencies) if latencies else None,
+    )
+
+
+def print_results(results: list):
+    print(f"\n{'profile':<12}{'submit/s':>10}{'read/s':>10}{'errors':>8}"
+          f"{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for r in results:
+        s = r['latency'] or dict(mean_ms='-', p50_ms='-', p95_ms='-', max_ms='-')
+        print(f"{r['profile']:<12}{r['submits_per_second']:>10}{r['reads_per_second']:>10}{r['errors']:>8}"
+              f"{s['mean_ms']:>10}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['max_ms']:>10}")
+        if r['error_types']:
+            print(f"{'':<12}errors: {', '.join(r['error_types'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m common.dbbench')
+    parser.add_argument('--profiles', nargs='+', choices=db.DB_PROFILES, default=['default', 'sqlite-wal'])
+    parser.add_argument('--writers', type=int, default=40, help='同时提交页面的参与者数')
+    parser.add_argument('--submits', type=int, default=50, help='每个参与者的提交次数')
+    parser.add_argument('--readers', type=int, default=2, help='同时执行跨参与者读取的线程数')
+    parser.add_argument('--think-ms', type=float, default=0, help='每次提交之间的间隔（毫秒）')
+    parser.add_argument('--postgres-url', default=None, help='postgres profile 使用的数据库（默认 DATABASE_URL）')
+    parser.add_argument('--report', default=None, help='把结果写成 JSON')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in args.profiles:
+            if profile == 'postgres':
+                url = args.postgres_url or db.get_database_url()
+                if not db.is_postgres(url):
+                    raise SystemExit('postgres profile 需要 --postgres-url 或 PostgreSQL 的 DATABASE_URL')
+            else:
+                url = f"sqlite:///{os.path.join(tmp, f'{profile}.sqlite3')}"
+            print(f'[dbbench] {profile}: {args.writers} writers x {args.submits} submits, {args.readers} readers ...')
+            results.append(run_profile(profile, url, args.writers, args.submits, args.readers,
+                                       args.think_ms / 1000))
+    print_results(results)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f'\n[dbbench] 结果已写入 {args.report}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""
+长格式（每个 offer 一行）的讨价还价数据导出。
+
+oTree 自带的导出是宽表，逐阶段分析时需要手动拼接 human_human 与
+human_AI_bargaining1/2 的数据。这里直接读取数据库，按 chunk 流式写出
+CSV 或 Parquet，内存占用与数据库中的 session 数量无关。
+
+用法:
+    python -m common.export offers --out offers.csv
+    python -m common.export offers --format parquet --out offers.parquet
+    python -m common.export incremental --out-dir exports
+"""
+import argparse
+import csv
+import importlib
+import json
+import sys
+
+from common import db, game
+
+# app 名 -> 对局类型（'pair' = 两名人类；'ai' = 人类 vs AI，历史记录在 history_json）
+BARGAINING_APPS = {
+    'human_human': 'pair',
+    'human_AI_bargaining1': 'ai',
+    'human_AI_bargaining2': 'ai',
+    'human_human_Practice': 'pair',
+    'human_AI_bargaining_Practice': 'ai',
+}
+DEFAULT_APPS = ['human_human', 'human_AI_bargaining1', 'human_AI_bargaining2']
+
+OFFER_COLUMNS = [
+    'session_code',
+    'app_name',
+    'round_number',
+    'group_id',
+    'stage',
+    'proposer_role',
+    'proposer_type',  # human / ai
+    'proposer_participant_code',
+    'proposer_label',
+    'responder_participant_code',
+    'responder_label',
+    'offer',
+    'accepted',
+    'p1_payoff',  # 该 offer 结束本轮时的折扣后点数；本轮继续时为空
+    'p2_payoff',
+    'ai_source',  # llm / fallback / analytical；没有 AI 参与时为空
+    'ai_latency_ms',
+]
+
+
+def app_game(app: str) -> game.GameParams:
+    """用 app 的 C 建立的 GameParams（与 app 中的 GAME 相同）；第一次调用时导入该 app"""
+    from common.startup import PROJECT_DIR
+
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    return game.GameParams.from_constants(importlib.import_module(app).C)
+
+
+def settle(game_params: game.GameParams, stage: int, proposer: str, offer: int, accepted: bool):
+    """返回该 offer 结束本轮时 (p1_payoff, p2_payoff)；本轮继续时返回 (None, None)"""
+    if accepted:
+        _, _, p1_payoff, p2_payoff = game_params.settle(stage, proposer, offer, True)
+        return round(p1_payoff, 4), round(p2_payoff, 4)
+    if stage >= game_params.max_stage:
+        return 0.0, 0.0
+    return None, None
+
+
+def session_filter(session_codes, alias: str = 's', finished_only: bool = False):
+    """
+    返回 WHERE 子句与参数。
+    session_codes 为 None 时不限定 session；finished_only 时只取已结束的对局（g.finished）。
+    """
+    conditions, params = [], []
+    if session_codes is not None:
+        session_codes = list(session_codes)
+        if not session_codes:
+            return 'WHERE 1 = 0', ()
+        placeholders = ', '.join('?' for _ in session_codes)
+        conditions.append(f'{alias}.code IN ({placeholders})')
+        params.extend(session_codes)
+    if finished_only:
+        conditions.append('g.finished = ?')
+        params.append(True)
+    if not conditions:
+        return '', ()
+    return 'WHERE ' + ' AND '.join(conditions), tuple(params)
+
+
+def _ai_offer_rows(conn, app: str, chunk_size: int, session_codes=None, finished_only=False):
+    """人类 vs AI：每个 group 只有一名玩家，offer 来自 history_json"""
+    game_params = app_game(app)
+    where, params = session_filter(session_codes, finished_only=finished_only)
+    query = f'''
+        SELECT s.code, pt.code, pt.label, pl.round_number, g.id,
+               pl.assigned_role, g.history_json
+        FROM "{app}_player" pl
+        JOIN "{app}_group" g ON pl.group_id = g.id
+        JOIN otree_participant pt ON pl.participant_id = pt.id
+        JOIN otree_session s ON pl.session_id = s.id
+        {where}
+        ORDER BY s.id, pl.round_number, g.id
+    '''
+    for session_code, code, label, round_number, group_id, human_role, history_json in \
+            db.iter_rows(conn, query, params, chunk_size=chunk_size):
+        try:
+            history = json.loads(history_json) if history_json else []
+        except ValueError:
+            history = []
+        for entry in history:
+            human_proposed = entry['proposer'] == human_role
+            accepted = bool(entry['accepted'])
+            p1_payoff, p2_payoff = settle(game_params, entry['stage'], entry['proposer'], entry['offer'], accepted)
+            yield [
+                session_code, app, round_number, group_id, entry['stage'],
+                entry['proposer'], 'human' if human_proposed else 'ai',
+                code if human_proposed else '', label if human_proposed else '',
+                '' if human_proposed else code, '' if human_proposed else label,
+                entry['offer'], accepted, p1_payoff, p2_payoff,
+                entry.get('ai_source') or '', entry.get('ai_latency_ms'),
+            ]
+
+
+def _pair_offer_rows(conn, app: str, chunk_size: int, session_codes=None, finished_only=False):
+    """人类 vs 人类：按 group 聚合两名玩家，offer 来自 stage_N_offer / stage_N_accepted"""
+    game_params = app_game(app)
+    where, params = session_filter(session_codes, finished_only=finished_only)
+    stage_columns = ', '.join(
+        f'pl.stage_{n}_offer, pl.stage_{n}_accepted' for n in range(1, game_params.max_stage + 1)
+    )
+    query = f'''
+        SELECT s.code, pt.code, pt.label, pl.round_number, g.id,
+               g.stage, g.accepted, pl.assigned_role, {stage_columns}
+        FROM "{app}_player" pl
+        JOIN "{app}_group" g ON pl.group_id = g.id
+        JOIN otree_participant pt ON pl.participant_id = pt.id
+        JOIN otree_session s ON pl.session_id = s.id
+        {where}
+        ORDER BY s.id, pl.round_number, g.id, pl.id_in_group
+    '''
+    group_rows = []
+    for row in db.iter_rows(conn, query, params, chunk_size=chunk_size):
+        if group_rows and group_rows[0][4] != row[4]:
+            yield from _pair_group_to_offers(app, game_params, group_rows)
+            group_rows = []
+        group_rows.append(row)
+    if group_rows:
+        yield from _pair_group_to_offers(app, game_params, group_rows)
+
+
+def _pair_group_to_offers(app: str, game_params: game.GameParams, group_rows: list):
+    by_role = {row[7]: row for row in group_rows}
+    first = group_rows[0]
+    session_code, round_number, group_id, final_stage, group_accepted = \
+        first[0], first[3], first[4], first[5], bool(first[6])
+    for stage in range(1, game_params.max_stage + 1):
+        proposer = 'P1' if stage % 2 == 1 else 'P2'
+        responder = 'P2' if proposer == 'P1' else 'P1'
+        proposer_row, responder_row = by_role.get(proposer), by_role.get(responder)
+        if proposer_row is None or responder_row is None:
+            break
+        offer = proposer_row[8 + 2 * (stage - 1)]
+        if offer is None:
+            break
+        accepted = responder_row[9 + 2 * (stage - 1)]
+        if accepted is None:
+            # 超时时回应不会写入 stage_N_accepted，按 group 的最终结果补全
+            accepted = group_accepted and final_stage == stage
+        accepted = bool(accepted)
+        p1_payoff, p2_payoff = settle(game_params, stage, proposer, offer, accepted)
+        yield [
+            session_code, app, round_number, group_id, stage,
+            proposer, 'human',
+            proposer_row[1], proposer_row[2], responder_row[1], responder_row[2],
+            offer, accepted, p1_payoff, p2_payoff, '', None,
+        ]
+        if accepted:
+            break
+
+
+def iter_offer_rows(conn, apps=None, chunk_size: int = 1000, session_codes=None, finished_only=False):
+    """
+    按 app 依次产出长格式 offer 行（list，顺序与 OFFER_COLUMNS 一致）。
+    session_codes 不为 None 时只读取这些 session；
+    finished_only 时跳过仍在进行中的对局（增量导出用，保证已写出的行不会再变化）。
+    """
+    for app in apps or DEFAULT_APPS:
+        if app not in BARGAINING_APPS:
+            raise ValueError(f'未知的讨价还价 app: {app}')
+        if not db.table_exists(conn, f'{app}_player'):
+            print(f'[export] 跳过 {app}：数据库中没有该 app 的数据表', file=sys.stderr)
+            continue
+        if BARGAINING_APPS[app] == 'ai':
+            yield from _ai_offer_rows(conn, app, chunk_size, session_codes, finished_only)
+        else:
+            yield from _pair_offer_rows(conn, app, chunk_size, session_codes, finished_only)
+
+
+def chunked(rows, chunk_size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_csv(rows, out_path: str, chunk_size: int, columns=OFFER_COLUMNS) -> int:
+    count = 0
+    with open(out_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in chunked(rows, chunk_size):
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+
+def write_parquet(rows, out_path: str, chunk_size: int) -> int:
+    """每个 chunk 写成一个 row group"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit('Parquet 导出需要 pyarrow: pip install pyarrow')
+
+    schema = pa.schema([
+        ('session_code', pa.string()),
+        ('app_name', pa.string()),
+        ('round_number', pa.int32()),
+        ('group_id', pa.int64()),
+        ('stage', pa.int32()),
+        ('proposer_role', pa.string()),
+        ('proposer_type', pa.string()),
+        ('proposer_participant_code', pa.string()),
+        ('proposer_label', pa.string()),
+        ('responder_participant_code', pa.string()),
+        ('responder_label', pa.string()),
+        ('offer', pa.int32()),
+        ('accepted', pa.bool_()),
+        ('p1_payoff', pa.float64()),
+        ('p2_payoff', pa.float64()),
+        ('ai_source', pa.string()),
+        ('ai_latency_ms', pa.float64()),
+    ])
+    count = 0
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for chunk in chunked(rows, chunk_size):
+            columns = list(zip(*chunk))
+            table = pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema,
+            )
+            writer.write_table(table)
+            count += len(chunk)
+    return count
+
+
+def main(argv=None):
+    from common import incremental as incremental_export
+
+    parser = argparse.ArgumentParser(prog='python -m common.export')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    offers = sub.add_parser('offers', help='每个 offer 一行的长格式数据')
+    offers.add_argument('--out', required=True)
+    offers.add_argument('--format', choices=['csv', 'parquet'], default=None,
+                        help='默认根据 --out 的扩展名判断')
+    offers.add_argument('--apps', nargs='+', default=DEFAULT_APPS, choices=sorted(BARGAINING_APPS))
+    offers.add_argument('--chunk-size', type=int, default=5000)
+    offers.add_argument('--database-url', default=None)
+
+    incremental = sub.add_parser('incremental', help='只重新导出上次导出之后新增/变化的 session')
+    incremental.add_argument('--out-dir', required=True)
+    incremental.add_argument('--targets', nargs='+', default=None, choices=sorted(incremental_export.TARGETS),
+                             help='offers / FinalResults / questionnaireT1 ... （默认全部）')
+    incremental.add_argument('--state', default=None, help='状态文件路径（默认 <out-dir>/export_state.json）')
+    incremental.add_argument('--chunk-size', type=int, default=5000)
+    incremental.add_argument('--database-url', default=None)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'incremental':
+        counts = incremental_export.run(args.out_dir, args.targets, args.database_url,
+                                        args.chunk_size, args.state)
+        for name, count in counts.items():
+            print(f'[export] {name}: 写出 {count} 行')
+        return
+
+    fmt = args.format or ('parquet' if args.out.endswith('.parquet') else 'csv')
+    conn = db.connect(args.database_url)
+    try:
+        rows = iter_offer_rows(conn, args.apps, chunk_size=args.chunk_size)
+        if fmt == 'parquet':
+            count = write_parquet(rows, args.out, args.chunk_size)
+        else:
+            count = write_csv(rows, args.out, args.chunk_size)
+    finally:
+        conn.close()
+    print(f'[export] 写出 {count} 行 -> {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+讨价还价游戏的参数与预先计算好的表。
+
+各 app 用自己的 C 建立一次 GAME = GameParams.from_constants(C)，之后
+折扣率、结算点数、均衡提议和 fallback 的接受判断都只查表，不再在每个页面重新计算。
+stage 数由 MAX_STAGE 决定，不限于 3。
+
+折扣率: stage s 时 P1 为 DISCOUNT_P1 ** (s - 1)，P2 为 DISCOUNT_P2 ** (s - 1)。
+"""
+from functools import lru_cache
+
+from common.ai import FALLBACK_THRESHOLDS, ROLE_P1, ROLE_P2, spe_offers
+
+ROLES = (ROLE_P1, ROLE_P2)
+
+
+class GameParams:
+    def __init__(self, endowment: int, max_stage: int, discount_p1: float, discount_p2: float):
+        self.endowment = endowment
+        self.max_stage = max_stage
+        self.base_discount = {ROLE_P1: discount_p1, ROLE_P2: discount_p2}
+
+        # (stage, role) -> 折扣率；多算一个 stage（max_stage + 1），最后一轮被拒绝后结算时用到
+        self.discounts = {
+            (stage, role): self.base_discount[role] ** (stage - 1)
+            for stage in range(1, max_stage + 2)
+            for role in ROLES
+        }
+
+        # (stage, proposer) -> offer 被接受时 [(p1_points, p2_points, p1_discounted, p2_discounted), ...]，
+        # 下标为 offer（0..endowment）
+        self.settlements = {}
+        for stage in range(1, max_stage + 1):
+            d1 = self.discounts[(stage, ROLE_P1)]
+            d2 = self.discounts[(stage, ROLE_P2)]
+            for proposer in ROLES:
+                rows = []
+                for offer in range(endowment + 1):
+                    if proposer == ROLE_P1:
+                        p1_points, p2_points = endowment - offer, offer
+                    else:
+                        p1_points, p2_points = offer, endowment - offer
+                    rows.append((p1_points, p2_points, p1_points * d1, p2_points * d2))
+                self.settlements[(stage, proposer)] = rows
+
+        # 子博弈完美均衡（逆向归纳）的提议，见 common.ai.spe_offers
+        self.spe = spe_offers(endowment, max_stage, self.discount_rate)
+
+    @classmethod
+    def from_constants(cls, constants):
+        """用 app 的 C（ENDOWMENT / MAX_STAGE / DISCOUNT_P1 / DISCOUNT_P2）建立，相同参数共用一个对象"""
+        return _cached(constants.ENDOWMENT, constants.MAX_STAGE, constants.DISCOUNT_P1, constants.DISCOUNT_P2)
+
+    def discount_rate(self, stage: int, role: str) -> float:
+        rate = self.discounts.get((stage, role))
+        if rate is None:
+            rate = self.base_discount[role] ** (stage - 1)
+        return rate
+
+    def settle(self, stage: int, proposer: str, offer: int, accepted: bool) -> tuple:
+        """本轮结束时的 (p1_points, p2_points, p1_discounted, p2_discounted)；未达成协议时全部为 0"""
+        if not accepted:
+            return 0, 0, 0.0, 0.0
+        return self.settlements[(stage, proposer)][offer]
+
+    def discounted(self, stage: int, role: str, points) -> float:
+        return points * self.discount_rate(stage, role)
+
+    def analytical_offer(self, stage: int) -> int:
+        return self.spe[stage]
+
+    def analytical_accept(self, offer: int, stage: int) -> bool:
+        """均衡的接受规则：不低于该 stage 的均衡提议时接受（offer 也可以是 NumPy 数组）"""
+        return offer >= self.spe[stage]
+
+    def fallback_threshold(self, stage: int) -> int:
+        return FALLBACK_THRESHOLDS.get(stage, FALLBACK_THRESHOLDS[max(FALLBACK_THRESHOLDS)])
+
+    def fallback_accept(self, offer: int, stage: int, role: str) -> bool:
+        """fallback 策略：折扣后的点数不低于该 stage 的阈值时接受（offer 也可以是 NumPy 数组，逐元素判断）"""
+        return self.discounted(stage, role, offer) >= self.fallback_threshold(stage)
+
+
+@lru_cache(maxsize=None)
+def _cached(endowment: int, max_stage: int, discount_p1: float, discount_p2: float) -> GameParams:
+    return GameParams(endowment, max_stage, discount_p1, discount_p2)
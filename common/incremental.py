@@ -0,0 +1,189 @@
+"""
+增量导出：只导出自上次运行以来新增或有变化的 session。
+
+每个导出目标（offers、FinalResults、questionnaireT1/2/3）在状态文件中只记录
+每个 session 的 high-water mark（参与者最后一次请求的时间戳）。再次运行时只查询
+high-water mark 变化了的 session，并整个重新导出这些 session：
+    第一次导出的 session      行追加到已有的 CSV 文件末尾
+    以前导出过的 session      CSV 中该 session 的旧行被替换（逐行复制到临时文件后替换原文件，
+                              不读取数据库），所以之后被修改的行（例如问卷、支付）也会更新
+
+用法:
+    python -m common.export incremental --out-dir exports
+"""
+import csv
+import json
+import os
+
+from common import db
+from common.export import OFFER_COLUMNS, iter_offer_rows, session_filter
+from common.payment import paid_amount
+
+STATE_FILENAME = 'export_state.json'
+
+# 玩家表中不属于问卷内容的内部字段
+INTERNAL_PLAYER_COLUMNS = {
+    'id', 'id_in_group', '_payoff', 'round_number', '_role',
+    'subsession_id', 'group_id', 'participant_id', 'session_id',
+}
+
+QUESTIONNAIRE_APPS = ['questionnaireT1', 'questionnaireT2', 'questionnaireT3']
+
+
+def load_state(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(path: str, state: dict):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def session_marks(conn) -> dict:
+    """session code -> 该 session 参与者最后一次请求的时间戳"""
+    query = '''
+        SELECT s.code, MAX(pt._last_request_timestamp)
+        FROM otree_session s
+        JOIN otree_participant pt ON pt.session_id = s.id
+        GROUP BY s.code
+    '''
+    return {code: mark or 0 for code, mark in db.iter_rows(conn, query)}
+
+
+def player_columns(conn, app: str) -> list:
+    """读取 app 玩家表的字段名（不依赖 oTree 的 models）"""
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT * FROM "{app}_player" WHERE 1 = 0')
+    columns = [d[0] for d in cursor.description]
+    cursor.close()
+    return columns
+
+
+# ----------------- 各导出目标 -----------------
+# 每个目标返回 (表头, 行生成器)；每行的第一列为 session code
+
+def offers_target(conn, session_codes, chunk_size):
+    rows = iter_offer_rows(conn, chunk_size=chunk_size, session_codes=session_codes, finished_only=True)
+    return OFFER_COLUMNS, rows
+
+
+def final_results_target(conn, session_codes, chunk_size):
+    """与 FinalResults.custom_export 相同的列，并补充 session / participant code"""
+    where, params = session_filter(session_codes)
+    where = f'{where} AND' if where else 'WHERE'
+    query = f'''
+        SELECT s.code, pt.code, pt.label, pl.final_payment
+        FROM "FinalResults_player" pl
+        JOIN otree_participant pt ON pl.participant_id = pt.id
+        JOIN otree_session s ON pl.session_id = s.id
+        {where} pl.selected_round != 0
+        ORDER BY s.id, pt.id_in_session
+    '''
+    header = ['session_code', 'participant_code', 'label', 'Final_Payoff']
+
+    def rows():
+        for session_code, code, label, final_payment in \
+                db.iter_rows(conn, query, params, chunk_size=chunk_size):
+            yield [session_code, code, label, paid_amount(final_payment)]
+    return header, rows()
+
+
+def questionnaire_target(app: str):
+    def target(conn, session_codes, chunk_size):
+        questions = [c for c in player_columns(conn, app) if c not in INTERNAL_PLAYER_COLUMNS]
+        where, params = session_filter(session_codes)
+        # 只导出已经回答完的问卷
+        answered = ' AND '.join(f'pl."{q}" IS NOT NULL' for q in questions) or '1 = 1'
+        where = f'{where} AND {answered}' if where else f'WHERE {answered}'
+        selected = ', '.join(f'pl."{q}"' for q in questions)
+        query = f'''
+            SELECT s.code, pt.code, pt.label, pl.id_in_group, {selected}
+            FROM "{app}_player" pl
+            JOIN otree_participant pt ON pl.participant_id = pt.id
+            JOIN otree_session s ON pl.session_id = s.id
+            {where}
+            ORDER BY s.id, pt.id_in_session
+        '''
+        header = ['session', 'participant_code', 'label', 'id_in_group'] + questions
+
+        rows = (list(row) for row in db.iter_rows(conn, query, params, chunk_size=chunk_size))
+        return header, rows
+    return target
+
+
+TARGETS = {
+    'offers': (offers_target, None),
+    'FinalResults': (final_results_target, 'FinalResults_player'),
+}
+for _app in QUESTIONNAIRE_APPS:
+    TARGETS[_app] = (questionnaire_target(_app), f'{_app}_player')
+
+
+def drop_sessions(out_path: str, session_codes: set):
+    """从已有的 CSV 中删除这些 session 的行（第一列为 session code）"""
+    tmp_path = out_path + '.tmp'
+    with open(out_path, newline='', encoding='utf-8') as src, \
+            open(tmp_path, 'w', newline='', encoding='utf-8') as dst:
+        writer = csv.writer(dst)
+        for i, row in enumerate(csv.reader(src)):
+            if i == 0 or not row or row[0] not in session_codes:
+                writer.writerow(row)
+    os.replace(tmp_path, out_path)
+
+
+def export_target(conn, name: str, out_dir: str, state: dict, marks: dict, chunk_size: int) -> int:
+    """重新导出一个目标中 high-water mark 变化了的 session 到 out_dir/<name>.csv，返回写出的行数"""
+    build, required_table = TARGETS[name]
+    if required_table and not db.table_exists(conn, required_table):
+        return 0
+
+    target_state = state.setdefault(name, {})
+    changed = [code for code, mark in marks.items()
+               if target_state.get(code, {}).get('mark') != mark]
+    if not changed:
+        return 0
+
+    out_path = os.path.join(out_dir, f'{name}.csv')
+    new_file = not os.path.exists(out_path)
+    exported_before = {code for code in changed if code in target_state}
+    if exported_before and not new_file:
+        drop_sessions(out_path, exported_before)
+
+    header, rows = build(conn, changed, chunk_size)
+    count = 0
+    with open(out_path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+
+    for code in changed:
+        target_state[code] = {'mark': marks[code]}
+    return count
+
+
+def run(out_dir: str, targets=None, database_url: str = None, chunk_size: int = 5000,
+        state_path: str = None) -> dict:
+    """执行一次增量导出，返回 {目标名: 写出的行数}"""
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = state_path or os.path.join(out_dir, STATE_FILENAME)
+    state = load_state(state_path)
+
+    conn = db.connect(database_url)
+    try:
+        marks = session_marks(conn)
+        counts = {}
+        for name in targets or TARGETS:
+            counts[name] = export_target(conn, name, out_dir, state, marks, chunk_size)
+            # 每个目标写完后立即保存状态，后面的目标失败时不影响已完成的部分
+            save_state(state_path, state)
+    finally:
+        conn.close()
+    return counts
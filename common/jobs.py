@@ -0,0 +1,322 @@
+"""
+AI 决策的本地任务队列（SQLite），由单独的 worker 进程执行（python -m common.aiworker）。
+
+默认各 human-AI app 在页面请求中直接调用 ai_propose / ai_respond，LLM 的等待占用服务器进程。
+设置环境变量 BARGAINING_AI_WORKER=1 时：
+    - 轮到 AI 提议、或人类提交提议后，服务器进程只把任务（prompt 需要的全部参数）写入队列，
+      参与者看到等待页面 Bargain_AIWait
+    - worker 进程取出任务，用 common.ai 的 decide_offer / decide_accept 决策，把结果写回队列
+    - 等待页面通过 live_method 轮询；结果出来后服务器进程把它写入 group（AI 的提议，
+      或本步的状态转移），页面自动进入下一页
+    - 等待超过 BARGAINING_AI_JOB_TIMEOUT 秒（默认 60）时取消任务，在服务器进程中用 fallback 决策
+AI 的吞吐量由 worker 的进程数 / 线程数决定，与 oTree 服务器进程无关。
+
+队列是一个单独的 SQLite 文件（默认项目根目录下的 ai_jobs.sqlite3，环境变量
+BARGAINING_AI_JOBS_DB 可以指定路径），使用 WAL，多个服务器进程和 worker 进程可以同时读写。
+worker 取任务时用 BEGIN IMMEDIATE 加写锁，同一个任务只会交给一个 worker；worker 中途退出时，
+running 超过 LEASE_SECONDS 的任务会被重新分配（本机上的在 worker 启动时立即重新排队，见 recover()）。
+
+每个 AI 决策都是一条持久的记录，key 为 app / session / 参与者 / round / stage / kind（见 job_key()）。
+没有设置 BARGAINING_AI_WORKER 时，服务器进程先写入 running 的记录，在本进程决策后写入结果（store()）。
+同一个 key 已有结果时直接使用：决策后、写入 group 前服务器重启，参与者重新加载 / 提交页面时
+使用记录的结果，不会再次调用（计费）API，也不会得到不同的决策。
+记录不会自动删除，队列文件在整个实验期间持续增长；session 结束后用 cleanup()
+（python -m common.aiworker --cleanup DAYS）删除已结束的旧记录。
+"""
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+
+from common import db
+from common.ai import ROLE_P1, ROLE_P2
+
+WORKER_ENV = 'BARGAINING_AI_WORKER'
+JOBS_DB_ENV = 'BARGAINING_AI_JOBS_DB'
+JOB_TIMEOUT_ENV = 'BARGAINING_AI_JOB_TIMEOUT'
+DEFAULT_JOBS_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_jobs.sqlite3')
+DEFAULT_JOB_TIMEOUT = 60
+# running 状态超过这个时间（秒）的任务视为 worker 已退出，重新分配
+LEASE_SECONDS = 120
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS ai_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        result TEXT,
+        worker TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        claimed_at REAL,
+        finished_at REAL
+    )''',
+    'CREATE INDEX IF NOT EXISTS ai_jobs_status ON ai_jobs (status, id)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS ai_jobs_key ON ai_jobs (key)',
+]
+
+# ai_calls_queued 的采样间隔（秒），见 report_depth()
+DEPTH_SAMPLE_SECONDS = 1.0
+
+# 每个线程一个连接（oTree 服务器与 worker 都可能在多个线程中使用）
+_local = threading.local()
+_depth_sampled_at = 0.0
+
+
+def enabled() -> bool:
+    return os.environ.get(WORKER_ENV, '').strip().lower() in ('1', 'true', 'yes')
+
+
+def job_timeout() -> int:
+    return int(os.environ.get(JOB_TIMEOUT_ENV, DEFAULT_JOB_TIMEOUT))
+
+
+def jobs_path() -> str:
+    return os.environ.get(JOBS_DB_ENV) or DEFAULT_JOBS_DB
+
+
+def connection():
+    """本线程的队列连接（autocommit；第一次使用时建表）"""
+    path = jobs_path()
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != path:
+        conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        db.configure_connection(conn, 'sqlite-wal')
+        for statement in SCHEMA:
+            conn.execute(statement)
+        _local.conn, _local.path = conn, path
+    return conn
+
+
+# ----------------- 服务器进程 -----------------
+
+def game_payload(game) -> dict:
+    """worker 用这些参数重建 GameParams（common.game._cached）"""
+    return dict(
+        endowment=game.endowment,
+        max_stage=game.max_stage,
+        discount_p1=game.base_discount[ROLE_P1],
+        discount_p2=game.base_discount[ROLE_P2],
+    )
+
+
+def propose_payload(game, stage: int, ai_role: str, history: list, policy: str = None, seed: int = None,
+                    mock_seed: int = None) -> dict:
+    """
+    AI 提议的任务参数；seed 为 fallback 提议的随机数种子（common/rng.py 的 ai 流），
+    mock_seed 为 mock 策略回答的种子（mock_llm 流）
+    """
+    from common.ai import get_ai_policy
+    return dict(game=game_payload(game), stage=stage, ai_role=ai_role, history=history,
+                policy=policy or get_ai_policy(), seed=seed, mock_seed=mock_seed)
+
+
+def respond_payload(game, offer: int, stage: int, ai_role: str, history: list, policy: str = None,
+                    mock_seed: int = None) -> dict:
+    """AI 回应 offer 的任务参数；mock_seed 同 propose_payload"""
+    from common.ai import get_ai_policy
+    return dict(game=game_payload(game), offer=offer, stage=stage, ai_role=ai_role, history=history,
+                policy=policy or get_ai_policy(), mock_seed=mock_seed)
+
+
+def job_key(player, kind: str, stage: int, offer: int = None) -> str:
+    """
+    一个 AI 决策的 key：app / session / 参与者 / round / stage / kind；回应还包括 offer
+    （服务器重启后参与者重新提交了不同的提议时，是另一个决策）
+    """
+    app = type(player).__module__.split('.')[0]
+    key = f'{app}/{player.session.code}/{player.participant.code}/r{player.round_number}/s{stage}/{kind}'
+    return key if offer is None else f'{key}/{offer}'
+
+
+def inline_name() -> str:
+    return f'inline:{socket.gethostname()}:{os.getpid()}'
+
+
+def open_job(key: str, kind: str, payload: dict, queued: bool) -> tuple:
+    """
+    按 key 取得（或新建）决策记录，返回 (job_id, result)。
+        已有结果（done）  result 为记录的结果：重新提交页面、服务器重启后都不再调用 API
+        queued=True       新记录进入队列由 worker 执行；被取消 / 失败的记录重新排队
+        queued=False      记录为 running（由本进程执行），调用方决策后 store()
+    """
+    conn = connection()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT id, status, result FROM ai_jobs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            cursor = conn.execute(
+                'INSERT INTO ai_jobs (key, kind, payload, status, worker, created_at, claimed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, kind, json.dumps(payload), 'queued' if queued else 'running',
+                 None if queued else inline_name(), now, None if queued else now))
+            job = (cursor.lastrowid, None)
+        elif row[1] == 'done':
+            job = (row[0], json.loads(row[2]))
+        else:
+            if queued and row[1] in ('cancelled', 'failed'):
+                conn.execute("UPDATE ai_jobs SET status = 'queued', result = NULL, worker = NULL WHERE id = ?",
+                             (row[0],))
+            job = (row[0], None)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    from common import metrics
+    if job[1] is not None:
+        metrics.inc('ai_jobs_replayed_total', (('kind', kind),))
+        print(f'[jobs] {key}: replaying recorded result (job {job[0]})')
+    report_depth()
+    return job
+
+
+def store(job_id: int, result: dict):
+    """服务器进程自己决策的结果（本进程执行，或超时后的 fallback）写入记录"""
+    connection().execute(
+        "UPDATE ai_jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ?",
+        (json.dumps(result), time.time(), job_id))
+
+
+def poll(job_id: int):
+    """完成时返回结果 dict（{'offer': ..} 或 {'accepted': ..}，以及 'meta'）；未完成或失败时为 None"""
+    row = connection().execute('SELECT status, result FROM ai_jobs WHERE id = ?', (job_id,)).fetchone()
+    report_depth()
+    if row is None or row[0] != 'done':
+        return None
+    return json.loads(row[1])
+
+
+def cancel(job_id: int):
+    """页面超时：取消还没有完成的任务。任务恰好已经完成时返回其结果，否则为 None"""
+    connection().execute(
+        "UPDATE ai_jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+        (time.time(), job_id))
+    return poll(job_id)
+
+
+def queue_depth() -> int:
+    return connection().execute("SELECT COUNT(*) FROM ai_jobs WHERE status = 'queued'").fetchone()[0]
+
+
+def report_depth():
+    """
+    更新 metrics 的 ai_calls_queued（排队中的 AI 任务数）。
+    worker 关闭时不会有排队的任务，不查询；开启时每个进程最多每 DEPTH_SAMPLE_SECONDS 秒
+    COUNT(*) 一次（任务由其他进程的 worker 取出，本进程无法增量维护这个数）。
+    """
+    global _depth_sampled_at
+    if not enabled():
+        return
+    now = time.monotonic()
+    if now - _depth_sampled_at < DEPTH_SAMPLE_SECONDS:
+        return
+    _depth_sampled_at = now
+    from common import metrics
+    metrics.set_gauge('ai_calls_queued', queue_depth())
+
+
+def cleanup(days: float) -> int:
+    """
+    删除 days 天前已结束（done / failed / cancelled）的记录，返回删除的记录数。
+    被删除的决策不能再复用，只对已经结束的 session 使用。
+    """
+    conn = connection()
+    deleted = conn.execute(
+        "DELETE FROM ai_jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+        (time.time() - days * 86400,)).rowcount
+    if deleted:
+        conn.execute('VACUUM')
+    return deleted
+
+
+# ----------------- worker 进程 -----------------
+
+def recover(host: str = None) -> int:
+    """
+    worker 启动时：本机上已退出的进程（worker 或服务器进程自己执行的 inline 决策）留下的 running 记录
+    重新排队，不必等待 LEASE_SECONDS。返回重新排队的记录数。
+    """
+    host = host or socket.gethostname()
+    conn = connection()
+    stale = []
+    for job_id, worker in conn.execute("SELECT id, worker FROM ai_jobs WHERE status = 'running'").fetchall():
+        parts = (worker or '').replace('inline:', '').split('/')[0].split(':')
+        if len(parts) == 2 and parts[0] == host and not _pid_alive(int(parts[1])):
+            stale.append(job_id)
+    for job_id in stale:
+        conn.execute("UPDATE ai_jobs SET status = 'queued', worker = NULL WHERE id = ? AND status = 'running'",
+                     (job_id,))
+    return len(stale)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def claim(worker: str):
+    """取出最早的一个任务（或租约过期的任务），返回 (id, kind, payload)；没有任务时为 None"""
+    conn = connection()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute(
+            "SELECT id, kind, payload FROM ai_jobs WHERE status = 'queued' "
+            "OR (status = 'running' AND claimed_at < ?) ORDER BY id LIMIT 1",
+            (now - LEASE_SECONDS,)).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE ai_jobs SET status = 'running', worker = ?, claimed_at = ?, attempts = attempts + 1 "
+                "WHERE id = ?", (worker, now, row[0]))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if row is None:
+        return None
+    return row[0], row[1], json.loads(row[2])
+
+
+def complete(job_id: int, result: dict):
+    # 已被取消（页面超时）的任务不再写入结果
+    connection().execute(
+        "UPDATE ai_jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+        (json.dumps(result), time.time(), job_id))
+
+
+def fail(job_id: int, error: str):
+    connection().execute(
+        "UPDATE ai_jobs SET status = 'failed', result = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+        (json.dumps(dict(error=error)), time.time(), job_id))
+
+
+def run_job(kind: str, payload: dict) -> dict:
+    """执行一个任务（与 app 内的 ai_propose / ai_respond 相同的决策）"""
+    from common.ai import decide_accept, decide_offer
+    from common.game import _cached
+
+    game = _cached(**payload['game'])
+    mock_seed = payload.get('mock_seed')
+    mock_rng = random.Random(mock_seed) if mock_seed is not None else None
+    meta = {}
+    if kind == 'propose':
+        seed = payload.get('seed')
+        offer = decide_offer(game, payload['stage'], payload['ai_role'], payload['history'],
+                             meta=meta, policy=payload['policy'],
+                             rng=random.Random(seed) if seed is not None else None, mock_rng=mock_rng)
+        return dict(offer=offer, meta=meta)
+    accepted = decide_accept(game, payload['offer'], payload['stage'], payload['ai_role'], payload['history'],
+                             meta=meta, policy=payload['policy'], mock_rng=mock_rng)
+    return dict(accepted=accepted, meta=meta)
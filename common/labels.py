@@ -0,0 +1,220 @@
+"""
+参与者 label（_rooms/*.txt）的索引：label → session / participant。
+
+oTree 在参与者从 room 的链接进入时才把 label 写入 participant，导出时按行经过
+p.participant 读取 label，每行一次查询。label 在 session 开始时还不存在，所以索引不在
+creating_session 中预先建立，而是在需要时建立。这里提供：
+    participant_index(players)   导出（FinalResults / 问卷的 custom_export）开始时按 session 一次读出
+                                 所有参与者，之后每行查 dict
+    session_label_rows(...)      FinalResults 的 admin 报告中按 label 搜索本 session 的参与者与支付
+    LabelIndex                   命令行：一次查询建立整个数据库的 label → [(session, participant, 支付)]，
+                                 并在 otree_participant.label 上建立数据库索引（INDEX_NAME）
+
+命令行（直接读取数据库，见 common/db.py）:
+    python -m common.labels index                                   # 建立数据库索引（唯一修改数据库的命令）
+    python -m common.labels find sub01 sub02                        # 各 label 参加过的 session 与支付
+    python -m common.labels payments --room virtual_Lab --out pay.csv
+按 room 的 label 文件的顺序每个 label 一行（同一个 label 参加了多个 session 时每个 session 一行，
+没有参加的 label 支付为空），--sessions 只取指定的 session。
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+
+INDEX_NAME = 'otree_participant_label'
+PAYMENT_COLUMNS = ['label', 'session_code', 'participant_code', 'id_in_session', 'Final_Payoff']
+
+
+# ----------------- oTree 进程中 -----------------
+
+def participant_index(players) -> dict:
+    """participant id -> participant；每个 session 用 get_participants() 读取一次"""
+    index = {}
+    sessions = set()
+    for p in players:
+        if p.participant_id in index or p.session_id in sessions:
+            continue
+        sessions.add(p.session_id)
+        for participant in p.session.get_participants():
+            index[participant.id] = participant
+    return index
+
+
+def participant_of(index: dict, player):
+    participant = index.get(player.participant_id)
+    return participant if participant is not None else player.participant
+
+
+def session_label_rows(session, players) -> list:
+    """
+    admin 报告用：本 session 中有 label 的参与者，按 label 排序。
+    players 为 FinalResults 的 Player（participant id -> 该 app 的 player，读取支付）。
+    """
+    from common.payment import paid_amount
+
+    by_participant = {p.participant_id: p for p in players}
+    rows = []
+    for participant in session.get_participants():
+        if not participant.label:
+            continue
+        player = by_participant.get(participant.id)
+        paid = player is not None and player.selected_round != 0
+        rows.append(dict(
+            label=participant.label,
+            id_in_session=participant.id_in_session,
+            code=participant.code,
+            final_payoff=paid_amount(player.final_payment) if paid else '',
+        ))
+    return sorted(rows, key=lambda row: row['label'])
+
+
+# ----------------- 命令行（直接读取数据库） -----------------
+
+def room_labels(room_name: str) -> list:
+    """settings.ROOMS 中该 room 的 label 文件的 label（按文件顺序）"""
+    from common.startup import PROJECT_DIR
+
+    sys.path.insert(0, PROJECT_DIR)
+    import settings
+    for room in getattr(settings, 'ROOMS', []):
+        if room['name'] == room_name:
+            if 'participant_label_file' not in room:
+                raise SystemExit(f'[labels] room {room_name} 没有 participant_label_file')
+            return read_label_file(os.path.join(PROJECT_DIR, room['participant_label_file']))
+    raise SystemExit(f'[labels] 未知的 room: {room_name}')
+
+
+def read_label_file(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def ensure_index(conn) -> bool:
+    """在 otree_participant.label 上建立索引（已存在时不做任何事），返回是否新建"""
+    from common import db
+
+    if isinstance(conn, sqlite3.Connection):
+        query = "SELECT 1 FROM sqlite_master WHERE type='index' AND name=?"
+    else:
+        query = "SELECT 1 FROM pg_indexes WHERE indexname=?"
+    cursor = conn.cursor()
+    cursor.execute(db.sql(conn, query), (INDEX_NAME,))
+    exists = cursor.fetchone() is not None
+    if not exists:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON otree_participant (label)')
+        conn.commit()
+    cursor.close()
+    return not exists
+
+
+class LabelIndex:
+    """label -> [(session_code, participant_code, id_in_session, final_payment), ...]"""
+
+    def __init__(self, entries: dict):
+        self.entries = entries
+
+    @classmethod
+    def load(cls, conn, labels=None, session_codes=None, chunk_size: int = 1000):
+        """一次查询读出有 label 的参与者；labels 不为 None 时只读这些 label（使用 INDEX_NAME）"""
+        from common import db
+        from common.export import session_filter
+
+        where, params = session_filter(session_codes)
+        conditions = [where[len('WHERE '):]] if where else []
+        conditions.append("pt.label IS NOT NULL AND pt.label != ''")
+        if labels is not None:
+            labels = list(labels)
+            if not labels:
+                return cls({})
+            conditions.append(f"pt.label IN ({', '.join('?' for _ in labels)})")
+            params = tuple(params) + tuple(labels)
+        with_payment = db.table_exists(conn, 'FinalResults_player')
+        payment = 'fr.final_payment, fr.selected_round' if with_payment else 'NULL, NULL'
+        join = 'LEFT JOIN "FinalResults_player" fr ON fr.participant_id = pt.id' if with_payment else ''
+        query = f'''
+            SELECT pt.label, s.code, pt.code, pt.id_in_session, {payment}
+            FROM otree_participant pt
+            JOIN otree_session s ON pt.session_id = s.id
+            {join}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY s.id, pt.id_in_session
+        '''
+        entries = {}
+        for label, session_code, code, id_in_session, final_payment, selected_round in \
+                db.iter_rows(conn, query, params, chunk_size=chunk_size):
+            paid = final_payment if selected_round else None
+            entries.setdefault(label, []).append((session_code, code, id_in_session, paid))
+        return cls(entries)
+
+    def get(self, label: str) -> list:
+        return self.entries.get(label, [])
+
+    def payment_rows(self, labels: list):
+        """labels 的顺序每个 (label, session) 一行（PAYMENT_COLUMNS）；没有参加的 label 一行空值"""
+        from common.payment import paid_amount
+
+        for label in labels:
+            found = self.get(label)
+            if not found:
+                yield [label, '', '', '', '']
+            for session_code, code, id_in_session, final_payment in found:
+                yield [label, session_code, code, id_in_session,
+                       paid_amount(final_payment) if final_payment is not None else '']
+
+
+def main(argv=None):
+    from common import db
+
+    parser = argparse.ArgumentParser(prog='python -m common.labels')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('index', help='在 otree_participant.label 上建立数据库索引')
+    find = sub.add_parser('find', help='各 label 参加过的 session 与支付')
+    find.add_argument('labels', nargs='+')
+    payments = sub.add_parser('payments', help='按 label 导出支付')
+    source = payments.add_mutually_exclusive_group(required=True)
+    source.add_argument('--room', help='settings.ROOMS 中的 room 名（使用其 label 文件）')
+    source.add_argument('--labels-file', help='label 文件（每行一个）')
+    payments.add_argument('--out', required=True)
+    for p in (find, payments):
+        p.add_argument('--sessions', nargs='*', default=None, help='只取这些 session code')
+    for p in sub.choices.values():
+        p.add_argument('--database-url', default=None)
+    args = parser.parse_args(argv)
+
+    conn = db.connect(args.database_url)
+    try:
+        if args.command == 'index':
+            # 只有 index 修改数据库（CREATE INDEX 需要写锁）；find / payments 只读
+            created = ensure_index(conn)
+            print(f'[labels] {INDEX_NAME}: {"created" if created else "already exists"}')
+            return
+        if args.command == 'find':
+            index = LabelIndex.load(conn, args.labels, args.sessions)
+            for label in args.labels:
+                found = index.get(label)
+                if not found:
+                    print(f'{label}: not found')
+                for session_code, code, id_in_session, final_payment in found:
+                    payment = '' if final_payment is None else f'  final_payment={final_payment}'
+                    print(f'{label}: session {session_code}  participant {code} (#{id_in_session}){payment}')
+            return
+        labels = room_labels(args.room) if args.room else read_label_file(args.labels_file)
+        index = LabelIndex.load(conn, session_codes=args.sessions)
+    finally:
+        conn.close()
+
+    count = 0
+    with open(args.out, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(PAYMENT_COLUMNS)
+        for row in index.payment_rows(labels):
+            writer.writerow(row)
+            count += 1
+    missing = sum(1 for label in labels if not index.get(label))
+    print(f'[labels] 写出 {count} 行 -> {args.out}（{len(labels)} 个 label，{missing} 个没有参加）')
+
+
+if __name__ == '__main__':
+    main()
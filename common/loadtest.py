@@ -0,0 +1,204 @@
+"""
+bot 压力测试：对每个 session config 以不同人数运行 `otree test`，
+报告 session 总耗时以及每个页面的耗时（来自 common.bots 记录的数据）。
+
+AI 对手默认使用 analytical 策略（不调用 OpenAI，见 common.ai）。
+
+用法:
+    python -m common.loadtest
+    python -m common.loadtest --configs human_human_demo --participants 2 40 200
+    python -m common.loadtest --report loadtest.json
+    python -m common.loadtest --baseline loadtest.json   # 与上次结果比较，变慢时返回非 0
+    python -m common.loadtest --progression round cohort final free   # 比较轮次推进方式
+    python -m common.loadtest --db-profile sqlite-wal                 # 数据库 profile（见 common/db.py）
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common.ai import AI_POLICIES, AI_POLICY_ENV
+from common.bots import TIMINGS_ENV
+from common.db import DB_PROFILE_ENV, DB_PROFILES
+from common.progression import MODES, PROGRESSION_ENV
+from common.rng import SEED_ENV
+from common.startup import SESSION_CONFIGS_ENV
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MIN_PARTICIPANTS = 2
+MAX_PARTICIPANTS = 200
+DEFAULT_PARTICIPANTS = [2, 10, 40]
+# 各次运行使用相同的种子（角色、配对、bot 与 AI fallback 的随机数，见 common/rng.py），结果可以比较
+DEFAULT_SEED = 1
+
+
+def load_session_configs() -> dict:
+    sys.path.insert(0, PROJECT_DIR)
+    import settings
+    return {config['name']: config for config in settings.SESSION_CONFIGS}
+
+
+def players_per_group(config: dict) -> int:
+    """human_human 两人一组，其余 app 为单人组"""
+    return 2 if 'human_human' in config['app_sequence'] else 1
+
+
+def participant_count(config: dict, requested: int) -> int:
+    if not MIN_PARTICIPANTS <= requested <= MAX_PARTICIPANTS:
+        raise SystemExit(f'人数必须在 {MIN_PARTICIPANTS}-{MAX_PARTICIPANTS} 之间: {requested}')
+    group_size = players_per_group(config)
+    if requested % group_size:
+        requested += group_size - requested % group_size
+        print(f"[loadtest] {config['name']}: 人数调整为 {requested}（{group_size} 人一组）")
+    return requested
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(seconds: list) -> dict:
+    values = sorted(s * 1000 for s in seconds)
+    return dict(
+        count=len(values),
+        mean_ms=round(sum(values) / len(values), 1),
+        p50_ms=round(percentile(values, 0.5), 1),
+        p95_ms=round(percentile(values, 0.95), 1),
+        max_ms=round(values[-1], 1),
+    )
+
+
+def run_one(config_name: str, participants: int, ai_policy: str, otree_cmd: str, timeout: int,
+            progression: str = None, db_profile: str = None, seed: int = DEFAULT_SEED) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        timings_path = os.path.join(tmp, 'timings.json')
+        # 只加载这个 config 的 app（见 common/startup.py）
+        env = dict(os.environ, **{AI_POLICY_ENV: ai_policy, TIMINGS_ENV: timings_path,
+                                  SESSION_CONFIGS_ENV: config_name})
+        if progression:
+            env[PROGRESSION_ENV] = progression
+        if db_profile:
+            env[DB_PROFILE_ENV] = db_profile
+        if seed is not None:
+            env[SEED_ENV] = str(seed)
+        started = time.perf_counter()
+        try:
+            proc = subprocess.run(
+                [otree_cmd, 'test', config_name, str(participants)],
+                cwd=PROJECT_DIR, env=env, capture_output=True, text=True, timeout=timeout,
+            )
+            ok, output = proc.returncode == 0, proc.stdout + proc.stderr
+        except subprocess.TimeoutExpired as e:
+            ok, output = False, f'timeout after {timeout}s\n{e.stdout or ""}'
+        wall_seconds = time.perf_counter() - started
+
+        timings, idle_seconds = {}, []
+        if os.path.exists(timings_path):
+            with open(timings_path, encoding='utf-8') as f:
+                data = json.load(f)
+            timings, idle_seconds = data['pages'], data['idle_seconds']
+
+    result = dict(
+        config=config_name,
+        participants=participants,
+        ai_policy=ai_policy,
+        progression=progression or 'config',
+        ok=ok,
+        wall_seconds=round(wall_seconds, 2),
+        mean_idle_seconds=round(sum(idle_seconds) / len(idle_seconds), 2) if idle_seconds else None,
+        max_idle_seconds=round(max(idle_seconds), 2) if idle_seconds else None,
+        pages={key: summarize(values) for key, values in sorted(timings.items()) if values},
+    )
+    if not ok:
+        result['output_tail'] = output[-3000:]
+    return result
+
+
+def print_result(result: dict):
+    status = 'OK' if result['ok'] else 'FAILED'
+    print(f"\n=== {result['config']} x {result['participants']} "
+          f"(ai={result['ai_policy']}, progression={result['progression']}) "
+          f"{status}  wall={result['wall_seconds']}s  "
+          f"idle mean={result['mean_idle_seconds']}s max={result['max_idle_seconds']}s")
+    if result['pages']:
+        print(f"{'page':<55}{'n':>6}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+        for key, s in result['pages'].items():
+            print(f"{key:<55}{s['count']:>6}{s['mean_ms']:>10}{s['p50_ms']:>10}"
+                  f"{s['p95_ms']:>10}{s['max_ms']:>10}")
+    if not result['ok']:
+        print(result['output_tail'])
+
+
+def compare_with_baseline(results: list, baseline: list, tolerance: float) -> list:
+    """返回比基线慢 tolerance 以上的项目（session 总耗时与页面 p95）"""
+    previous = {(r['config'], r['participants'], r.get('progression')): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r['config'], r['participants'], r['progression']))
+        if old is None:
+            continue
+        name = f"{r['config']} x {r['participants']} ({r['progression']})"
+        if r['wall_seconds'] > old['wall_seconds'] * (1 + tolerance):
+            regressions.append(f"{name}: wall {old['wall_seconds']}s -> {r['wall_seconds']}s")
+        for key, s in r['pages'].items():
+            old_page = old['pages'].get(key)
+            if old_page and s['p95_ms'] > old_page['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: {key} p95 {old_page['p95_ms']}ms -> {s['p95_ms']}ms")
+    return regressions
+
+
+def main(argv=None):
+    configs = load_session_configs()
+
+    parser = argparse.ArgumentParser(prog='python -m common.loadtest')
+    parser.add_argument('--configs', nargs='+', default=list(configs), choices=list(configs))
+    parser.add_argument('--participants', nargs='+', type=int, default=DEFAULT_PARTICIPANTS,
+                        help=f'每个 config 的人数（{MIN_PARTICIPANTS}-{MAX_PARTICIPANTS}）')
+    parser.add_argument('--ai-policy', choices=[p for p in AI_POLICIES if p != 'llm'], default='analytical')
+    parser.add_argument('--progression', nargs='+', default=[None], choices=MODES,
+                        help='依次用这些轮次推进方式运行（默认使用 session config 的设置）')
+    parser.add_argument('--db-profile', default=None, choices=DB_PROFILES,
+                        help='服务器的数据库 profile（默认使用环境变量 BARGAINING_DB_PROFILE）')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='session 的随机数种子（BARGAINING_RNG_SEED）')
+    parser.add_argument('--otree', default='otree', help='otree 命令')
+    parser.add_argument('--timeout', type=int, default=1800, help='每次运行的超时（秒）')
+    parser.add_argument('--report', default=None, help='把结果写成 JSON')
+    parser.add_argument('--baseline', default=None, help='与之前的 --report 结果比较')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='允许变慢的比例')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.configs:
+        for requested in args.participants:
+            n = participant_count(configs[name], requested)
+            for progression in args.progression:
+                print(f'[loadtest] otree test {name} {n} (progression={progression or "config"}) ...')
+                result = run_one(name, n, args.ai_policy, args.otree, args.timeout, progression, args.db_profile,
+                                 args.seed)
+                print_result(result)
+                results.append(result)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f'\n[loadtest] 结果已写入 {args.report}')
+
+    failed = [r for r in results if not r['ok']]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f'[loadtest] 变慢: {line}')
+
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
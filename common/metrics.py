@@ -0,0 +1,247 @@
+"""
+实验进行中的实时指标（只读，内存计数器，不查询数据库）。
+
+设置环境变量 METRICS_PORT 时，在 oTree 服务器进程内启动一个只读 HTTP 服务：
+    http://127.0.0.1:<METRICS_PORT>/metrics        Prometheus 文本格式
+    http://127.0.0.1:<METRICS_PORT>/metrics.json   JSON
+服务没有认证，默认只监听 127.0.0.1；需要从其他机器抓取时用 METRICS_HOST 指定监听地址
+（例如 METRICS_HOST=0.0.0.0，只在可信的网络中使用）。
+
+指标：
+    - 每个页面当前的参与者人数（等待页面的人数即队列长度）
+    - 正在进行 / 排队中的 AI 调用数，AI 调用总数（按来源）与出错数
+    - 页面 hook 耗时的分位数（来自 common.timing）
+参与者的位置在页面的 is_displayed 返回 True 时更新（见 common.timing.instrument_pages）。
+到达 session 的最后一个页面时删除；超过 METRICS_LOCATION_TTL 秒（默认 4 小时）没有更新的
+位置也不再计数，长时间运行的服务器中结束的 session 不会一直留在统计里。
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+METRICS_PORT_ENV = 'METRICS_PORT'
+METRICS_HOST_ENV = 'METRICS_HOST'
+DEFAULT_METRICS_HOST = '127.0.0.1'
+LOCATION_TTL_ENV = 'METRICS_LOCATION_TTL'
+DEFAULT_LOCATION_TTL = 4 * 3600
+
+_lock = threading.Lock()
+# participant id -> (session id, app, page, 是否等待页面, 更新时间 time.monotonic())
+_locations = {}
+_gauges = Counter()
+_counters = Counter()
+_server = None
+
+
+# ----------------- 记录 -----------------
+
+def location_ttl() -> float:
+    return float(os.environ.get(LOCATION_TTL_ENV, DEFAULT_LOCATION_TTL))
+
+
+def page_seen(player, app: str, page: str, is_wait_page: bool):
+    participant = player.participant
+    # is_displayed 时 _index_in_pages 为正在显示的页面；最后一个页面之后参与者不会再移动
+    last_page = participant._index_in_pages >= participant._max_page_index
+    with _lock:
+        if last_page:
+            _locations.pop(player.participant_id, None)
+        else:
+            _locations[player.participant_id] = (player.session_id, app, page, is_wait_page, time.monotonic())
+
+
+def prune_locations(now: float = None) -> int:
+    """删除超过 location_ttl() 秒没有更新的位置，返回删除的数目"""
+    cutoff = (time.monotonic() if now is None else now) - location_ttl()
+    with _lock:
+        stale = [pid for pid, location in _locations.items() if location[4] < cutoff]
+        for pid in stale:
+            del _locations[pid]
+    return len(stale)
+
+
+def inc(name: str, labels: tuple = (), value: float = 1):
+    with _lock:
+        _counters[(name, labels)] += value
+
+
+def add_gauge(name: str, value: float):
+    with _lock:
+        _gauges[name] += value
+
+
+def set_gauge(name: str, value: float):
+    with _lock:
+        _gauges[name] = value
+
+
+def track_ai_call(kind: str):
+    """
+    包装 ai_propose / ai_respond：统计进行中的调用数，以及按来源（llm/fallback/analytical）
+    和错误类型的调用次数。来源从函数写入的 meta 读取。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, meta: dict = None, **kwargs):
+            meta = {} if meta is None else meta
+            add_gauge('ai_calls_in_flight', 1)
+            try:
+                return func(*args, meta=meta, **kwargs)
+            except Exception as e:
+                meta.setdefault('error', type(e).__name__)
+                meta.setdefault('source', 'exception')
+                raise
+            finally:
+                add_gauge('ai_calls_in_flight', -1)
+                inc('ai_calls_total', (('kind', kind), ('source', meta.get('source', 'unknown'))))
+                if meta.get('error'):
+                    inc('ai_errors_total', (('kind', kind), ('error', meta['error'])))
+        return wrapper
+    return decorator
+
+
+# ----------------- 汇总 -----------------
+
+def snapshot() -> dict:
+    from common import timing
+
+    prune_locations()
+    with _lock:
+        locations = list(_locations.values())
+        gauges = dict(_gauges)
+        counters = dict(_counters)
+
+    on_page = Counter()
+    waiting = Counter()
+    for session_id, app, page, is_wait_page, _ in locations:
+        key = (session_id, app, page)
+        on_page[key] += 1
+        if is_wait_page:
+            waiting[key] += 1
+
+    def page_rows(counter):
+        return [dict(session=s, app=a, page=p, participants=n) for (s, a, p), n in sorted(counter.items())]
+
+    ai_calls = [dict(labels, value=v) for (name, labels), v in sorted(counters.items()) if name == 'ai_calls_total']
+    ai_errors = [dict(labels, value=v) for (name, labels), v in sorted(counters.items()) if name == 'ai_errors_total']
+    total_calls = sum(row['value'] for row in ai_calls)
+    fallback_calls = sum(row['value'] for row in ai_calls if row['source'] == 'fallback')
+    total_errors = sum(row['value'] for row in ai_errors)
+
+    return dict(
+        participants_on_page=page_rows(on_page),
+        wait_page_queue=page_rows(waiting),
+        ai_calls_in_flight=gauges.get('ai_calls_in_flight', 0),
+        ai_calls_queued=gauges.get('ai_calls_queued', 0),
+        ai_calls_total=ai_calls,
+        ai_errors_total=ai_errors,
+        ai_fallback_rate=round(fallback_calls / total_calls, 4) if total_calls else 0,
+        ai_error_rate=round(total_errors / total_calls, 4) if total_calls else 0,
+        page_latency=[
+            {k: row[k] for k in ('app', 'page', 'hook', 'stage', 'count', 'p50_ms', 'p95_ms', 'max_ms')}
+            for row in timing.snapshot()
+        ],
+    )
+
+
+def _labels(**labels) -> str:
+    parts = []
+    for k, v in labels.items():
+        if v is None:
+            continue
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def to_prometheus(data: dict) -> str:
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP otree_{name} {help_text}')
+        lines.append(f'# TYPE otree_{name} {kind}')
+        for labels, value in samples:
+            lines.append(f'otree_{name}{_labels(**labels)} {value}')
+
+    metric('participants_on_page', 'gauge', 'Participants currently on each page',
+           [(dict(session=r['session'], app=r['app'], page=r['page']), r['participants'])
+            for r in data['participants_on_page']])
+    metric('wait_page_queue', 'gauge', 'Participants waiting on each wait page',
+           [(dict(session=r['session'], app=r['app'], page=r['page']), r['participants'])
+            for r in data['wait_page_queue']])
+    metric('ai_calls_in_flight', 'gauge', 'AI calls currently running', [({}, data['ai_calls_in_flight'])])
+    metric('ai_calls_queued', 'gauge', 'AI calls waiting to run', [({}, data['ai_calls_queued'])])
+    metric('ai_calls_total', 'counter', 'AI calls by kind and decision source',
+           [(dict(kind=r['kind'], source=r['source']), r['value']) for r in data['ai_calls_total']])
+    metric('ai_errors_total', 'counter', 'AI API errors that fell back to the simple policy',
+           [(dict(kind=r['kind'], error=r['error']), r['value']) for r in data['ai_errors_total']])
+    metric('ai_fallback_rate', 'gauge', 'Share of AI calls answered by the fallback policy',
+           [({}, data['ai_fallback_rate'])])
+    metric('ai_error_rate', 'gauge', 'Share of AI calls that hit an API error', [({}, data['ai_error_rate'])])
+
+    latency = []
+    for r in data['page_latency']:
+        labels = dict(app=r['app'], page=r['page'], hook=r['hook'], stage=r['stage'])
+        latency.append((dict(labels, quantile='0.5'), r['p50_ms']))
+        latency.append((dict(labels, quantile='0.95'), r['p95_ms']))
+        latency.append((dict(labels, quantile='1'), r['max_ms']))
+    metric('page_hook_latency_ms', 'gauge', 'Page hook duration in milliseconds', latency)
+    metric('page_hook_calls_total', 'counter', 'Page hook calls',
+           [(dict(app=r['app'], page=r['page'], hook=r['hook'], stage=r['stage']), r['count'])
+            for r in data['page_latency']])
+    return '\n'.join(lines) + '\n'
+
+
+# ----------------- HTTP -----------------
+
+def _handler_class():
+    """HTTP 服务只在设置了 METRICS_PORT 时启动，http.server 到这时才导入（缩短服务器启动时间）"""
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path == '/metrics':
+                body = to_prometheus(snapshot()).encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif path == '/metrics.json':
+                body = json.dumps(snapshot(), ensure_ascii=False).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def start_server_from_env():
+    """
+    METRICS_PORT 已设置时启动 HTTP 服务（每个进程只启动一次，端口被占用时只打印警告）。
+    监听 METRICS_HOST（默认 127.0.0.1）
+    """
+    global _server
+    port = os.environ.get(METRICS_PORT_ENV)
+    if not port or _server is not None:
+        return
+    host = os.environ.get(METRICS_HOST_ENV) or DEFAULT_METRICS_HOST
+    from http.server import ThreadingHTTPServer
+    try:
+        _server = ThreadingHTTPServer((host, int(port)), _handler_class())
+    except (OSError, ValueError) as e:
+        print(f'[metrics] Could not start metrics server on {host}:{port}: {e}')
+        _server = False
+        return
+    thread = threading.Thread(target=_server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    print(f'[metrics] Serving /metrics and /metrics.json on {host}:{port}')
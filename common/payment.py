@@ -0,0 +1,312 @@
+"""
+最终支付（FinalResults）的规则，以及支付金额分布的模拟。
+
+FinalResults 从 PAY_ROUNDS 轮中随机抽一轮，final_payment = 点数 × MULTIPLIER + BASE_BONUS；
+human_AI_bargaining1（T2）另外以 50% 的概率改用同一 session、同一轮、与自己同角色的 AI 的点数
+（从中随机抽一个；没有时用自己的点数）。custom_export 把 final_payment 向上取整到 ROUND_TO 日元，
+这是实际支付的金额（paid_amount）。
+
+python -m common.payment 读取各 app 每名参与者每轮的点数（数据库，或 --rounds 指定的 CSV），
+用 NumPy 按批抽取大量的抽签结果（每次抽签对所有参与者各抽一次），按实验条件报告：
+    每名参与者的支付金额   期望、标准差、分位数
+    全部参与者的合计       期望、标准差、分位数（实验室的预算）
+抽签次数 × 参与者数在几百万以内时不到 1 秒。
+
+用法:
+    python -m common.payment --draws 100000
+    python -m common.payment --write-rounds rounds.csv          # 同时把读取的每轮点数写成 CSV
+    python -m common.payment --rounds rounds.csv --multiplier 30 --base-bonus 800 --report payment.json
+
+模拟需要 numpy: pip install numpy（FinalResults 只使用 paid_amount，不需要 numpy）
+"""
+import math
+
+# FinalResults 的 C 使用这里的定义
+MULTIPLIER = 40
+BASE_BONUS = 500
+PAY_ROUNDS = 10
+ROUND_TO = 10
+
+# app -> 实验条件；AI_DRAW_APPS 的参与者有 50% 的概率使用同角色 AI 的点数
+TREATMENTS = {
+    'human_human': 'T1',
+    'human_AI_bargaining1': 'T2',
+    'human_AI_bargaining2': 'T3',
+}
+AI_DRAW_APPS = ('human_AI_bargaining1',)
+ROUND_COLUMNS = ['session_code', 'participant_code', 'app_name', 'round_number', 'role', 'points', 'ai_points']
+PERCENTILES = (50, 90, 95, 99)
+DEFAULT_DRAWS = 100_000
+DEFAULT_BATCH_CELLS = 2_000_000
+
+
+def paid_amount(final_payment: float) -> int:
+    """custom_export 的取整：向上取整到 ROUND_TO 日元"""
+    return int(math.ceil((final_payment or 0) / ROUND_TO) * ROUND_TO)
+
+
+# ----------------- 每轮点数 -----------------
+
+def iter_round_results(conn, apps=None, session_codes=None, chunk_size: int = 1000):
+    """
+    每名参与者每轮一行（顺序与 ROUND_COLUMNS 一致），点数取自 group 的折扣后点数，
+    与各 app 写入 participant.vars['all_rounds_payoffs'] 的值相同；ai_points 只有人类 vs AI 的 app 有。
+    """
+    from common import db, export
+
+    for app in apps or list(TREATMENTS):
+        if not db.table_exists(conn, f'{app}_player'):
+            print(f'[payment] 跳过 {app}：数据库中没有该 app 的数据表')
+            continue
+        with_ai = export.BARGAINING_APPS.get(app) == 'ai'
+        where, params = export.session_filter(session_codes)
+        query = f'''
+            SELECT s.code, pt.code, pl.round_number, pl.assigned_role,
+                   g.p1_discounted_points, g.p2_discounted_points
+            FROM "{app}_player" pl
+            JOIN "{app}_group" g ON pl.group_id = g.id
+            JOIN otree_participant pt ON pl.participant_id = pt.id
+            JOIN otree_session s ON pl.session_id = s.id
+            {where}
+            ORDER BY s.id, pt.id_in_session, pl.round_number
+        '''
+        for session_code, code, round_number, role, p1_points, p2_points in \
+                db.iter_rows(conn, query, params, chunk_size=chunk_size):
+            if role not in ('P1', 'P2'):
+                continue
+            points, other_points = (p1_points, p2_points) if role == 'P1' else (p2_points, p1_points)
+            yield [session_code, code, app, round_number, role,
+                   points or 0.0, (other_points or 0.0) if with_ai else None]
+
+
+def read_rounds_csv(path: str) -> list:
+    import csv
+
+    rows = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for record in csv.DictReader(f):
+            ai_points = record.get('ai_points')
+            rows.append([record['session_code'], record['participant_code'], record['app_name'],
+                         int(record['round_number']), record['role'], float(record['points'] or 0),
+                         float(ai_points) if ai_points not in (None, '') else None])
+    return rows
+
+
+# ----------------- 模拟 -----------------
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise SystemExit('支付模拟需要 numpy: pip install numpy')
+    return numpy
+
+
+class Treatment:
+    """
+    一个实验条件的参与者，按 (参与者, 轮次) 排成数组：
+    points / role 为参与者自己的点数与角色（没有该轮的数据时点数为 0，与 FinalResults 出错时相同）；
+    ai_draw 时另外按 (session, 轮次, AI 的角色) 把 AI 的点数排成连续的区间（pool_start / pool_count）。
+    """
+
+    def __init__(self, app: str, rows: list, ai_draw: bool):
+        np = _numpy()
+        self.app = app
+        self.ai_draw = ai_draw
+        participants = sorted({(row[0], row[1]) for row in rows})
+        index = {key: i for i, key in enumerate(participants)}
+        session_names = sorted({session for session, _ in participants})
+        session_index = {name: i for i, name in enumerate(session_names)}
+        self.sessions = len(session_names)
+        self.participants = len(participants)
+        self.session_of = np.array([session_index[session] for session, _ in participants], dtype=np.int64)
+
+        n = self.participants
+        self.points = np.zeros((n, PAY_ROUNDS))
+        self.role = np.full((n, PAY_ROUNDS), -1, dtype=np.int64)  # 0 = P1, 1 = P2
+        ai_points = np.zeros((n, PAY_ROUNDS))
+        for session, code, _, round_number, role, points, other_points in rows:
+            if not 1 <= round_number <= PAY_ROUNDS:
+                continue
+            i, k = index[(session, code)], round_number - 1
+            self.points[i, k] = points
+            self.role[i, k] = 0 if role == 'P1' else 1
+            ai_points[i, k] = other_points or 0.0
+
+        if ai_draw:
+            # AI 的角色与参与者相反；key = (session, 轮次, AI 的角色)
+            i, k = np.nonzero(self.role >= 0)
+            keys = self._key(self.session_of[i], k, 1 - self.role[i, k])
+            order = np.argsort(keys, kind='stable')
+            self.pool = ai_points[i, k][order]
+            pool_count = np.bincount(keys, minlength=self.sessions * PAY_ROUNDS * 2)
+            pool_start = np.cumsum(pool_count) - pool_count
+            # 每个 (参与者, 轮次) 可以抽的同角色 AI（AI 的角色 = 参与者自己的角色；
+            # 自己的对局中 AI 的角色相反，不会抽到自己的）
+            own_keys = self._key(self.session_of[:, None], np.arange(PAY_ROUNDS)[None, :], np.maximum(self.role, 0))
+            self.cell_count = np.where(self.role >= 0, pool_count[own_keys], 0).ravel()
+            self.cell_start = pool_start[own_keys].ravel()
+
+    def max_points(self) -> float:
+        pools = [self.points.max(initial=0)]
+        if self.ai_draw:
+            pools.append(self.pool.max(initial=0))
+        return float(max(pools))
+
+    @staticmethod
+    def _key(session, round_index, role):
+        return (session * PAY_ROUNDS + round_index) * 2 + role
+
+    def draw(self, draws: int, rng):
+        """draws 次抽签，返回 (draws, 参与者数) 的被抽中的点数"""
+        np = _numpy()
+        n = self.participants
+        # 按 (参与者, 轮次) 展开后的下标
+        cells = rng.integers(0, PAY_ROUNDS, size=(draws, n)) + np.arange(n) * PAY_ROUNDS
+        points = self.points.ravel()[cells]
+        if not self.ai_draw or not len(self.pool):
+            return points
+        # 一个均匀随机数同时决定 50/50 与抽哪一个 AI：u < 0.5 时使用 AI，2u 在 [0, 1) 上均匀
+        u = rng.random((draws, n))
+        count = self.cell_count[cells]
+        use_ai = (u < 0.5) & (count > 0)
+        pick = self.cell_start[cells] + (2 * u * count).astype(np.int64)
+        ai_points = self.pool[np.minimum(pick, len(self.pool) - 1)]
+        return np.where(use_ai, ai_points, points)
+
+
+def simulate(treatment: Treatment, draws: int, multiplier: float, base_bonus: float,
+             seed: int = None, batch_cells: int = DEFAULT_BATCH_CELLS) -> dict:
+    """
+    返回 dict(counts=每名参与者支付金额的计数, totals=每次抽签的合计, raw_mean=未取整的期望)。
+    支付金额都是 ROUND_TO 的倍数，计数的下标为 金额 / ROUND_TO。
+    """
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+    batch = max(1, batch_cells // max(treatment.participants, 1))
+    max_paid = paid_amount(treatment.max_points() * multiplier + base_bonus)
+    counts = np.zeros(max_paid // ROUND_TO + 1, dtype=np.int64)
+    totals = np.zeros(draws, dtype=np.int64)
+    raw_sum = 0.0
+
+    done = 0
+    while done < draws:
+        n = min(batch, draws - done)
+        payment = treatment.draw(n, rng) * multiplier + base_bonus
+        # 与 paid_amount 相同的运算顺序，结果与 custom_export 一致
+        paid = (np.ceil(payment / ROUND_TO) * ROUND_TO).astype(np.int64)
+        counts += np.bincount((paid // ROUND_TO).ravel(), minlength=len(counts))
+        totals[done:done + n] = paid.sum(axis=1)
+        raw_sum += float(payment.sum())
+        done += n
+    return dict(counts=counts, totals=totals, raw_mean=raw_sum / max(draws * treatment.participants, 1))
+
+
+def _stats_from_counts(counts) -> dict:
+    np = _numpy()
+    values = np.arange(len(counts)) * ROUND_TO
+    total = counts.sum()
+    mean = float((values * counts).sum() / total)
+    sd = float(np.sqrt((counts * (values - mean) ** 2).sum() / total))
+    cumulative = np.cumsum(counts)
+    result = dict(mean=round(mean, 2), sd=round(sd, 2))
+    for q in PERCENTILES:
+        result[f'p{q}'] = int(values[min(int(np.searchsorted(cumulative, total * q / 100)), len(values) - 1)])
+    result['max'] = int(values[np.flatnonzero(counts)[-1]])
+    return result
+
+
+def _stats(values) -> dict:
+    np = _numpy()
+    result = dict(mean=round(float(values.mean()), 2), sd=round(float(values.std()), 2))
+    for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        result[f'p{q}'] = int(value)
+    result['max'] = int(values.max())
+    return result
+
+
+def summarize(treatment: Treatment, result: dict) -> dict:
+    return dict(
+        treatment=TREATMENTS.get(treatment.app, treatment.app),
+        app=treatment.app,
+        sessions=treatment.sessions,
+        participants=treatment.participants,
+        per_participant=dict(_stats_from_counts(result['counts']), unrounded_mean=round(result['raw_mean'], 2)),
+        total=_stats(result['totals']),
+    )
+
+
+def print_summaries(summaries: list, draws: int, seconds: float):
+    print(f'\n=== {draws} draws per participant in {seconds:.2f}s (amounts in JPY, after rounding up to {ROUND_TO})')
+    columns = ['mean', 'sd'] + [f'p{q}' for q in PERCENTILES] + ['max']
+    print(f"{'':<28}" + ''.join(f'{c:>10}' for c in columns))
+    for s in summaries:
+        label = f"{s['treatment']} {s['app']}"
+        print(f"{label} ({s['participants']} participants, {s['sessions']} sessions)")
+        for kind in ('per_participant', 'total'):
+            d = s[kind]
+            print(f'  {kind:<26}' + ''.join(f'{d[c]:>10}' for c in columns))
+
+
+def main(argv=None):
+    import argparse
+    import csv
+    import json
+    import time
+
+    from common import db
+
+    parser = argparse.ArgumentParser(prog='python -m common.payment')
+    parser.add_argument('--rounds', default=None, help='每轮点数的 CSV（ROUND_COLUMNS）；默认读取数据库')
+    parser.add_argument('--write-rounds', default=None, help='把从数据库读取的每轮点数写成 CSV')
+    parser.add_argument('--apps', nargs='+', default=list(TREATMENTS), choices=list(TREATMENTS))
+    parser.add_argument('--sessions', nargs='*', default=None, help='只使用这些 session code')
+    parser.add_argument('--draws', type=int, default=DEFAULT_DRAWS, help='抽签次数（每次对所有参与者各抽一次）')
+    parser.add_argument('--multiplier', type=float, default=MULTIPLIER)
+    parser.add_argument('--base-bonus', type=float, default=BASE_BONUS)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--batch-cells', type=int, default=DEFAULT_BATCH_CELLS,
+                        help='每批的 抽签次数 × 参与者数（内存占用）')
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--report', default=None, help='把结果写成 JSON')
+    args = parser.parse_args(argv)
+
+    if args.rounds:
+        rows = read_rounds_csv(args.rounds)
+    else:
+        conn = db.connect(args.database_url)
+        try:
+            rows = list(iter_round_results(conn, args.apps, args.sessions))
+        finally:
+            conn.close()
+        if args.write_rounds:
+            with open(args.write_rounds, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(ROUND_COLUMNS)
+                writer.writerows(rows)
+            print(f'[payment] 写出 {len(rows)} 行 -> {args.write_rounds}')
+
+    started = time.perf_counter()
+    summaries = []
+    for app in args.apps:
+        app_rows = [row for row in rows if row[2] == app]
+        if not app_rows:
+            continue
+        treatment = Treatment(app, app_rows, ai_draw=app in AI_DRAW_APPS)
+        result = simulate(treatment, args.draws, args.multiplier, args.base_bonus, args.seed, args.batch_cells)
+        summaries.append(summarize(treatment, result))
+    seconds = time.perf_counter() - started
+    if not summaries:
+        raise SystemExit('[payment] 没有可以模拟的参与者')
+    print_summaries(summaries, args.draws, seconds)
+
+    if args.report:
+        report = dict(draws=args.draws, multiplier=args.multiplier, base_bonus=args.base_bonus,
+                      seconds=round(seconds, 3), treatments=summaries)
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f'\n[payment] 结果已写入 {args.report}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+human-AI app 的轮次推进方式（WaitForNextRound / WaitForFinalResults 何时显示）。
+
+每位参与者都是单独与 AI 对局，所以每轮结束时的全员等待只是在等最慢的人。
+session config 的 progression（或环境变量 BARGAINING_PROGRESSION）可选：
+    round   每轮结束后全员等待（原来的行为，默认）
+    cohort  每 cohort_rounds 轮全员等待一次
+    final   只在最后一轮结束后全员等待
+    free    不等待；但 FinalResults 需要其他参与者数据的 app（T2）仍保留最后的等待
+
+每个等待页面的等待时间累加到 participant.idle_seconds（按页面的明细在
+participant.vars['idle_by_page']），可以在导出数据中比较各模式。
+"""
+import os
+import time
+
+PROGRESSION_ENV = 'BARGAINING_PROGRESSION'
+MODES = ('round', 'cohort', 'final', 'free')
+DEFAULT_COHORT_ROUNDS = 5
+
+
+def get_mode(session) -> str:
+    mode = os.environ.get(PROGRESSION_ENV) or session.config.get('progression', 'round')
+    if mode not in MODES:
+        print(f"[progression] Unknown progression mode {mode!r}, using 'round'")
+        return 'round'
+    return mode
+
+
+def barrier_after_round(session, round_number: int) -> bool:
+    """本轮结束后是否需要全员等待（不含最后一轮，最后一轮见 final_barrier）"""
+    mode = get_mode(session)
+    if mode == 'round':
+        return True
+    if mode == 'cohort':
+        k = int(session.config.get('cohort_rounds', DEFAULT_COHORT_ROUNDS))
+        return k > 0 and round_number % k == 0
+    return False
+
+
+def final_barrier(session, needs_all_players: bool) -> bool:
+    """最后一轮结束后是否全员等待；needs_all_players 表示后面的结算需要其他参与者的数据"""
+    return needs_all_players or get_mode(session) != 'free'
+
+
+# ----------------- 等待时间 -----------------
+
+def _wait_key(player, page_name: str) -> str:
+    app_name = type(player).__module__.split('.')[0]
+    return f'{app_name}:{player.round_number}:{page_name}'
+
+
+def mark_arrival(player, page_name: str):
+    """在等待页面的 is_displayed 返回 True 时调用，记录到达时间（重复调用时保留第一次）"""
+    arrivals = player.participant.vars.setdefault('wait_arrivals', {})
+    arrivals.setdefault(_wait_key(player, page_name), time.time())
+
+
+def record_release(subsession, page_name: str):
+    """在 after_all_players_arrive 中调用，把每位参与者在该页面的等待时间累加到 idle_seconds"""
+    now = time.time()
+    idle_times = []
+    for p in subsession.get_players():
+        participant = p.participant
+        arrived = participant.vars.get('wait_arrivals', {}).pop(_wait_key(p, page_name), None)
+        if arrived is None:
+            continue
+        idle = now - arrived
+        idle_times.append(idle)
+        participant.idle_seconds = round(participant.vars.get('idle_seconds', 0) + idle, 3)
+        by_page = participant.vars.setdefault('idle_by_page', {})
+        by_page[page_name] = round(by_page.get(page_name, 0) + idle, 3)
+
+    if idle_times:
+        print(f"[progression] {page_name} round {subsession.round_number} "
+              f"(mode={get_mode(subsession.session)}): {len(idle_times)} players, "
+              f"mean idle {sum(idle_times) / len(idle_times):.1f}s, max {max(idle_times):.1f}s")
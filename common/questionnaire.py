@@ -0,0 +1,75 @@
+"""
+问卷 app（questionnaireT1/2/3）共用的部分。
+
+每个问卷只需要在 _lexicon_q.Lexicon 中写问题文本（q_<name>）和选项（q_<name>_opts）；
+问题列表、Player 字段、表单字段和 custom_export 都由 build_spec() 得到的 spec 生成。
+添加问题时只需在 Lexicon 中增加 q_offer_N / q_offer_N_opts。
+
+spec 与字段的选项在 import 时生成一次，页面渲染时不再重新构建。
+"""
+from otree.api import models
+
+# 固定在前面的问题，之后是 Lexicon 中按编号排列的 offer_1, offer_2, ...
+BASE_QUESTIONS = ['age', 'gender', 'affiliate', 'rule']
+AGE_MIN = 17
+AGE_MAX = 100
+
+
+def question_names(lexicon) -> list:
+    names = list(BASE_QUESTIONS)
+    n = 1
+    while hasattr(lexicon, f'q_offer_{n}'):
+        names.append(f'offer_{n}')
+        n += 1
+    return names
+
+
+def build_spec(lexicon) -> list:
+    """[{name, label, choices}, ...]；choices 为 None 表示数字输入（年龄）"""
+    spec = []
+    for name in question_names(lexicon):
+        choices = getattr(lexicon, f'q_{name}_opts', None)
+        spec.append(dict(
+            name=name,
+            label=getattr(lexicon, f'q_{name}'),
+            choices=[tuple(choice) for choice in choices] if choices else None,
+        ))
+    return spec
+
+
+def build_fields(spec: list) -> dict:
+    """字段名 -> models.IntegerField"""
+    fields = {}
+    for q in spec:
+        if q['choices'] is None:
+            fields[q['name']] = models.IntegerField(min=AGE_MIN, max=AGE_MAX, label=q['label'])
+        else:
+            fields[q['name']] = models.IntegerField(label=q['label'], choices=q['choices'])
+    return fields
+
+
+def add_fields(player_class, spec: list):
+    """把 spec 的问题字段加到 Player 上；在 Player 类定义之后调用"""
+    for name, field in build_fields(spec).items():
+        setattr(player_class, name, field)
+
+
+def form_fields(spec: list) -> list:
+    return [q['name'] for q in spec]
+
+
+def make_custom_export(spec: list):
+    names = form_fields(spec)
+
+    def custom_export(players):
+        from common import labels
+
+        # header row
+        yield ['session', 'participant_code', 'label', 'id_in_group'] + names
+        players = list(players)
+        participants = labels.participant_index(players)
+        for p in players:
+            participant = labels.participant_of(participants, p)
+            yield ([p.session.code, participant.code, participant.label, p.id_in_group]
+                   + [p.field_maybe_none(name) for name in names])
+    return custom_export
@@ -0,0 +1,403 @@
+"""
+反事实回放：把数据库中人类实际做出的提议交给另一个 AI 策略，看结果会怎样。
+
+人类 vs AI 的 app（human_AI_bargaining1/2 ...）中每个 group 的记录只有 history_json。
+这里读出每个 group 的记录，用指定的 AI 策略（fallback / analytical / llm）代替当时的 AI 重新进行
+stage 1..MAX_STAGE：
+    人类提议的 stage   使用记录中人类在该 stage 的提议，由新的 AI 策略回应
+    AI 提议的 stage    由新的 AI 策略提议，人类的回应按记录推断（显示偏好）：
+                       人类接受过 X 时，接受不低于 X 的提议；拒绝过 X 时，拒绝不高于 X 的提议
+记录中没有该 stage（当时的对局在这之前已经结束），或者人类的回应无法从记录推断时，
+该 group 的结果为 undetermined（不猜测人类的行为）。人类的提议假定与当时的路径无关。
+
+策略与 common/simulate.py 相同（NumPy 按 chunk 向量化），chunk 由进程池并行处理；
+除 LLM 以外几千个 group 在几秒内完成。LLM 使用与 app 相同的 prompt，--llm-cache 时
+各进程共用缓存文件（结束时合并写回），--llm-mock 不调用 API。
+
+每个 group 输出一行：记录中的结果与反事实的结果（结束 stage、是否达成协议、折扣后点数）。
+
+用法:
+    python -m common.replay --policy analytical --out replay_analytical.csv
+    python -m common.replay --policy fallback --seed 1 --workers 8 --out replay.csv --report replay.json
+    python -m common.replay --policy llm --llm-cache llm_cache.json --out replay_llm.parquet
+
+需要 numpy: pip install numpy
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common import db, export, simulate
+from common.ai import ROLE_P1, ROLE_P2, other_role, proposer_role
+
+POLICIES = ('fallback', 'analytical', 'llm')
+DEFAULT_CHUNK_GROUPS = 500
+
+AGREED = 'agreed'
+NO_DEAL = 'no_deal'
+UNDETERMINED = 'undetermined'
+
+REPLAY_COLUMNS = [
+    'session_code',
+    'app_name',
+    'round_number',
+    'group_id',
+    'human_role',
+    'policy',
+    'recorded_final_stage',
+    'recorded_accepted',
+    'recorded_p1_payoff',
+    'recorded_p2_payoff',
+    'outcome',  # agreed / no_deal / undetermined
+    'final_stage',  # 达成协议 / 最后一个 stage 被拒绝 / 无法推断 的 stage
+    'final_proposer_type',  # human / ai
+    'final_offer',
+    'p1_payoff',  # outcome 为 undetermined 时为空
+    'p2_payoff',
+]
+
+
+def replay_columns(max_stage: int) -> list:
+    """REPLAY_COLUMNS 加上 stage_1_offer .. stage_{max_stage}_offer"""
+    return REPLAY_COLUMNS + [f'stage_{n}_offer' for n in range(1, max_stage + 1)]
+
+
+def iter_groups(conn, apps=None, chunk_size: int = 1000, session_codes=None, finished_only=True):
+    """人类 vs AI 的 group：(session_code, app, round_number, group_id, human_role, history)"""
+    apps = apps or [app for app in export.DEFAULT_APPS if export.BARGAINING_APPS[app] == 'ai']
+    for app in apps:
+        if export.BARGAINING_APPS.get(app) != 'ai':
+            raise ValueError(f'不是人类 vs AI 的 app: {app}')
+        if not db.table_exists(conn, f'{app}_player'):
+            print(f'[replay] 跳过 {app}：数据库中没有该 app 的数据表', file=sys.stderr)
+            continue
+        where, params = export.session_filter(session_codes, finished_only=finished_only)
+        query = f'''
+            SELECT s.code, pl.round_number, g.id, pl.assigned_role, g.history_json
+            FROM "{app}_player" pl
+            JOIN "{app}_group" g ON pl.group_id = g.id
+            JOIN otree_session s ON pl.session_id = s.id
+            {where}
+            ORDER BY s.id, pl.round_number, g.id
+        '''
+        for session_code, round_number, group_id, human_role, history_json in \
+                db.iter_rows(conn, query, params, chunk_size=chunk_size):
+            if human_role not in (ROLE_P1, ROLE_P2):
+                continue
+            try:
+                history = json.loads(history_json) if history_json else []
+            except ValueError:
+                history = []
+            yield session_code, app, round_number, group_id, human_role, history
+
+
+def recorded_outcome(game, history: list) -> tuple:
+    """记录中的 (final_stage, accepted, p1_payoff, p2_payoff)；没有记录时全部为 None"""
+    if not history:
+        return None, None, None, None
+    last = history[-1]
+    accepted = bool(last['accepted'])
+    p1_payoff, p2_payoff = export.settle(game, last['stage'], last['proposer'], last['offer'], accepted)
+    return last['stage'], accepted, p1_payoff, p2_payoff
+
+
+# ----------------- 回放（每个进程处理一个 chunk） -----------------
+
+_worker_state = {}
+
+
+def _init_worker(policy_name: str, llm_mock: bool, llm_cache: str, llm_samples: int):
+    """进程池的 initializer：每个进程建立一次策略（与 LLM 缓存）"""
+    cache = None
+    if policy_name == 'llm':
+        complete = simulate.mock_complete if llm_mock else simulate.openai_complete()
+        if llm_cache:
+            complete = cache = simulate.ResponseCache(complete, llm_cache, llm_samples)
+        policy = simulate.LLMPolicy(complete)
+    elif policy_name == 'analytical':
+        policy = simulate.AnalyticalPolicy()
+    else:
+        policy = simulate.FallbackPolicy()
+    _worker_state.update(policy=policy, cache=cache, new_answers={})
+
+
+def _arrays(groups: list, max_stage: int):
+    """记录中人类的角色、各 stage 的提议与回应（没有记录时为 -1）"""
+    np = simulate._numpy()
+    n = len(groups)
+    human_p1 = np.array([group[4] == ROLE_P1 for group in groups], dtype=bool)
+    offers = np.full((n, max_stage), -1, dtype=np.int64)
+    accepted = np.full((n, max_stage), -1, dtype=np.int64)
+    for i, group in enumerate(groups):
+        for entry in group[5]:
+            stage = entry.get('stage')
+            if isinstance(stage, int) and 1 <= stage <= max_stage:
+                offers[i, stage - 1] = entry['offer']
+                accepted[i, stage - 1] = 1 if entry['accepted'] else 0
+    return human_p1, offers, accepted
+
+
+def replay_chunk(game, groups: list, policy, rng) -> list:
+    """
+    用 policy 代替 AI 回放 groups，返回 REPLAY_COLUMNS 顺序的行。
+    与 simulate.play_batch 相同，每个 stage 只处理还没有结束的 group，
+    人类提议 / AI 提议的 group 分开交给策略。
+    """
+    np = simulate._numpy()
+    n = len(groups)
+    human_p1, rec_offers, rec_accepted = _arrays(groups, game.max_stage)
+    outcome = np.full(n, '', dtype=object)
+    final_stage = np.zeros(n, dtype=np.int64)
+    offers_by_stage = np.full((n, game.max_stage), -1, dtype=np.int64)
+    active = np.arange(n)
+
+    for stage in range(1, game.max_stage + 1):
+        if not len(active):
+            break
+        proposer = proposer_role(stage)
+        responder = other_role(proposer)
+        human_proposes = human_p1[active] == (proposer == ROLE_P1)
+        rec_offer = rec_offers[active, stage - 1]
+        rec_accept = rec_accepted[active, stage - 1]
+        offers = rec_offer.copy()
+        accepted = np.zeros(len(active), dtype=bool)
+        known = rec_offer >= 0
+
+        # 人类提议：记录中的提议，AI 回应
+        ask = np.flatnonzero(human_proposes & known)
+        if len(ask):
+            previous = offers_by_stage[active[ask], :stage - 1]
+            accepted[ask] = np.asarray(policy.respond(game, offers[ask], stage, responder, previous, rng), dtype=bool)
+
+        # AI 提议：新的提议，人类的回应按记录推断
+        ai = np.flatnonzero(~human_proposes)
+        if len(ai):
+            previous = offers_by_stage[active[ai], :stage - 1]
+            offers[ai] = np.clip(np.asarray(policy.propose(game, stage, proposer, previous, rng)),
+                                 0, game.endowment).astype(np.int64)
+            accept_known = (rec_accept[ai] == 1) & (offers[ai] >= rec_offer[ai])
+            reject_known = (rec_accept[ai] == 0) & (offers[ai] <= rec_offer[ai])
+            accepted[ai] = accept_known
+            known[ai] = (rec_offer[ai] >= 0) & (accept_known | reject_known)
+
+        offers_by_stage[active, stage - 1] = np.where(human_proposes & ~known, -1, offers)
+        unknown = active[~known]
+        outcome[unknown] = UNDETERMINED
+        final_stage[unknown] = stage
+        done = active[known & accepted]
+        outcome[done] = AGREED
+        final_stage[done] = stage
+        active = active[known & ~accepted]
+
+    outcome[active] = NO_DEAL
+    final_stage[active] = game.max_stage
+
+    rows = []
+    for i, (session_code, app, round_number, group_id, human_role, history) in enumerate(groups):
+        stage = int(final_stage[i])
+        proposer = proposer_role(stage)
+        offer = int(offers_by_stage[i, stage - 1])
+        if outcome[i] == UNDETERMINED:
+            p1_payoff, p2_payoff = None, None
+        else:
+            p1_payoff, p2_payoff = export.settle(game, stage, proposer, offer, outcome[i] == AGREED)
+        rows.append([
+            session_code, app, round_number, group_id, human_role, policy.name,
+            *recorded_outcome(game, history),
+            outcome[i], stage, 'human' if proposer == human_role else 'ai',
+            offer if offer >= 0 else None, p1_payoff, p2_payoff,
+            *[int(o) if o >= 0 else None for o in offers_by_stage[i]],
+        ])
+    return rows
+
+
+def _run_chunk(task):
+    """进程池中执行：返回 (行, 本进程新增的 LLM 回答, LLM 统计)"""
+    index, game, groups, seed = task
+    np = simulate._numpy()
+    policy, cache = _worker_state['policy'], _worker_state['cache']
+    before = {key: len(answers) for key, answers in cache.entries.items()} if cache is not None else {}
+    rng = np.random.default_rng([seed, index])
+    rows = replay_chunk(game, groups, policy, rng)
+    new_answers = {}
+    if cache is not None:
+        for key, answers in cache.entries.items():
+            if len(answers) > before.get(key, 0):
+                new_answers[key] = answers[before.get(key, 0):]
+    llm = dict(calls=getattr(policy, 'calls', 0), fallbacks=getattr(policy, 'fallbacks', 0),
+               cache_hits=cache.hits if cache is not None else 0)
+    if hasattr(policy, 'calls'):
+        policy.calls = policy.fallbacks = 0
+    if cache is not None:
+        cache.hits = 0
+    return rows, new_answers, llm
+
+
+def merge_cache(path: str, samples: int, new_answers: list):
+    """把各进程新增的回答合并到缓存文件（每个 prompt 最多 samples 个）"""
+    entries = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+    for answers_by_key in new_answers:
+        for key, answers in answers_by_key.items():
+            kept = entries.setdefault(key, [])
+            kept.extend(answers[:max(samples - len(kept), 0)])
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False)
+
+
+def replay(groups: list, policy_name: str, seed: int, workers: int, chunk_groups: int,
+           llm_mock: bool = False, llm_cache: str = None, llm_samples: int = 5):
+    """
+    返回 (行, LLM 统计)；workers <= 1 或只有一个 chunk 时在本进程中执行。
+    每个 chunk 只含一个 app 的 group，使用该 app 的 C 建立的 GameParams（export.app_game）。
+    """
+    by_app = {}
+    for group in groups:
+        by_app.setdefault(group[1], []).append(group)
+    tasks = []
+    for app, app_groups in by_app.items():
+        game = export.app_game(app)
+        for i in range(0, len(app_groups), chunk_groups):
+            tasks.append((len(tasks), game, app_groups[i:i + chunk_groups], seed))
+    init_args = (policy_name, llm_mock, llm_cache, llm_samples)
+    if workers <= 1 or len(tasks) <= 1:
+        _init_worker(*init_args)
+        results = [_run_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                 initializer=_init_worker, initargs=init_args) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+
+    # MAX_STAGE 不同的 app 一起回放时，stage_N_offer 补齐到最大的 MAX_STAGE
+    width = len(replay_columns(max((task[1].max_stage for task in tasks), default=0)))
+    rows = [row + [None] * (width - len(row)) for chunk_rows, _, _ in results for row in chunk_rows]
+    llm = {key: sum(stats[key] for _, _, stats in results) for key in ('calls', 'fallbacks', 'cache_hits')}
+    if llm_cache and policy_name == 'llm':
+        merge_cache(llm_cache, llm_samples, [answers for _, answers, _ in results])
+    return rows, llm
+
+
+# ----------------- 汇总 -----------------
+
+def _mean(values) -> float:
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 3) if values else None
+
+
+def summarize(rows: list) -> dict:
+    """
+    各 outcome 的 group 数；结果可以推断的 group 中，记录与反事实的达成率，
+    以及人类 / AI 的平均折扣后点数
+    """
+    columns = {name: i for i, name in enumerate(REPLAY_COLUMNS)}
+    outcomes = {key: 0 for key in (AGREED, NO_DEAL, UNDETERMINED)}
+    for row in rows:
+        outcomes[row[columns['outcome']]] += 1
+    determined = [row for row in rows if row[columns['outcome']] != UNDETERMINED
+                  and row[columns['recorded_final_stage']] is not None]
+
+    def payoff(row, prefix, human):
+        role = row[columns['human_role']] if human else other_role(row[columns['human_role']])
+        return row[columns[f'{prefix}{"p1" if role == ROLE_P1 else "p2"}_payoff']]
+
+    summary = dict(groups=len(rows), outcomes=outcomes, determined=len(determined))
+    if determined:
+        summary['recorded'] = dict(
+            agreement_rate=round(sum(1 for r in determined if r[columns['recorded_accepted']]) / len(determined), 4),
+            human_payoff=_mean(payoff(r, 'recorded_', True) for r in determined),
+            ai_payoff=_mean(payoff(r, 'recorded_', False) for r in determined),
+        )
+        summary['counterfactual'] = dict(
+            agreement_rate=round(sum(1 for r in determined if r[columns['outcome']] == AGREED) / len(determined), 4),
+            human_payoff=_mean(payoff(r, '', True) for r in determined),
+            ai_payoff=_mean(payoff(r, '', False) for r in determined),
+        )
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"\n=== replay with {summary['policy']}: {summary['groups']} groups in {summary['seconds']}s")
+    print('outcomes: ' + '  '.join(f'{key}={count}' for key, count in summary['outcomes'].items()))
+    if summary['determined']:
+        print(f"determined groups: {summary['determined']}")
+        print(f"{'':<16}{'agreement':>10}{'human':>9}{'ai':>9}")
+        for kind in ('recorded', 'counterfactual'):
+            d = summary[kind]
+            print(f"{kind:<16}{d['agreement_rate']:>10.2%}{d['human_payoff']:>9}{d['ai_payoff']:>9}")
+    if 'llm' in summary:
+        print(f"llm: {summary['llm']}")
+
+
+def write_rows(rows: list, out_path: str, chunk_size: int, columns: list) -> int:
+    if not out_path.endswith('.parquet'):
+        return export.write_csv(rows, out_path, chunk_size, columns=columns)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit('Parquet 导出需要 pyarrow: pip install pyarrow')
+    values = list(zip(*rows)) if rows else [[] for _ in columns]
+    table = pa.Table.from_arrays([pa.array(list(col)) for col in values], names=columns)
+    pq.write_table(table, out_path, row_group_size=chunk_size)
+    return len(rows)
+
+
+def main(argv=None):
+    ai_apps = sorted(app for app, kind in export.BARGAINING_APPS.items() if kind == 'ai')
+    parser = argparse.ArgumentParser(prog='python -m common.replay')
+    parser.add_argument('--policy', choices=POLICIES, required=True, help='代替当时的 AI 的策略')
+    parser.add_argument('--out', required=True, help='.csv 或 .parquet')
+    parser.add_argument('--apps', nargs='+', default=None, choices=ai_apps)
+    parser.add_argument('--sessions', nargs='*', default=None, help='只回放这些 session code')
+    parser.add_argument('--include-unfinished', action='store_true', help='也回放还在进行中的对局')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-groups', type=int, default=DEFAULT_CHUNK_GROUPS, help='每个任务的 group 数')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--llm-cache', default=None, help='LLM 回答的缓存文件（JSON）')
+    parser.add_argument('--llm-samples', type=int, default=5, help='每个 prompt 缓存的回答数')
+    parser.add_argument('--llm-mock', action='store_true', help='LLM 策略不调用 API，随机回答')
+    parser.add_argument('--report', default=None, help='把汇总写成 JSON')
+    args = parser.parse_args(argv)
+
+    simulate._numpy()
+    if args.policy == 'llm' and not args.llm_mock:
+        simulate.openai_complete()  # 启动进程池之前检查 openai / OPENAI_API_KEY
+
+    conn = db.connect(args.database_url)
+    try:
+        groups = list(iter_groups(conn, args.apps, args.chunk_size, args.sessions,
+                                  finished_only=not args.include_unfinished))
+    finally:
+        conn.close()
+    print(f'[replay] {len(groups)} groups, policy {args.policy}, {args.workers} workers')
+
+    started = time.perf_counter()
+    rows, llm = replay(groups, args.policy, args.seed, args.workers, args.chunk_groups,
+                       args.llm_mock, args.llm_cache, args.llm_samples)
+    seconds = time.perf_counter() - started
+
+    max_stage = max((export.app_game(app).max_stage for app in {group[1] for group in groups}), default=0)
+    count = write_rows(rows, args.out, args.chunk_size, replay_columns(max_stage))
+    summary = summarize(rows)
+    summary['policy'] = args.policy
+    summary['seconds'] = round(seconds, 2)
+    if args.policy == 'llm':
+        summary['llm'] = llm
+    print_summary(summary)
+    print(f'[replay] 写出 {count} 行 -> {args.out}')
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=1)
+        print(f'[replay] 结果已写入 {args.report}')
+
+
+if __name__ == '__main__':
+    main()
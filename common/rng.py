@@ -0,0 +1,67 @@
+"""
+每个 session 的随机数：一个种子，各子系统各自的独立随机数流。
+
+session 创建时决定种子并保存在 session.vars['rng_seed']（admin 的 session 页面可以看到）：
+    session config 中的 rng_seed  >  环境变量 BARGAINING_RNG_SEED  >  随机生成
+之后各处的随机数都由 (种子, 子系统, key...) 经过哈希得到各自的 random.Random：
+    roles      角色分配（creating_session）
+    matching   human_human 的随机配对
+    ai         AI 的 fallback 提议；key 为该决策的 job key（common/jobs.py），
+               worker 进程中也得到相同的提议
+    mock_llm   BARGAINING_AI_POLICY=mock 时 MockLLMClient 的回答；key 同样为 job key
+    payment    FinalResults 的抽签（支付轮次、是否使用 AI 的点数、抽哪一个 AI）
+    bots       bot 测试中 bot 的提议与回应（common/bots.py）
+每个流只由自己的 key 决定，与其他流的使用次数、页面的访问顺序和处理的进程无关，
+所以用同一个种子重新运行（bot 测试、压力测试、回放）时各处的抽签结果相同。
+
+用法（app 中）:
+    role_rng = rng.stream(subsession.session, 'roles', __name__, round_number)
+    role_rng.shuffle(roles)
+
+压力测试 / 基准测试时固定种子:
+    BARGAINING_RNG_SEED=1 otree test human_AI_bargaining1_demo 40
+"""
+import hashlib
+import os
+import random
+import secrets
+
+SEED_ENV = 'BARGAINING_RNG_SEED'
+SEED_KEY = 'rng_seed'
+STREAMS = ('roles', 'matching', 'ai', 'mock_llm', 'payment', 'bots')
+
+
+def new_seed() -> int:
+    """session config / BARGAINING_RNG_SEED 都没有指定时随机生成"""
+    value = os.environ.get(SEED_ENV, '').strip()
+    if value:
+        return int(value)
+    return secrets.randbits(63)
+
+
+def session_seed(session) -> int:
+    """session 的种子；第一次调用时（creating_session）决定并保存到 session.vars"""
+    seed = session.vars.get(SEED_KEY)
+    if seed is None:
+        seed = session.config.get(SEED_KEY)
+        seed = int(seed) if seed not in (None, '') else new_seed()
+        session.vars[SEED_KEY] = seed
+        print(f'[rng] session {session.code}: seed {seed}')
+    return seed
+
+
+def derive(seed: int, name: str, *keys) -> int:
+    """由种子、子系统与 key 得到一个 63 位的种子"""
+    if name not in STREAMS:
+        raise ValueError(f'未知的随机数流: {name}')
+    text = '/'.join(str(part) for part in (seed, name) + keys)
+    return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big') >> 1
+
+
+def stream_seed(session, name: str, *keys) -> int:
+    return derive(session_seed(session), name, *keys)
+
+
+def stream(session, name: str, *keys) -> random.Random:
+    """session 中 (子系统, key...) 的随机数流；相同的参数总是得到相同的随机数序列"""
+    return random.Random(stream_seed(session, name, *keys))
@@ -0,0 +1,417 @@
+"""
+讨价还价游戏的 Monte Carlo 模拟（不经过 oTree 页面）。
+
+实验前评估 AI 策略（fallback / analytical / LLM）对不同的人类行为模型的表现：
+两个角色各指定一个策略，模拟大量的 MAX_STAGE 阶段博弈，输出协议达成率、
+结束 stage 的分布以及各角色点数（折扣前 / 折扣后）的分布。
+
+折扣率、结算点数、均衡提议都来自 common.game.GameParams 的表，与各 app 的
+get_discount_rate / common.transitions.resolve 相同。除 LLM 以外的策略都用 NumPy 按
+批（--batch-size 局）向量化计算，每个 stage 只处理还没有结束的局；
+结果按 (结束 stage, P1 点数) 计数累加，内存占用与局数无关。
+
+LLM 策略使用与 app 相同的 prompt（common.ai），逐局调用，适合小规模的运行：
+    --llm-cache PATH   把回答按 prompt 缓存到 JSON（每个 prompt 最多 --llm-samples 个，
+                       之后从缓存中随机抽取），重复运行不再调用 API
+    --llm-mock         不调用 API，随机回答（检查流程用）
+
+用法:
+    python -m common.simulate --p1 fallback --p2 human --games 1000000
+    python -m common.simulate --p1 human --p2 analytical --human-offer 0.4 0.1 --human-reserve 0.3 0.1
+    python -m common.simulate --p1 llm --p2 human --games 200 --llm-cache llm_cache.json
+    python -m common.simulate --p1 llm --p2 llm --games 50 --llm-mock --report sim.json
+
+需要 numpy: pip install numpy
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from common import ai, game
+from common.ai import ROLE_P1, ROLE_P2, other_role, proposer_role
+
+POLICIES = ('fallback', 'analytical', 'human', 'llm')
+DEFAULT_BATCH_SIZE = 1_000_000
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise SystemExit('模拟需要 numpy: pip install numpy')
+    return numpy
+
+
+# ----------------- 策略 -----------------
+# propose(game, stage, role, previous, rng) -> 每局给对方的点数
+# respond(game, offers, stage, role, previous, rng) -> 每局是否接受
+# previous 为 (局数, stage - 1) 的数组：本局之前各 stage 被拒绝的提议
+
+class FallbackPolicy:
+    """与 API 出错时相同：提议 FALLBACK_OFFER_MIN..MAX 均匀随机，折扣后点数不低于阈值时接受"""
+    name = 'fallback'
+
+    def propose(self, game, stage, role, previous, rng):
+        return rng.integers(ai.FALLBACK_OFFER_MIN, ai.FALLBACK_OFFER_MAX + 1, size=len(previous))
+
+    def respond(self, game, offers, stage, role, previous, rng):
+        return game.fallback_accept(offers, stage, role)
+
+
+class AnalyticalPolicy:
+    """子博弈完美均衡的提议与接受规则"""
+    name = 'analytical'
+
+    def propose(self, game, stage, role, previous, rng):
+        np = _numpy()
+        return np.full(len(previous), game.analytical_offer(stage))
+
+    def respond(self, game, offers, stage, role, previous, rng):
+        return game.analytical_accept(offers, stage)
+
+
+class HumanPolicy:
+    """
+    简单的人类行为模型（参数都是占 endowment 的比例）：
+    提议 ~ N(offer_mean, offer_sd)；每次回应时抽取保留值 ~ N(reserve_mean, reserve_sd)，
+    提议不低于保留值时接受。默认值取自最后通牒博弈中常见的提议（40-50%）与拒绝（20-30% 以下）水平。
+    """
+    name = 'human'
+
+    def __init__(self, offer_mean=0.45, offer_sd=0.10, reserve_mean=0.30, reserve_sd=0.10):
+        self.offer_mean = offer_mean
+        self.offer_sd = offer_sd
+        self.reserve_mean = reserve_mean
+        self.reserve_sd = reserve_sd
+
+    def propose(self, game, stage, role, previous, rng):
+        np = _numpy()
+        shares = rng.normal(self.offer_mean, self.offer_sd, size=len(previous))
+        return np.rint(shares * game.endowment)
+
+    def respond(self, game, offers, stage, role, previous, rng):
+        reserve = rng.normal(self.reserve_mean, self.reserve_sd, size=len(offers))
+        return offers >= reserve * game.endowment
+
+
+class LLMPolicy:
+    """
+    使用与 app 相同的 prompt 逐局询问 LLM。complete(system, prompt, rng) -> 回答文本；
+    回答无法解析或调用出错时与 app 一样改用 fallback 策略（计入 fallbacks）。
+    """
+    name = 'llm'
+
+    def __init__(self, complete):
+        self.complete = complete
+        self.fallback = FallbackPolicy()
+        self.calls = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def _history(previous_row) -> list:
+        return [
+            dict(stage=stage, proposer=proposer_role(stage), offer=int(offer), accepted=False)
+            for stage, offer in enumerate(previous_row, start=1)
+        ]
+
+    def _ask(self, system, prompt, parse, rng):
+        self.calls += 1
+        try:
+            return parse(self.complete(system, prompt, rng))
+        except Exception as e:
+            print(f'[simulate] LLM error, using fallback: {type(e).__name__}: {e}')
+            self.fallbacks += 1
+            return None
+
+    def propose(self, game, stage, role, previous, rng):
+        np = _numpy()
+        offers = self.fallback.propose(game, stage, role, previous, rng)
+        for i, row in enumerate(previous):
+            prompt = ai.propose_prompt(game, stage, role, self._history(row))
+            offer = self._ask(ai.PROPOSE_SYSTEM, prompt, lambda text: ai.parse_offer(text, game.endowment), rng)
+            if offer is not None:
+                offers[i] = offer
+        return np.asarray(offers)
+
+    def respond(self, game, offers, stage, role, previous, rng):
+        np = _numpy()
+        decisions = np.asarray(self.fallback.respond(game, offers, stage, role, previous, rng)).copy()
+        for i, row in enumerate(previous):
+            prompt = ai.respond_prompt(game, int(offers[i]), stage, role, self._history(row))
+            decision = self._ask(ai.RESPOND_SYSTEM, prompt, ai.parse_decision, rng)
+            if decision is not None:
+                decisions[i] = decision
+        return decisions
+
+
+# ----------------- LLM 的回答来源 -----------------
+
+def openai_complete():
+    """与 app 相同的参数调用 OpenAI（需要 OPENAI_API_KEY）"""
+    try:
+        from openai import OpenAI
+    except ImportError:
+        raise SystemExit('LLM 策略需要 openai: pip install openai（或使用 --llm-mock）')
+    if not os.environ.get('OPENAI_API_KEY'):
+        raise SystemExit('LLM 策略需要 OPENAI_API_KEY（或使用 --llm-mock）')
+    client = OpenAI()
+
+    def complete(system, prompt, rng):
+        response = client.chat.completions.create(
+            model=ai.LLM_MODEL,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=1.0,
+            max_tokens=10
+        )
+        return response.choices[0].message.content
+    return complete
+
+
+def mock_complete(system, prompt, rng):
+    """不调用 API 的随机回答"""
+    if system == ai.PROPOSE_SYSTEM:
+        return str(int(rng.integers(0, 101)))
+    return 'ACCEPT' if rng.random() < 0.5 else 'REJECT'
+
+
+class ResponseCache:
+    """
+    按 (model, system, prompt) 缓存 LLM 的回答。temperature=1.0 时同一个 prompt 的回答也不同，
+    所以每个 prompt 保存最多 samples 个回答，之后从中随机抽取。
+    """
+
+    def __init__(self, complete, path: str, samples: int = 5):
+        self.complete = complete
+        self.path = path
+        self.samples = samples
+        self.hits = 0
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(system: str, prompt: str) -> str:
+        return hashlib.sha1(f'{ai.LLM_MODEL}\n{system}\n{prompt}'.encode('utf-8')).hexdigest()
+
+    def __call__(self, system, prompt, rng):
+        answers = self.entries.setdefault(self.key(system, prompt), [])
+        if len(answers) >= self.samples:
+            self.hits += 1
+            return answers[int(rng.integers(len(answers)))]
+        answer = self.complete(system, prompt, rng)
+        answers.append(answer)
+        return answer
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+
+
+# ----------------- 模拟 -----------------
+
+def _p1_points_tables(game):
+    """{(stage, proposer): offer 被接受时 P1 的点数（下标为 offer）}，来自 GameParams.settlements"""
+    np = _numpy()
+    return {key: np.array([row[0] for row in rows]) for key, rows in game.settlements.items()}
+
+
+def play_batch(game, policies: dict, n: int, rng, p1_points_tables: dict):
+    """
+    模拟 n 局，返回 (final_stage, p1_points) 两个数组；final_stage 为 0 表示未达成协议。
+    P2 的点数为 endowment - p1_points（达成协议时）。
+    """
+    np = _numpy()
+    final_stage = np.zeros(n, dtype=np.int64)
+    p1_points = np.zeros(n, dtype=np.int64)
+    offers_by_stage = np.zeros((n, game.max_stage), dtype=np.int64)
+    active = np.arange(n)
+
+    for stage in range(1, game.max_stage + 1):
+        if not len(active):
+            break
+        proposer = proposer_role(stage)
+        responder = other_role(proposer)
+        previous = offers_by_stage[active, :stage - 1]
+
+        offers = np.clip(np.asarray(policies[proposer].propose(game, stage, proposer, previous, rng)),
+                         0, game.endowment).astype(np.int64)
+        offers_by_stage[active, stage - 1] = offers
+        accepted = np.asarray(policies[responder].respond(game, offers, stage, responder, previous, rng), dtype=bool)
+
+        done = active[accepted]
+        final_stage[done] = stage
+        p1_points[done] = p1_points_tables[(stage, proposer)][offers[accepted]]
+        active = active[~accepted]
+
+    return final_stage, p1_points
+
+
+def simulate(game, policies: dict, n_games: int, seed: int = None, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    policies: {ROLE_P1: 策略, ROLE_P2: 策略}。
+    返回 (max_stage + 1, endowment + 1) 的计数：counts[stage, p1_points]，stage 0 为未达成协议。
+    """
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+    tables = _p1_points_tables(game)
+    width = game.endowment + 1
+    counts = np.zeros((game.max_stage + 1) * width, dtype=np.int64)
+
+    remaining = n_games
+    while remaining > 0:
+        n = min(batch_size, remaining)
+        final_stage, p1_points = play_batch(game, policies, n, rng, tables)
+        counts += np.bincount(final_stage * width + p1_points, minlength=len(counts))
+        remaining -= n
+    return counts.reshape(game.max_stage + 1, width)
+
+
+def _distribution(values, weights) -> dict:
+    """加权的均值、标准差与分位数"""
+    np = _numpy()
+    order = np.argsort(values, kind='stable')
+    values, weights = values[order], weights[order]
+    total = weights.sum()
+    mean = float((values * weights).sum() / total)
+    sd = float(np.sqrt((weights * (values - mean) ** 2).sum() / total))
+    cumulative = np.cumsum(weights)
+    result = dict(mean=round(mean, 3), sd=round(sd, 3))
+    for q in PERCENTILES:
+        index = min(int(np.searchsorted(cumulative, total * q / 100)), len(values) - 1)
+        result[f'p{q}'] = round(float(values[index]), 3)
+    return result
+
+
+def summarize(game, counts) -> dict:
+    """达成率、结束 stage 的分布、各角色点数（折扣前 / 折扣后，未达成协议为 0）的分布"""
+    np = _numpy()
+    n_games = int(counts.sum())
+    by_stage = counts.sum(axis=1)
+    points = np.arange(game.endowment + 1)
+
+    summary = dict(
+        games=n_games,
+        agreement_rate=round(1 - by_stage[0] / n_games, 4),
+        stage_distribution={str(stage): round(by_stage[stage] / n_games, 4)
+                            for stage in range(1, game.max_stage + 1)},
+        roles={},
+    )
+    summary['stage_distribution']['no_deal'] = round(by_stage[0] / n_games, 4)
+
+    stages = np.repeat(np.arange(game.max_stage + 1), game.endowment + 1)
+    weights = counts.ravel()
+    p1_points = np.tile(points, game.max_stage + 1)
+    agreed = stages > 0
+    for role in (ROLE_P1, ROLE_P2):
+        role_points = p1_points if role == ROLE_P1 else game.endowment - p1_points
+        role_points = np.where(agreed, role_points, 0)
+        rates = np.array([game.discount_rate(max(stage, 1), role) for stage in stages])
+        keep = weights > 0
+        summary['roles'][role] = dict(
+            points=_distribution(role_points[keep], weights[keep]),
+            discounted=_distribution((role_points * rates)[keep], weights[keep]),
+        )
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"\n=== {summary['policies'][ROLE_P1]} (P1) vs {summary['policies'][ROLE_P2]} (P2): "
+          f"{summary['games']} games in {summary['seconds']}s")
+    print(f"agreement rate: {summary['agreement_rate']:.2%}")
+    print('final stage:   ' + '  '.join(f'{stage}={share:.2%}'
+                                       for stage, share in summary['stage_distribution'].items()))
+    columns = ['mean', 'sd'] + [f'p{q}' for q in PERCENTILES]
+    print(f"{'':<16}" + ''.join(f'{c:>9}' for c in columns))
+    for role, dists in summary['roles'].items():
+        for kind, d in dists.items():
+            print(f'{role + " " + kind:<16}' + ''.join(f'{d[c]:>9}' for c in columns))
+    if 'llm' in summary:
+        print(f"llm: {summary['llm']}")
+
+
+def build_policy(name: str, args, llm_complete):
+    if name == 'fallback':
+        return FallbackPolicy()
+    if name == 'analytical':
+        return AnalyticalPolicy()
+    if name == 'human':
+        return HumanPolicy(*args.human_offer, *args.human_reserve)
+    return LLMPolicy(llm_complete)
+
+
+def main(argv=None):
+    from common import export
+
+    parser = argparse.ArgumentParser(prog='python -m common.simulate')
+    parser.add_argument('--p1', choices=POLICIES, default='fallback', help='P1 的策略')
+    parser.add_argument('--p2', choices=POLICIES, default='human', help='P2 的策略')
+    parser.add_argument('--games', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--app', choices=sorted(export.BARGAINING_APPS), default='human_AI_bargaining1',
+                        help='没有指定以下参数时使用该 app 的 C')
+    parser.add_argument('--endowment', type=int, default=None)
+    parser.add_argument('--max-stage', type=int, default=None)
+    parser.add_argument('--discount-p1', type=float, default=None)
+    parser.add_argument('--discount-p2', type=float, default=None)
+    parser.add_argument('--human-offer', nargs=2, type=float, default=[0.45, 0.10], metavar=('MEAN', 'SD'),
+                        help='human 策略的提议（占 endowment 的比例）')
+    parser.add_argument('--human-reserve', nargs=2, type=float, default=[0.30, 0.10], metavar=('MEAN', 'SD'),
+                        help='human 策略的保留值（占 endowment 的比例）')
+    parser.add_argument('--llm-cache', default=None, help='LLM 回答的缓存文件（JSON）')
+    parser.add_argument('--llm-samples', type=int, default=5, help='每个 prompt 缓存的回答数')
+    parser.add_argument('--llm-mock', action='store_true', help='LLM 策略不调用 API，随机回答')
+    parser.add_argument('--report', default=None, help='把结果写成 JSON')
+    args = parser.parse_args(argv)
+
+    defaults = export.app_game(args.app)
+    params = game.GameParams(
+        defaults.endowment if args.endowment is None else args.endowment,
+        defaults.max_stage if args.max_stage is None else args.max_stage,
+        defaults.base_discount[ROLE_P1] if args.discount_p1 is None else args.discount_p1,
+        defaults.base_discount[ROLE_P2] if args.discount_p2 is None else args.discount_p2,
+    )
+
+    llm_complete, cache = None, None
+    if 'llm' in (args.p1, args.p2):
+        llm_complete = mock_complete if args.llm_mock else openai_complete()
+        if args.llm_cache:
+            llm_complete = cache = ResponseCache(llm_complete, args.llm_cache, args.llm_samples)
+    policies = {ROLE_P1: build_policy(args.p1, args, llm_complete),
+                ROLE_P2: build_policy(args.p2, args, llm_complete)}
+
+    started = time.perf_counter()
+    try:
+        counts = simulate(params, policies, args.games, args.seed, args.batch_size)
+    finally:
+        if cache is not None:
+            cache.save()
+    seconds = time.perf_counter() - started
+
+    summary = summarize(params, counts)
+    summary['policies'] = {role: policy.name for role, policy in policies.items()}
+    summary['seconds'] = round(seconds, 2)
+    llm_policies = [policy for policy in policies.values() if isinstance(policy, LLMPolicy)]
+    if llm_policies:
+        summary['llm'] = dict(
+            calls=sum(policy.calls for policy in set(llm_policies)),
+            fallbacks=sum(policy.fallbacks for policy in set(llm_policies)),
+            cache_hits=cache.hits if cache is not None else None,
+        )
+    print_summary(summary)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=1)
+        print(f'\n[simulate] 结果已写入 {args.report}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+讨价还价 app 的阶段页面。
+
+oTree 的 page_sequence 是固定的列表，同一个页面类在一轮中最多显示一次，所以 MAX_STAGE 个 stage
+仍然需要 MAX_STAGE 组提议 / 回应页面。这些页面不再手写成 Bargain_Propose_Stage2 / _Stage3 ...，
+而是由 stage_pages() 按 MAX_STAGE 从 app 的 stage 1 页面生成（名称不变：Bargain_Propose,
+Bargain_Propose_Stage2, ...，模板共用 stage 1 的模板）。
+
+路由：app 提供 current_step(player)，由 group 的状态算出本轮当前的步骤 (kind, stage)，
+本轮结束时返回 None。每个生成的页面的 is_displayed 只比较这一个值与自己的 (kind, stage)，
+不再在每个页面里分别检查 finished / stage / 角色。
+"""
+
+
+def page_name(base_name: str, stage: int) -> str:
+    return base_name if stage == 1 else f'{base_name}_Stage{stage}'
+
+
+def _step_is_displayed(current_step, step: tuple):
+    def is_displayed(player):
+        return current_step(player) == step
+    return is_displayed
+
+
+def stage_pages(steps: list, current_step, max_stage: int, namespace: dict) -> list:
+    """
+    steps: 一个 stage 内的页面顺序 [(kind, stage 1 的页面类, stage 2 起覆盖的类属性 dict 或 None), ...]
+    current_step: player -> (kind, stage) 或 None
+    生成 stage 2..max_stage 的页面类并放进 namespace（app 的 globals()，bot 测试可以直接引用），
+    返回按顺序排列的全部阶段页面，用于 page_sequence。
+    """
+    pages = []
+    for stage in range(1, max_stage + 1):
+        for kind, base, later_attrs in steps:
+            step = (kind, stage)
+            if stage == 1:
+                page_class = base
+            else:
+                app = base.__module__.split('.')[0]
+                attrs = dict(__module__=base.__module__, __doc__=base.__doc__)
+                # 普通页面共用 stage 1 的模板；等待页面使用 oTree 的默认模板
+                if not hasattr(base, 'wait_for_all_groups') and 'template_name' not in base.__dict__:
+                    attrs['template_name'] = f'{app}/{base.__name__}.html'
+                attrs.update(later_attrs or {})
+                page_class = type(page_name(base.__name__, stage), (base,), attrs)
+                namespace[page_class.__name__] = page_class
+            page_class.step = step
+            page_class.is_displayed = staticmethod(_step_is_displayed(current_step, step))
+            pages.append(page_class)
+    return pages
+
+
+def pages_by_stage(pages: list, kind: str) -> dict:
+    """{stage: 页面类}，例如 bot 测试中按 stage 找到提议页面"""
+    return {page.step[1]: page for page in pages if page.step[0] == kind}
+
+
+def add_stage_fields(player_class, max_stage: int):
+    """
+    在 Player 上加 stage_1_offer .. stage_{max_stage}_offer 与 stage_1_accepted .. stage_{max_stage}_accepted
+    （人类 vs 人类的 app 记录每个 stage 的提议与回应）。在 Player 类定义之后调用。
+    """
+    from otree.api import models
+
+    for n in range(1, max_stage + 1):
+        setattr(player_class, f'stage_{n}_offer', models.IntegerField(blank=True, initial=None))
+    for n in range(1, max_stage + 1):
+        setattr(player_class, f'stage_{n}_accepted', models.BooleanField(blank=True, initial=None))
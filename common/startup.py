@@ -0,0 +1,150 @@
+"""
+服务器启动：只加载需要的 session config，以及各 app 模块的导入耗时 / 内存报告。
+
+oTree 启动时导入 SESSION_CONFIGS 中所有 app_sequence 的 app（3 个 config 共 11 个 app），
+讨价还价 app 的模块还要生成各 stage 的页面类。一个进程只运行一个实验时（例如 common/cluster.py
+的每个 room 一个进程，或 bot 压力测试），设置 BARGAINING_SESSION_CONFIGS（逗号分隔的 config 名）后
+settings.py 只保留这些 config，其他 app 不再导入，启动更快，每个进程占用的内存也更少：
+    BARGAINING_SESSION_CONFIGS=human_AI_bargaining1_demo otree prodserver 8000
+
+python -m common.startup 在新的子进程中逐个导入 app（先导入 otree 与 settings，只计 app 自己的部分），
+报告导入耗时、最大 RSS 的增量，以及 app 导入中自身耗时最长的模块（python -X importtime）。
+用法:
+    python -m common.startup
+    python -m common.startup --configs human_AI_bargaining1_demo --top 5 --report startup.json
+
+这个模块由 settings.py 导入，模块级只导入 os。
+"""
+import os
+
+SESSION_CONFIGS_ENV = 'BARGAINING_SESSION_CONFIGS'
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_MARKER = '-- app import --'
+
+# 在子进程中执行：先导入 otree 与 settings，再导入 app，输出 JSON
+PROBE = '''
+import importlib, json, resource, sys, time
+sys.path.insert(0, {project_dir!r})
+started = time.perf_counter()
+import otree.api
+import settings
+base_seconds = time.perf_counter() - started
+base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+sys.stderr.write({marker!r} + chr(10))
+sys.stderr.flush()
+started = time.perf_counter()
+importlib.import_module({app!r})
+app_seconds = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(dict(base_seconds=base_seconds, base_rss_kb=base_rss, app_seconds=app_seconds, rss_kb=rss)))
+'''
+
+
+def select_session_configs(configs: list) -> list:
+    """settings.py 中调用：BARGAINING_SESSION_CONFIGS 已设置时只保留这些 config"""
+    value = os.environ.get(SESSION_CONFIGS_ENV, '').strip()
+    if not value:
+        return configs
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    known = {config['name'] for config in configs}
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        print(f'[startup] {SESSION_CONFIGS_ENV}: unknown session configs {unknown}')
+    selected = [config for config in configs if config['name'] in names]
+    if not selected:
+        print(f'[startup] {SESSION_CONFIGS_ENV} selects no session config, loading all')
+        return configs
+    return selected
+
+
+def app_names(configs: list) -> list:
+    """各 config 的 app_sequence 中的 app（按出现顺序，不重复）"""
+    apps = []
+    for config in configs:
+        for app in config['app_sequence']:
+            if app not in apps:
+                apps.append(app)
+    return apps
+
+
+def parse_importtime(stderr: str, top: int) -> list:
+    """APP_MARKER 之后（app 导入中）自身耗时最长的模块 [(模块, 自身毫秒, 累计毫秒), ...]"""
+    if APP_MARKER not in stderr:
+        return []
+    rows = []
+    for line in stderr.split(APP_MARKER, 1)[1].splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), round(int(self_us) / 1000, 1), round(int(cumulative_us) / 1000, 1)))
+    return sorted(rows, key=lambda row: -row[1])[:top]
+
+
+def profile_app(app: str, top: int) -> dict:
+    import json
+    import subprocess
+    import sys
+
+    probe = PROBE.format(project_dir=PROJECT_DIR, marker=APP_MARKER, app=app)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe],
+                          cwd=PROJECT_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        error = (proc.stderr.strip().splitlines() or ['?'])[-1]
+        return dict(app=app, ok=False, error=error)
+    data = json.loads(proc.stdout.strip().splitlines()[-1])
+    return dict(
+        app=app,
+        ok=True,
+        import_ms=round(data['app_seconds'] * 1000, 1),
+        rss_delta_mb=round((data['rss_kb'] - data['base_rss_kb']) / 1024, 1),
+        base_import_ms=round(data['base_seconds'] * 1000, 1),
+        base_rss_mb=round(data['base_rss_kb'] / 1024, 1),
+        slowest_modules=[dict(module=m, self_ms=s, cumulative_ms=c) for m, s, c in parse_importtime(proc.stderr, top)],
+    )
+
+
+def print_results(results: list):
+    ok = [r for r in results if r['ok']]
+    if ok:
+        print(f"\notree + settings: {ok[0]['base_import_ms']} ms, {ok[0]['base_rss_mb']} MB")
+    print(f"\n{'app':<32}{'import ms':>12}{'+RSS MB':>10}  slowest modules (self ms)")
+    for r in results:
+        if not r['ok']:
+            print(f"{r['app']:<32}{'error':>12}{'':>10}  {r['error']}")
+            continue
+        slowest = ', '.join(f"{m['module']} {m['self_ms']}" for m in r['slowest_modules'])
+        print(f"{r['app']:<32}{r['import_ms']:>12}{r['rss_delta_mb']:>10}  {slowest}")
+    if ok:
+        print(f"{'total':<32}{round(sum(r['import_ms'] for r in ok), 1):>12}"
+              f"{round(sum(r['rss_delta_mb'] for r in ok), 1):>10}")
+
+
+def main(argv=None):
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(prog='python -m common.startup')
+    parser.add_argument('--configs', nargs='*', default=None, help='只报告这些 session config 的 app（默认全部）')
+    parser.add_argument('--top', type=int, default=3, help='每个 app 显示的最慢模块数')
+    parser.add_argument('--report', default=None, help='把结果写成 JSON')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, PROJECT_DIR)
+    import settings
+    configs = settings.SESSION_CONFIGS
+    if args.configs:
+        configs = [config for config in configs if config['name'] in args.configs]
+    apps = app_names(configs)
+    print(f'[startup] {len(configs)} session configs, {len(apps)} apps')
+    results = [profile_app(app, args.top) for app in apps]
+    print_results(results)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f'\n[startup] 结果已写入 {args.report}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+超时与掉队处理。
+
+session config:
+    decision_timeout_seconds   提议 / 回应页面的时限（0 = 不限时，默认）
+    results_timeout_seconds    每轮结果页面的时限（0 = 不限时），避免一人停在结果页拖住全员
+    straggler_policy           'default'：超时时提议 0 点、拒绝（原来的行为）
+                               'ai'：超时时按子博弈完美均衡（common.ai 的 analytical 策略）代为决定；
+                                     human_human 中连续超时达到 takeover_after_timeouts 次后，
+                                     该参与者之后的决定由 AI 接管（页面只保留 takeover_timeout_seconds），
+                                     参与者在时限内自己提交即恢复
+    takeover_after_timeouts    默认 1
+    takeover_timeout_seconds   默认 5
+"""
+
+DEFAULT_TAKEOVER_AFTER = 1
+DEFAULT_TAKEOVER_TIMEOUT = 5
+
+
+def get_policy(session) -> str:
+    return session.config.get('straggler_policy', 'default')
+
+
+def _seconds(session, key: str):
+    seconds = session.config.get(key) or 0
+    return seconds if seconds > 0 else None
+
+
+def is_taken_over(player) -> bool:
+    return bool(player.participant.vars.get('ai_takeover'))
+
+
+def decision_timeout(player):
+    """提议 / 回应页面的 get_timeout_seconds；None 表示不限时"""
+    timeout = _seconds(player.session, 'decision_timeout_seconds')
+    if timeout and is_taken_over(player):
+        return min(timeout, player.session.config.get('takeover_timeout_seconds', DEFAULT_TAKEOVER_TIMEOUT))
+    return timeout
+
+
+def results_timeout(player):
+    return _seconds(player.session, 'results_timeout_seconds')
+
+
+def default_offer(player, game, stage: int) -> int:
+    """超时时代为提议的点数；game 为 app 的 common.game.GameParams"""
+    if get_policy(player.session) == 'ai':
+        return game.analytical_offer(stage)
+    return 0
+
+
+def default_accept(player, game, offer: int, stage: int) -> bool:
+    """超时时代为回应"""
+    if get_policy(player.session) == 'ai':
+        return game.analytical_accept(offer, stage)
+    return False
+
+
+def note_decision(player, timeout_happened: bool, allow_takeover: bool = False):
+    """
+    在提议 / 回应页面的 before_next_page 中调用，记录超时次数；
+    allow_takeover 时（human_human）连续超时后由 AI 接管，本人提交后解除。
+    """
+    participant = player.participant
+    if not timeout_happened:
+        participant.vars['consecutive_timeouts'] = 0
+        if participant.vars.get('ai_takeover'):
+            participant.ai_takeover = False
+            print(f"[straggler] Participant {participant.id_in_session} is back, AI takeover ended")
+        return
+
+    participant.vars['timeouts'] = participant.vars.get('timeouts', 0) + 1
+    consecutive = participant.vars.get('consecutive_timeouts', 0) + 1
+    participant.vars['consecutive_timeouts'] = consecutive
+
+    takeover_after = player.session.config.get('takeover_after_timeouts', DEFAULT_TAKEOVER_AFTER)
+    if (allow_takeover and get_policy(player.session) == 'ai'
+            and consecutive >= takeover_after and not participant.vars.get('ai_takeover')):
+        participant.ai_takeover = True
+        print(f"[straggler] Participant {participant.id_in_session} timed out {consecutive} times, "
+              f"AI takes over")
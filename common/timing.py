@@ -0,0 +1,182 @@
+"""
+页面级耗时统计。
+
+instrument_pages(page_sequence) 包装每个页面自己定义的 is_displayed /
+vars_for_template / before_next_page / after_all_players_arrive，把耗时记录到
+按 (app, page, hook, stage) 分类的直方图中（只在内存里，开销为一次计时和一次加锁）。
+
+查看方式：
+    - FinalResults 的 admin 报告页（Reports 标签）
+    - 设置 PAGE_TIMINGS_PATH 时，服务器进程结束前写出 JSON；也可以调用 dump_json()
+设置 PAGE_TIMING=0 可以关闭。
+
+同时在 is_displayed 返回 True 时更新参与者当前所在的页面（common.metrics）；
+没有定义 is_displayed 的页面会补上一个总是返回 True 的版本。
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+HOOKS = ('is_displayed', 'vars_for_template', 'before_next_page', 'after_all_players_arrive')
+
+# 直方图桶的上界（毫秒），最后一个桶为 +inf
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float('inf'))
+
+TIMINGS_PATH_ENV = 'PAGE_TIMINGS_PATH'
+
+_lock = threading.Lock()
+_local = threading.local()
+_histograms = {}
+
+
+def enabled() -> bool:
+    return os.environ.get('PAGE_TIMING', '1') != '0'
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q: float) -> float:
+        """按桶的上界估计分位数（落在最后一个桶时返回最大值）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        return dict(
+            count=self.count,
+            mean_ms=round(self.total_ms / self.count, 2) if self.count else 0,
+            p50_ms=round(self.quantile(0.5), 2),
+            p95_ms=round(self.quantile(0.95), 2),
+            max_ms=round(self.max_ms, 2),
+            buckets={('+inf' if b == float('inf') else str(b)): n for b, n in zip(BUCKETS_MS, self.counts)},
+        )
+
+
+def observe(app: str, page: str, hook: str, stage, ms: float):
+    key = (app, page, hook, stage)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(ms)
+
+
+def get_stage(obj):
+    """从 player / group 取得当前 stage；没有 stage 的 app 返回 None"""
+    group = obj if hasattr(obj, 'get_players') else getattr(obj, 'group', None)
+    return getattr(group, 'stage', None)
+
+
+def always_displayed(player):
+    return True
+
+
+def timed_hook(app: str, page: str, hook: str, func, on_displayed=None):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # Stage2/3 的页面会调用 Stage1 页面的方法，只记录最外层，避免重复计数
+        if getattr(_local, 'active', False):
+            return func(*args, **kwargs)
+        # 页面的 hook 以 player 为第一个参数；noself 等待页面的 after_all_players_arrive
+        # 由 oTree 以关键字参数 subsession= / group= 调用
+        obj = args[0] if args else next(iter(kwargs.values()), None)
+        stage = get_stage(obj)
+        _local.active = True
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _local.active = False
+            observe(app, page, hook, stage, (time.perf_counter() - started) * 1000)
+        if on_displayed is not None and result:
+            on_displayed(obj)
+        return result
+    wrapper._timed = True
+    return wrapper
+
+
+def instrument_pages(page_sequence: list) -> list:
+    """包装页面类上定义的 hook（原地修改），返回 page_sequence"""
+    if not enabled():
+        return page_sequence
+    from common import metrics
+    metrics.start_server_from_env()
+
+    for page_class in page_sequence:
+        app = page_class.__module__.split('.')[0]
+        page = page_class.__name__
+        is_wait_page = hasattr(page_class, 'wait_for_all_groups')
+        if 'is_displayed' not in page_class.__dict__:
+            page_class.is_displayed = staticmethod(always_displayed)
+        for hook in HOOKS:
+            attr = page_class.__dict__.get(hook)
+            if not isinstance(attr, staticmethod):
+                continue
+            func = attr.__func__
+            if getattr(func, '_timed', False):
+                continue
+            on_displayed = None
+            if hook == 'is_displayed':
+                on_displayed = functools.partial(_page_seen, metrics, app, page, is_wait_page)
+            setattr(page_class, hook, staticmethod(timed_hook(app, page, hook, func, on_displayed)))
+    return page_sequence
+
+
+def _page_seen(metrics, app, page, is_wait_page, player):
+    metrics.page_seen(player, app, page, is_wait_page)
+
+
+def snapshot() -> list:
+    """[{app, page, hook, stage, count, mean_ms, p50_ms, ...}, ...]，按 app / page 排序"""
+    with _lock:
+        items = [(key, h.to_dict()) for key, h in _histograms.items()]
+    rows = []
+    for (app, page, hook, stage), stats in sorted(items, key=lambda kv: tuple(str(k) for k in kv[0])):
+        rows.append(dict(app=app, page=page, hook=hook, stage=stage, **stats))
+    return rows
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def dump_json(path: str = None):
+    path = path or os.environ.get(TIMINGS_PATH_ENV)
+    if not path:
+        return
+    rows = snapshot()
+    if not rows:
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=1)
+    print(f'[timing] Page timings written to {path}')
+
+
+atexit.register(dump_json)
@@ -0,0 +1,98 @@
+"""
+讨价还价一步（提议被接受 / 被拒绝）的状态转移，按 model 合并写入。
+
+以前 before_next_page 逐个给 g.accepted / g.finished / g.stage / g.proposer / g.offer_points /
+p.offer_points / payoff ... 赋值，中间还穿插 g.get_players() 等查询；查询会触发 SQLAlchemy 的
+autoflush，同一行在一次请求中被 UPDATE 多次。现在：
+    resolve()  只根据当前的 stage / proposer / offer / 是否接受，算出 group 的 delta 和各角色的 payoff
+               （不读写数据库）
+    write()    在最后一次性写入 [(model 实例, delta), ...]：值没有变化的字段不写，写完立即 flush，
+               每个被修改的行只发出一条 UPDATE
+
+write() 记录每次 flush 发出的 SQL 语句数与被修改的行数（STATS），bot 测试（tests.py）用
+check_statement_bound() 确认每次转移的语句数不超过被修改的行数（每行一条 UPDATE）与给定的上限。
+"""
+from collections import deque
+
+from common.ai import ROLE_P1, ROLE_P2, other_role
+
+# 最近的 write() 的 dict(label, rows, statements)
+STATS = deque(maxlen=10000)
+
+
+def resolve(game, stage: int, proposer: str, offer: int, accepted: bool) -> tuple:
+    """
+    返回 (group_delta, payoffs)。payoffs 为 {role: 折扣后点数}，本轮未结束时为 None。
+    被拒绝时进入下一 stage 并交换提议者；最后一个 stage 被拒绝时本轮结束，双方为 0。
+    """
+    delta = dict(offer_points=offer, accepted=accepted)
+    if not accepted:
+        delta['stage'] = stage + 1
+        if stage < game.max_stage:
+            delta.update(proposer=other_role(proposer), offer_points=0)
+            return delta, None
+
+    p1_points, p2_points, p1_discounted, p2_discounted = game.settle(stage, proposer, offer, accepted)
+    delta.update(
+        finished=True,
+        p1_points=p1_points,
+        p2_points=p2_points,
+        p1_discounted_points=p1_discounted,
+        p2_discounted_points=p2_discounted,
+    )
+    return delta, {ROLE_P1: p1_discounted, ROLE_P2: p2_discounted}
+
+
+def changed_fields(instance, delta: dict) -> dict:
+    return {name: value for name, value in delta.items() if instance.field_maybe_none(name) != value}
+
+
+def write(writes: list, label: str = ''):
+    """按 [(model 实例, delta), ...] 一次性写入，并 flush（统计语句数）"""
+    rows = 0
+    for instance, delta in writes:
+        changes = changed_fields(instance, delta)
+        for name, value in changes.items():
+            setattr(instance, name, value)
+        rows += bool(changes)
+    if writes:
+        _flush_and_count(writes[0][0], label, rows)
+
+
+def _flush_and_count(instance, label: str, rows: int):
+    """flush 本次请求的 session，记录发出的 SQL 语句数；不是 SQLAlchemy 的实例时什么也不做"""
+    try:
+        from sqlalchemy import event
+        from sqlalchemy.orm import object_session
+    except ImportError:
+        return
+    session = object_session(instance)
+    if session is None:
+        return
+    # 同一 session 中其他被修改的行（例如 participant）也会在这次 flush 中写入，一并计入
+    rows = max(rows, sum(1 for obj in session.dirty if session.is_modified(obj)))
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    bind = session.get_bind()
+    event.listen(bind, 'before_cursor_execute', count)
+    try:
+        session.flush()
+    finally:
+        event.remove(bind, 'before_cursor_execute', count)
+    STATS.append(dict(label=label, rows=rows, statements=len(statements)))
+
+
+def check_statement_bound(max_statements: int = None) -> int:
+    """
+    检查记录的每次转移：SQL 语句数不超过被修改的行数（每行一条 UPDATE），
+    且不超过 max_statements（例如 group + 玩家 + participant）。返回检查过的转移数。
+    """
+    for s in STATS:
+        assert s['statements'] <= s['rows'], (
+            f"{s['label']}: {s['statements']} statements for {s['rows']} modified rows")
+        assert max_statements is None or s['statements'] <= max_statements, (
+            f"{s['label']}: {s['statements']} statements (bound {max_statements})")
+    return len(STATS)
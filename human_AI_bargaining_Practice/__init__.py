@@ -1,21 +1,9 @@
 from otree.api import *
-import random
-import os
 
-
-# 延迟导入 OpenAI,避免初始化时的导入错误
-def get_openai_client():
-    """获取 OpenAI 客户端"""
-    try:
-        from openai import OpenAI
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if api_key is None:
-            print("[OpenAI] Warning: OPENAI_API_KEY not set")
-            return None
-        return OpenAI(api_key=api_key)
-    except Exception as e:
-        print(f"[OpenAI] Failed to initialize client: {e}")
-        return None
+from common import assets, game, jobs, rng, stages, transitions
+from common.ai import decide_accept, decide_offer
+from common.metrics import track_ai_call
+from common.timing import instrument_pages
 
 
 doc = """
@@ -38,6 +26,10 @@ class C(BaseConstants):
     DISCOUNT_P2 = 0.4
 
 
+# 折扣率与结算点数的预先计算表（common/game.py）
+GAME = game.GameParams.from_constants(C)
+
+
 class Subsession(BaseSubsession):
     pass
 
@@ -82,7 +74,7 @@ def creating_session(subsession: Subsession):
             roles = [C.ROLE_P1] * num_p1 + [C.ROLE_P2] * num_p2
 
             # 随机打乱角色列表
-            random.shuffle(roles)
+            rng.stream(subsession.session, 'roles', __name__, round_num).shuffle(roles)
 
             print(f"\n--- Round {round_num} ---")
             print(f"角色分配: {num_p1} 个 P1, {num_p2} 个 P2")
@@ -135,7 +127,7 @@ def creating_session_practice(subsession: Subsession):
     roles = [C.ROLE_P1] * num_p1 + [C.ROLE_P2] * num_p2
 
     # 随机打乱角色列表
-    random.shuffle(roles)
+    rng.stream(subsession.session, 'roles', __name__, subsession.round_number).shuffle(roles)
 
     # 分配角色给玩家
     for i, p in enumerate(players):
@@ -179,6 +171,13 @@ class Group(BaseGroup):
     # AI 相关字段
     ai_offer = models.IntegerField(initial=0, min=0, max=C.ENDOWMENT)
     ai_accepted = models.BooleanField(initial=False)
+    # AI 提议的来源（llm/fallback）与耗时，写入历史记录时使用
+    ai_offer_source = models.StringField(initial='')
+    ai_offer_latency_ms = models.FloatField(initial=0)
+    # 本 stage 的 AI 提议已决定（刷新回应页面时不再重新决策）
+    ai_offer_ready = models.BooleanField(initial=False)
+    # 等待 AI worker 的任务 id，0 表示没有（见 common/jobs.py）
+    ai_job_id = models.IntegerField(initial=0)
 
     # 历史记录字段
     history_json = models.LongStringField(initial='[]')
@@ -216,183 +215,69 @@ def get_history_from_group(g: Group) -> list:
         return []
 
 
-def add_history_entry(g: Group, stage: int, proposer: str, offer: int, accepted: bool):
-    """添加历史记录条目"""
+def history_with_entry(history: list, stage: int, proposer: str, offer: int, accepted: bool,
+                       ai_source: str = None, ai_latency_ms: float = None) -> str:
+    """追加一条历史记录，返回新的 history_json（由 apply_transition 写入）"""
     import json
-    history = get_history_from_group(g)
-    history.append({
+    history = history + [{
         'stage': stage,
         'proposer': proposer,
         'offer': offer,
-        'accepted': accepted
-    })
-    g.history_json = json.dumps(history)
-
-
-def format_history_for_ai(history: list) -> str:
-    """将历史记录格式化为人类可读的文本"""
-    if not history:
-        return "No previous offers in this round."
-
-    lines = []
-    for entry in history:
-        stage = entry['stage']
-        proposer = entry['proposer']
-        offer = entry['offer']
-        accepted = entry['accepted']
-        status = "ACCEPTED" if accepted else "REJECTED"
-        lines.append(f"Stage {stage}: {proposer} offered {offer} points → {status}")
-
-    return "\n".join(lines)
-
-
-def ai_propose(stage: int, ai_role: str, history: list = None) -> int:
-    """使用ChatGPT API决定AI的提议"""
-    client = get_openai_client()
-
-    if client is None:
-        fallback_offer = random.randint(40, 60)
-        print(f"[ai_propose] Using fallback offer: {fallback_offer}")
-        return fallback_offer
-
-    discount_rate = get_discount_rate(stage, ai_role)
-    opponent_role = C.ROLE_P2 if ai_role == C.ROLE_P1 else C.ROLE_P1
-    opponent_discount = get_discount_rate(stage, opponent_role)
-
-    history_text = format_history_for_ai(history or [])
-
-    prompt = f"""You are the proposer in a 3-stage alternating-offers bargaining game over {C.ENDOWMENT} points.
-Goal: maximize your own discounted payoff. Your opponent is human。
-
-- Total points to divide: {C.ENDOWMENT}
-- Your role: {ai_role}
-- Current stage: {stage} out of {C.MAX_STAGE}
-- Your discount rate at this stage: {discount_rate}
-- Opponent's discount rate: {opponent_discount}
-
-Previous negotiation history in this round:
-{history_text}
-
-Rules:
-- You propose how many points to give to your opponent (0-{C.ENDOWMENT})
-- You keep the remaining points
-- If the offer is rejected, the game moves to the next stage with higher discounts
-- If this is stage {C.MAX_STAGE}, this is the last chance to make a deal
-
-Based on the negotiation history and current situation, what points would you offer to your opponent? 
-Please respond with ONLY a number between 0 and {C.ENDOWMENT}."""
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a strategic bargaining game AI. Respond only with a number."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1.0,
-            max_tokens=10
-        )
-
-        offer = int(response.choices[0].message.content.strip())
-        offer = max(0, min(C.ENDOWMENT, offer))
-
-        print(f"[ai_propose] AI (Role={ai_role}, Stage={stage}) proposes: {offer}")
-        return offer
-
-    except Exception as e:
-        print(f"[ai_propose] API Error: {e}")
-        fallback_offer = random.randint(40, 60)
-        print(f"[ai_propose] Using fallback offer: {fallback_offer}")
-        return fallback_offer
-
-
-def ai_respond(offer: int, stage: int, ai_role: str, history: list = None) -> bool:
-    """使用ChatGPT API决定AI是否接受提议"""
-    client = get_openai_client()
-
-    if client is None:
-        discount_rate = get_discount_rate(stage, ai_role)
-        discounted_offer = offer * discount_rate
-        threshold = 35 if stage == 1 else (25 if stage == 2 else 15)
-        return discounted_offer >= threshold
-
-    discount_rate = get_discount_rate(stage, ai_role)
-    discounted_offer = offer * discount_rate
-    opponent_role = C.ROLE_P2 if ai_role == C.ROLE_P1 else C.ROLE_P1
-    opponent_discount = get_discount_rate(stage, opponent_role)
-
-    history_text = format_history_for_ai(history or [])
-
-    next_stage_info = ""
-    if stage < C.MAX_STAGE:
-        next_discount = get_discount_rate(stage + 1, ai_role)
-        next_stage_info = f"\n- If you reject, the game moves to stage {stage + 1}, where your discount rate would be {next_discount}"
-    else:
-        next_stage_info = f"\n- This is the FINAL stage. If you reject, both players get 0 points."
-
-    prompt = f"""You are playing a 3-stage alternating-offers bargaining game. Here's the situation:
-    
-- Total points: {C.ENDOWMENT}
-- Your role: {ai_role}
-- Current stage: {stage} out of {C.MAX_STAGE}
-- Offer you received: {offer} points
-- Your discount rate: {discount_rate}
-- Opponent's discount rate: {opponent_discount}
-- Your discounted value if you accept: {discounted_offer:.2f} points{next_stage_info}
-
-Previous negotiation history in this round:
-{history_text}
-
-Should you ACCEPT or REJECT this offer? Consider:
-1. The discounted value you would receive now
-2. The risk of getting worse terms (or zero) if negotiations continue
-3. Strategic considerations based on the stage and negotiation history
-4. Whether the opponent is making concessions or becoming more aggressive
-
-Respond with ONLY one word: ACCEPT or REJECT"""
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system",
-                 "content": "You are a strategic bargaining game AI. Respond only with ACCEPT or REJECT."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1.0,
-            max_tokens=10
-        )
-
-        decision_text = response.choices[0].message.content.strip().upper()
-        decision = "ACCEPT" in decision_text
-
-        print(f"[ai_respond] AI (Role={ai_role}, Stage={stage}) "
-              f"{'ACCEPTS' if decision else 'REJECTS'} offer of {offer}")
-        return decision
-    except Exception as e:
-        print(f"[ai_respond] API Error: {e}")
-        threshold = 35 if stage == 1 else (25 if stage == 2 else 15)
-        fallback_decision = discounted_offer >= threshold
-        print(f"[ai_respond] Using fallback decision: {'ACCEPT' if fallback_decision else 'REJECT'}")
-        return fallback_decision
+        'accepted': accepted,
+        # AI 决策来源（llm/fallback）与耗时，供导出使用
+        'ai_source': ai_source,
+        'ai_latency_ms': ai_latency_ms,
+    }]
+    return json.dumps(history)
+
+
+@track_ai_call('propose')
+def ai_propose(stage: int, ai_role: str, history: list = None, meta: dict = None, policy: str = None,
+               rng=None, mock_rng=None) -> int:
+    """
+    决定 AI 的提议（ChatGPT API；策略见 common.ai）
+
+    Args:
+        stage: 当前阶段 (1, 2, 3)
+        ai_role: AI 的角色 ('P1' or 'P2')
+        history: 之前的报价历史
+        meta: 可选 dict，回传决策来源与耗时（见 common.ai.record_ai_meta）
+        policy: 默认为 BARGAINING_AI_POLICY
+        rng: fallback 提议的随机数流（见 ai_rng）
+        mock_rng: mock 策略回答的随机数流（见 mock_llm_rng）
+
+    Returns:
+        提议给对方的点数
+    """
+    return decide_offer(GAME, stage, ai_role, history or [], meta=meta, policy=policy, rng=rng, mock_rng=mock_rng)
+
+
+@track_ai_call('respond')
+def ai_respond(offer: int, stage: int, ai_role: str, history: list = None, meta: dict = None,
+               policy: str = None, mock_rng=None) -> bool:
+    """
+    决定 AI 是否接受提议
+
+    Args:
+        offer: 收到的提议点数
+        stage: 当前阶段 (1, 2, 3)
+        ai_role: AI 的角色 ('P1' or 'P2')
+        history: 之前的报价历史
+        meta: 可选 dict，回传决策来源与耗时（见 common.ai.record_ai_meta）
+        policy: 默认为 BARGAINING_AI_POLICY
+        mock_rng: mock 策略回答的随机数流（见 mock_llm_rng）
+
+    Returns:
+        True 表示接受，False 表示拒绝
+    """
+    return decide_accept(GAME, offer, stage, ai_role, history or [], meta=meta, policy=policy, mock_rng=mock_rng)
 
 
 # ----------------- helpers -----------------
 
 def get_discount_rate(stage: int, player_role: str) -> float:
-    """获取指定阶段和玩家角色的折扣率"""
-    if stage == 1:
-        return 1.0
-    elif stage == 2:
-        if player_role == C.ROLE_P1:
-            return C.DISCOUNT_P1
-        else:
-            return C.DISCOUNT_P2
-    else:
-        if player_role == C.ROLE_P1:
-            return C.DISCOUNT_P1 ** 2
-        else:
-            return C.DISCOUNT_P2 ** 2
+    """获取指定阶段和玩家角色的折扣率（查 GAME 的表）"""
+    return GAME.discount_rate(stage, player_role)
 
 
 def is_human_turn_to_propose(p: Player) -> bool:
@@ -406,29 +291,123 @@ def get_ai_role(human_role: str) -> str:
     return C.ROLE_P2 if human_role == C.ROLE_P1 else C.ROLE_P1
 
 
-def compute_payoffs_if_end(g: Group, p: Player):
-    """计算到group字段 + 玩家payoff(本轮)"""
-    if g.accepted:
-        if g.proposer == C.ROLE_P1:
-            g.p1_points = C.ENDOWMENT - g.offer_points
-            g.p2_points = g.offer_points
-        else:
-            g.p1_points = g.offer_points
-            g.p2_points = C.ENDOWMENT - g.offer_points
+def current_step(p: Player):
+    """本轮当前的步骤 (kind, stage)，本轮结束时为 None；各阶段页面据此决定是否显示"""
+    g: Group = p.group
+    if g.finished:
+        return None
+    if g.ai_job_id:
+        # 人类的提议等待 AI worker 回应
+        return ('ai_wait', g.stage)
+    if is_human_turn_to_propose(p):
+        return ('propose', g.stage)
+    if jobs.enabled() and not g.ai_offer_ready:
+        # AI 的提议由 worker 决定
+        return ('ai_wait', g.stage)
+    return ('respond', g.stage)
+
+
+def apply_transition(g: Group, p: Player, proposer: str, offer: int, accepted: bool, history: list,
+                     group_extra: dict = None, **history_meta) -> bool:
+    """
+    本步（提议被接受 / 拒绝）的结果：先算出 group 与玩家的全部字段，再各写入一次
+    （见 common/transitions.py）。本轮结束时按角色写入 payoff，否则清空玩家的表单字段。
+    返回本轮是否结束。
+    """
+    stage = g.stage
+    delta, payoffs = transitions.resolve(GAME, stage, proposer, offer, accepted)
+    delta['history_json'] = history_with_entry(history, stage, proposer, offer, accepted, **history_meta)
+    delta.update(ai_offer_ready=False, ai_job_id=0)
+    delta.update(group_extra or {})
+    if payoffs is None:
+        player_delta = dict(offer_points=None, accepted_offer=None)
+    else:
+        player_delta = dict(payoff=cu(payoffs[p.assigned_role]))
+    transitions.write([(g, delta), (p, player_delta)], label=f'{__name__}/stage{stage}')
+    return payoffs is not None
+
+
+def store_ai_offer(g: Group, offer: int, meta: dict):
+    """本 stage 的 AI 提议写入 group（回应页面显示）"""
+    transitions.write([(g, dict(
+        ai_offer=offer,
+        offer_points=offer,
+        ai_offer_source=meta.get('source', ''),
+        ai_offer_latency_ms=meta.get('latency_ms', 0),
+        ai_offer_ready=True,
+        ai_job_id=0,
+    ))], label=f'{__name__}/ai_offer')
+
+
+def resolve_human_offer(g: Group, p: Player, offer: int, ai_decision: bool, ai_meta: dict, history: list):
+    """AI 对人类提议的回应：group 与玩家的字段各写入一次（含历史记录）"""
+    apply_transition(g, p, p.assigned_role, offer, ai_decision, history,
+                     group_extra=dict(ai_accepted=ai_decision),
+                     ai_source=ai_meta.get('source'), ai_latency_ms=ai_meta.get('latency_ms'))
+
+
+def open_ai_job(p: Player, offer: int = None) -> tuple:
+    """
+    本 stage 的 AI 决策记录（offer 为 None 时是 AI 的提议，否则是对 offer 的回应），返回 (job_id, result)。
+    已有结果时 result 为记录的结果（服务器重启后重新提交页面也不再调用 API，见 common/jobs.py）；
+    为 None 时 worker 模式下已进入队列，否则由调用方用 decide_inline() 决策。
+    """
+    g: Group = p.group
+    ai_role = get_ai_role(p.assigned_role)
+    history = get_history_from_group(g)
+    if offer is None:
+        key = jobs.job_key(p, 'propose', g.stage)
+        kind, payload = 'propose', jobs.propose_payload(GAME, g.stage, ai_role, history,
+                                                        seed=rng.stream_seed(p.session, 'ai', key),
+                                                        mock_seed=rng.stream_seed(p.session, 'mock_llm', key))
     else:
-        g.p1_points = 0
-        g.p2_points = 0
+        key = jobs.job_key(p, 'respond', g.stage, offer)
+        kind, payload = 'respond', jobs.respond_payload(GAME, offer, g.stage, ai_role, history,
+                                                        mock_seed=rng.stream_seed(p.session, 'mock_llm', key))
+    return jobs.open_job(key, kind, payload, queued=jobs.enabled())
+
+
+def ai_rng(p: Player):
+    """本 stage 的 AI 提议的随机数流；与 worker 中的相同（open_ai_job 的 seed）"""
+    return rng.stream(p.session, 'ai', jobs.job_key(p, 'propose', p.group.stage))
 
-    discount_p1 = get_discount_rate(g.stage, C.ROLE_P1)
-    discount_p2 = get_discount_rate(g.stage, C.ROLE_P2)
 
-    g.p1_discounted_points = g.p1_points * discount_p1
-    g.p2_discounted_points = g.p2_points * discount_p2
+def mock_llm_rng(p: Player, offer: int = None):
+    """本 stage 的 AI 决策（offer 不为 None 时为回应）的 mock 回答的随机数流；与 worker 中的相同"""
+    kind = 'propose' if offer is None else 'respond'
+    return rng.stream(p.session, 'mock_llm', jobs.job_key(p, kind, p.group.stage, offer))
 
-    if p.assigned_role == C.ROLE_P1:
-        p.payoff = cu(g.p1_discounted_points)
+
+def decide_inline(p: Player, job_id: int, offer: int = None, policy: str = None) -> dict:
+    """在本进程决策（offer 为 None 时是 AI 的提议），结果写入决策记录"""
+    g: Group = p.group
+    ai_role = get_ai_role(p.assigned_role)
+    history = get_history_from_group(g)
+    meta = {}
+    if offer is None:
+        result = dict(offer=ai_propose(g.stage, ai_role, history, meta=meta, policy=policy, rng=ai_rng(p),
+                                       mock_rng=mock_llm_rng(p)),
+                      meta=meta)
+    else:
+        result = dict(accepted=ai_respond(offer, g.stage, ai_role, history, meta=meta, policy=policy,
+                                          mock_rng=mock_llm_rng(p, offer)),
+                      meta=meta)
+    jobs.store(job_id, result)
+    return result
+
+
+def resolve_ai_job(g: Group, p: Player, result):
+    """
+    AI worker 的结果写回 group（见 common/jobs.py）。result 为 None（超时 / worker 出错）时
+    在本进程用 fallback 策略决策。
+    """
+    human_proposed = is_human_turn_to_propose(p)
+    if result is None:
+        result = decide_inline(p, g.ai_job_id, g.offer_points if human_proposed else None, policy='fallback')
+    if human_proposed:
+        resolve_human_offer(g, p, g.offer_points, result['accepted'], result['meta'], get_history_from_group(g))
     else:
-        p.payoff = cu(g.p2_discounted_points)
+        store_ai_offer(g, result['offer'], result['meta'])
 
 
 # ----------------- pages -----------------
@@ -448,15 +427,6 @@ class Bargain_Propose(Page):
     form_model = 'player'
     form_fields = ['offer_points']
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished:
-            return False
-        is_stage1 = (g.stage == 1)
-        is_human_proposer = is_human_turn_to_propose(p)
-        return is_stage1 and is_human_proposer
-
     @staticmethod
     def vars_for_template(p: Player):
         g: Group = p.group
@@ -470,6 +440,8 @@ class Bargain_Propose(Page):
             you=p.assigned_role,
             other=ai_role,
             my_discount=my_discount,
+            other_discount=round(get_discount_rate(g.stage, ai_role), 2),
+            **assets.bargaining_preview(),
         )
 
     @staticmethod
@@ -483,57 +455,80 @@ class Bargain_Propose(Page):
         offer = p.field_maybe_none('offer_points')
 
         if timeout_happened or offer is None:
-            g.offer_points = 0
-        else:
-            g.offer_points = offer
+            offer = 0
 
         history = get_history_from_group(g)
+        # AI 的回应：同一 stage 的同一提议只决策一次（见 common/jobs.py）
+        job_id, result = open_ai_job(p, offer)
+        if result is None and jobs.enabled():
+            # 交给 worker，等待页面 Bargain_AIWait 取回结果
+            transitions.write([(g, dict(offer_points=offer, ai_job_id=job_id))], label=f'{__name__}/ai_job')
+            return
+        if result is None:
+            result = decide_inline(p, job_id, offer)
+        resolve_human_offer(g, p, offer, result['accepted'], result['meta'], history)
+
+
+class Bargain_AIWait(Page):
+    """AI worker 决策期间的等待页面（BARGAINING_AI_WORKER=1 时显示，见 common/jobs.py）"""
+
+    @staticmethod
+    def vars_for_template(p: Player):
+        g: Group = p.group
         ai_role = get_ai_role(p.assigned_role)
-        ai_decision = ai_respond(g.offer_points, g.stage, ai_role, history)
+        human_proposed = is_human_turn_to_propose(p)
+        if not human_proposed and not g.ai_job_id:
+            # 已有结果时下一次轮询就会进入回应页面
+            job_id, _ = open_ai_job(p)
+            transitions.write([(g, dict(ai_job_id=job_id))], label=f'{__name__}/ai_job')
+        return dict(
+            stage=g.stage,
+            other=ai_role,
+            human_proposed=human_proposed,
+            ai_wait_js=assets.static_url('bargaining/ai_wait.js'),
+        )
 
-        add_history_entry(g, g.stage, p.assigned_role, g.offer_points, ai_decision)
+    @staticmethod
+    def get_timeout_seconds(p: Player):
+        return jobs.job_timeout()
 
-        if ai_decision:
-            g.accepted = True
-            g.ai_accepted = True
-            g.finished = True
-            compute_payoffs_if_end(g, p)
-        else:
-            g.accepted = False
-            g.ai_accepted = False
-            g.stage += 1
+    @staticmethod
+    def live_method(p: Player, data):
+        """页面轮询：worker 的结果出来后写入 group，通知页面进入下一页"""
+        g: Group = p.group
+        if g.ai_job_id:
+            result = jobs.poll(g.ai_job_id)
+            if result is None:
+                return {p.id_in_group: dict(ready=False)}
+            resolve_ai_job(g, p, result)
+        return {p.id_in_group: dict(ready=True)}
 
-            if g.stage > C.MAX_STAGE:
-                g.finished = True
-                compute_payoffs_if_end(g, p)
-            else:
-                g.proposer = ai_role
-                g.offer_points = 0
-                p.offer_points = None
-                p.accepted_offer = None
+    @staticmethod
+    def before_next_page(p: Player, timeout_happened):
+        g: Group = p.group
+        if g.ai_job_id:
+            # 超时（或没有 JavaScript）：取消任务，已有结果时使用结果，否则用 fallback
+            result = jobs.cancel(g.ai_job_id)
+            if result is None:
+                print(f"[Bargain_AIWait] Player {p.participant.id_in_session} "
+                      f"AI job {g.ai_job_id} not finished, using fallback")
+            resolve_ai_job(g, p, result)
 
 
 class Bargain_Respond(Page):
     form_model = 'player'
     form_fields = ['accepted_offer']
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished:
-            return False
-        is_ai_proposer = (p.assigned_role != g.proposer)
-        is_stage1 = (g.stage == 1)
-        return is_stage1 and is_ai_proposer
-
     @staticmethod
     def vars_for_template(p: Player):
         g: Group = p.group
-        history = get_history_from_group(g)
         ai_role = get_ai_role(p.assigned_role)
-        ai_offer = ai_propose(g.stage, ai_role, history)
-        g.ai_offer = ai_offer
-        g.offer_points = ai_offer
+        if not g.ai_offer_ready:
+            job_id, result = open_ai_job(p)
+            if result is None:
+                result = decide_inline(p, job_id)
+            store_ai_offer(g, result['offer'], result['meta'])
+        ai_offer = g.ai_offer
 
         my_discount = round(get_discount_rate(g.stage, p.assigned_role), 2)
         p.accepted_offer = None
@@ -545,6 +540,8 @@ class Bargain_Respond(Page):
             other=ai_role,
             endowment=C.ENDOWMENT,
             my_discount=my_discount,
+            other_discount=round(get_discount_rate(g.stage, ai_role), 2),
+            **assets.bargaining_preview(),
         )
 
     @staticmethod
@@ -563,128 +560,19 @@ class Bargain_Respond(Page):
             decision = accepted_value
 
         ai_role = get_ai_role(p.assigned_role)
-        add_history_entry(g, g.stage, ai_role, g.offer_points, decision)
-
-        if decision:
-            g.accepted = True
-            g.finished = True
-            compute_payoffs_if_end(g, p)
-        else:
-            g.accepted = False
-            g.stage += 1
-
-            if g.stage > C.MAX_STAGE:
-                g.finished = True
-                compute_payoffs_if_end(g, p)
-            else:
-                g.proposer = p.assigned_role
-                g.offer_points = 0
-                p.offer_points = None
-                p.accepted_offer = None
-
-
-# Stage 2
-class Bargain_Propose_Stage2(Page):
-    form_model = 'player'
-    form_fields = ['offer_points']
-    template_name = 'human_AI_bargaining_Practice/Bargain_Propose.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage != 2:
-            return False
-        return is_human_turn_to_propose(p)
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Propose.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        return Bargain_Propose.error_message(p, values)
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Propose.before_next_page(p, timeout_happened)
-
-
-class Bargain_Respond_Stage2(Page):
-    form_model = 'player'
-    form_fields = ['accepted_offer']
-    template_name = 'human_AI_bargaining_Practice/Bargain_Respond.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage != 2:
-            return False
-        is_ai_proposer = (p.assigned_role != g.proposer)
-        return is_ai_proposer
 
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Respond.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        return Bargain_Respond.error_message(p, values)
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Respond.before_next_page(p, timeout_happened)
-
-
-# Stage 3
-class Bargain_Propose_Stage3(Page):
-    form_model = 'player'
-    form_fields = ['offer_points']
-    template_name = 'human_AI_bargaining_Practice/Bargain_Propose.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage != 3:
-            return False
-        return is_human_turn_to_propose(p)
+        # group 与玩家的字段各写入一次（含历史记录，AI 是提议者）
+        apply_transition(g, p, ai_role, g.offer_points, decision, get_history_from_group(g),
+                         ai_source=g.ai_offer_source, ai_latency_ms=g.ai_offer_latency_ms)
 
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Propose.vars_for_template(p)
 
-    @staticmethod
-    def error_message(p: Player, values):
-        return Bargain_Propose.error_message(p, values)
+# ==================== Stage 2..MAX_STAGE 页面 ====================
+# 按 C.MAX_STAGE 生成 Bargain_Propose_Stage2, Bargain_AIWait_Stage2, Bargain_Respond_Stage2, ...（见 common/stages.py）
 
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Propose.before_next_page(p, timeout_happened)
-
-
-class Bargain_Respond_Stage3(Page):
-    form_model = 'player'
-    form_fields = ['accepted_offer']
-    template_name = 'human_AI_bargaining_Practice/Bargain_Respond.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage != 3:
-            return False
-        is_ai_proposer = (p.assigned_role != g.proposer)
-        return is_ai_proposer
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Respond.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        return Bargain_Respond.error_message(p, values)
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Respond.before_next_page(p, timeout_happened)
+STAGE_PAGES = stages.stage_pages(
+    [('propose', Bargain_Propose, None), ('ai_wait', Bargain_AIWait, None), ('respond', Bargain_Respond, None)],
+    current_step, C.MAX_STAGE, globals(),
+)
 
 
 class Results(Page):
@@ -740,16 +628,10 @@ class WaitForPlayers(WaitPage):
 page_sequence = [
    Start,
    Intro,
-    # Stage 1
-    Bargain_Propose,
-    Bargain_Respond,
-    # Stage 2
-    Bargain_Propose_Stage2,
-    Bargain_Respond_Stage2,
-    # Stage 3
-    Bargain_Propose_Stage3,
-    Bargain_Respond_Stage3,
+    # Stage 1..MAX_STAGE
+    *STAGE_PAGES,
     # Results
     Results,
     WaitForPlayers
-]
\ No newline at end of file
+]
+instrument_pages(page_sequence)
@@ -3,6 +3,10 @@ import re
 from otree.api import *
 import re
 
+from common import assets, game, labels, rng, stages, straggler, transitions
+from common.ai import proposer_role
+from common.timing import instrument_pages
+
 doc = """
 Alternating-offer bargaining with T1 treatment only (human vs human).
 12 players in T1; 2-player groups; 10 rounds using round-robin pairing.
@@ -30,6 +34,10 @@ class C(BaseConstants):
     PAYMENT_MULTIPLIER = 30
 
 
+# 折扣率与结算点数的预先计算表（common/game.py）
+GAME = game.GameParams.from_constants(C)
+
+
 class Subsession(BaseSubsession):
     pass
 
@@ -40,7 +48,10 @@ def creating_session(subsession: Subsession):
     # 只在第一轮执行分组逻辑
     if subsession.round_number == 1:
         import sys
-        import random
+
+        # 配对与角色各用 session 的随机数流（common/rng.py），同一个种子得到相同的配对表
+        matching_rng = rng.stream(subsession.session, 'matching', __name__)
+        role_rng = rng.stream(subsession.session, 'roles', __name__)
         
         sys.stderr.write("\n" + "="*70 + "\n")
         sys.stderr.write("🔴 开始生成随机配对表\n")
@@ -76,7 +87,7 @@ def creating_session(subsession: Subsession):
             for round_num in range(total_rounds):
                 # 创建玩家索引列表并随机打乱
                 player_indices = list(range(n))
-                random.shuffle(player_indices)
+                matching_rng.shuffle(player_indices)
                 
                 # 相邻两个配对
                 round_pairs = []
@@ -122,7 +133,7 @@ def creating_session(subsession: Subsession):
                 p_b = player_map[pid_b]
                 
                 # 🔴 随机决定谁是 P1，谁是 P2
-                if random.random() < 0.5:
+                if role_rng.random() < 0.5:
                     # p_a 是 P1, p_b 是 P2
                     matrix.append([p_a, p_b])
                     p_a.assigned_role = C.ROLE_P1
@@ -188,14 +199,8 @@ class Player(BasePlayer):
         label="あなたの選択"
     )
 
-    stage_1_offer = models.IntegerField(blank=True, initial=None)
-    stage_2_offer = models.IntegerField(blank=True, initial=None)
-    stage_3_offer = models.IntegerField(blank=True, initial=None)
-
-    #  新增字段：记录每个stage的回应
-    stage_1_accepted = models.BooleanField(blank=True, initial=None)
-    stage_2_accepted = models.BooleanField(blank=True, initial=None)
-    stage_3_accepted = models.BooleanField(blank=True, initial=None)
+    # 超时后自动决定（默认动作或 AI 接管）的次数
+    auto_decisions = models.IntegerField(initial=0)
 
     def role(self):
         """返回玩家的固定角色（在本轮中不变）"""
@@ -225,49 +230,24 @@ class Player(BasePlayer):
             return self.group.initial_proposer_id == 1 and self.id_in_group == 1 or \
                 self.group.initial_proposer_id == 2 and self.id_in_group == 2
 
-    def custom_export_my_stage1_offer(self):
-            """我在 Stage 1 提出的 offer（如果我是提议者）"""
-            g = self.group
-            if g.stage >= 1:
-                # 检查 Stage 1 时我是否是提议者
-                if self.assigned_role == C.ROLE_P1:  # 初始提议者
-                    return self.stage_1_offer
-            return None
-
-    def custom_export_my_stage2_offer(self):
-            """我在 Stage 2 提出的 offer（如果我是提议者）"""
-            g = self.group
-            if g.stage >= 2:
-                # Stage 2 提议者是 P2
-                if self.assigned_role == C.ROLE_P2:
-                    return self.stage_2_offer
-            return None
-
-    def custom_export_my_stage3_offer(self):
-            """我在 Stage 3 提出的 offer（如果我是提议者）"""
-            g = self.group
-            if g.stage >= 3:
-                # Stage 3 提议者是 P1
-                if self.assigned_role == C.ROLE_P1:
-                    return self.stage_3_offer
-            return None
+    def my_offers(self) -> list:
+        """我作为提议者在 stage 1..C.MAX_STAGE 提出的 offer；不是我提议的 stage、或还没到的 stage 为 None"""
+        g = self.group
+        return [
+            self.field_maybe_none(f'stage_{n}_offer')
+            if g.stage >= n and proposer_role(n) == self.assigned_role else None
+            for n in range(1, C.MAX_STAGE + 1)
+        ]
+
+
+# 每个 stage 的提议与回应：stage_N_offer / stage_N_accepted（按 C.MAX_STAGE 生成）
+stages.add_stage_fields(Player, C.MAX_STAGE)
 
 
 # ----------------- helpers -----------------
 def get_discount_rate(stage: int, player_role: str) -> float:
-    """获取指定阶段和玩家角色的折扣率"""
-    if stage == 1:
-        return 1.0
-    elif stage == 2:
-        if player_role == C.ROLE_P1:
-            return C.DISCOUNT_P1
-        else:
-            return C.DISCOUNT_P2
-    else:  # stage == 3
-        if player_role == C.ROLE_P1:
-            return C.DISCOUNT_P1 ** 2
-        else:
-            return C.DISCOUNT_P2 ** 2
+    """获取指定阶段和玩家角色的折扣率（查 GAME 的表）"""
+    return GAME.discount_rate(stage, player_role)
 
 
 def is_current_proposer(p: Player) -> bool:
@@ -287,42 +267,40 @@ def respondent_role(g: Group) -> str:
     return C.ROLE_P2 if g.proposer == C.ROLE_P1 else C.ROLE_P1
 
 
-def compute_payoffs_if_end(g: Group):
-    """结算到 group 字段 + 玩家 payoff（本轮）"""
-    # 计算原始点数
-    if g.accepted:
-        if g.proposer == C.ROLE_P1:
-            g.p1_points = C.ENDOWMENT - g.offer_points
-            g.p2_points = g.offer_points
+def current_step(p: Player):
+    """本轮当前的步骤 (kind, stage)，本轮结束时为 None；各阶段页面据此决定是否显示"""
+    g: Group = p.group
+    if g.finished:
+        return None
+    if g.offer_locked:
+        return ('wait_response' if is_current_proposer(p) else 'respond', g.stage)
+    return ('propose' if is_current_proposer(p) else 'wait_offer', g.stage)
+
+
+def apply_transition(g: Group, p: Player, accepted: bool, responder_delta: dict) -> bool:
+    """
+    回应后的结果：先算出 group 与两位玩家的全部字段，再各写入一次（见 common/transitions.py）。
+    本轮结束时按角色写入 payoff；否则进入下一 stage，并清空所有玩家的表单字段，避免粘连。
+    responder_delta 为回应者自己要写入的字段。返回本轮是否结束。
+    """
+    stage = g.stage
+    delta, payoffs = transitions.resolve(GAME, stage, g.proposer, g.offer_points, accepted)
+    delta['offer_locked'] = False
+
+    writes = [(g, delta)]
+    for player in g.get_players():
+        if payoffs is None:
+            player_delta = dict(offer_points=None, accepted_offer=None)
         else:
-            g.p1_points = g.offer_points
-            g.p2_points = C.ENDOWMENT - g.offer_points
-    else:
-        g.p1_points = 0
-        g.p2_points = 0
-
-    # 计算折扣率
-    discount_p1 = get_discount_rate(g.stage, C.ROLE_P1)
-    discount_p2 = get_discount_rate(g.stage, C.ROLE_P2)
-
-    # 应用折扣
-    g.p1_discounted_points = g.p1_points * discount_p1
-    g.p2_discounted_points = g.p2_points * discount_p2
-
-    # T1 treatment: 两个人类玩家
-    players = g.get_players()
-    p1 = g.get_player_by_id(1)
-    p2 = g.get_player_by_id(2)
-
-    # 根据玩家的角色分配 payoff
-    if p1.role() == C.ROLE_P1:
-        p1.payoff = cu(g.p1_discounted_points)
-        p2.payoff = cu(g.p2_discounted_points)
-    else:
-        p1.payoff = cu(g.p2_discounted_points)
-        p2.payoff = cu(g.p1_discounted_points)
+            player_delta = dict(payoff=cu(payoffs[player.assigned_role]))
+        if player.id_in_group == p.id_in_group:
+            player_delta.update(responder_delta)
+        writes.append((player, player_delta))
+    transitions.write(writes, label=f'{__name__}/stage{stage}')
 
-    print(f"[compute_payoffs] T1 treatment - P1 payoff={p1.payoff}, P2 payoff={p2.payoff}")
+    if payoffs is not None:
+        print(f"[compute_payoffs] T1 treatment - P1 payoff={payoffs[C.ROLE_P1]}, P2 payoff={payoffs[C.ROLE_P2]}")
+    return payoffs is not None
 
 
 # ----------------- pages -----------------
@@ -339,15 +317,6 @@ class Bargain_Propose(Page):
     form_model = 'player'
     form_fields = ['offer_points']
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-
-        if g.finished or g.offer_locked:
-            return False
-
-        return is_current_proposer(p)
-
     @staticmethod
     def vars_for_template(p: Player):
         g: Group = p.group
@@ -362,9 +331,15 @@ class Bargain_Propose(Page):
             other=respondent_role(g),
             t=p.treatment,
             my_discount=my_discount,
+            other_discount=round(get_discount_rate(g.stage, respondent_role(g)), 2),
+            **assets.bargaining_preview(),
             opponent_type="対戦相手"
         )
 
+    @staticmethod
+    def get_timeout_seconds(p: Player):
+        return straggler.decision_timeout(p)
+
     @staticmethod
     def error_message(p: Player, values):
         """验证表单输入"""
@@ -376,26 +351,22 @@ class Bargain_Propose(Page):
         g: Group = p.group
 
         offer = p.field_maybe_none('offer_points')
+        straggler.note_decision(p, timeout_happened, allow_takeover=True)
 
         if timeout_happened or offer is None:
-            g.offer_points = 0
+            offer = straggler.default_offer(p, GAME, g.stage)
+            player_delta = dict(auto_decisions=p.auto_decisions + 1)
             print(f"[Bargain_Propose] Player {p.participant.id_in_session} "
-                  f"TIMEOUT or NO INPUT - default offer = 0")
+                  f"TIMEOUT or NO INPUT - default offer = {offer}")
         else:
-            g.offer_points = offer
+            player_delta = {}
             print(f"[Bargain_Propose] Player {p.participant.id_in_session} "
                   f"offers {offer} points")
 
-            #  根据当前stage保存offer到对应字段
-        if g.stage == 1:
-            p.stage_1_offer = offer
-        elif g.stage == 2:
-            p.stage_2_offer = offer
-        elif g.stage == 3:
-            p.stage_3_offer = offer
-
-        g.offer_locked = True
-        p.accepted_offer = None
+        #  锁定提议，并根据当前stage保存offer到对应字段；group 与玩家各写入一次
+        player_delta.update({'accepted_offer': None, f'stage_{g.stage}_offer': offer})
+        transitions.write([(g, dict(offer_points=offer, offer_locked=True)), (p, player_delta)],
+                          label=f'{__name__}/propose')
         print(f"[Bargain_Propose] Offer locked at Stage {g.stage}")
 
 
@@ -404,25 +375,11 @@ class WaitForOffer(WaitPage):
     title_text = "お待ちください"
     body_text = "相手からの提案を待ってください..."
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        return (not g.finished) and (not g.offer_locked)
-
 
 class Bargain_Respond(Page):
     form_model = 'player'
     form_fields = ['accepted_offer']
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-
-        if g.finished or not g.offer_locked:
-            return False
-
-        return not is_current_proposer(p)
-
     @staticmethod
     def vars_for_template(p: Player):
         g: Group = p.group
@@ -439,9 +396,15 @@ class Bargain_Respond(Page):
             endowment=C.ENDOWMENT,
             t=p.treatment,
             my_discount=my_discount,
+            other_discount=round(get_discount_rate(g.stage, g.proposer), 2),
+            **assets.bargaining_preview(),
             opponent_type="対戦相手"
         )
 
+    @staticmethod
+    def get_timeout_seconds(p: Player):
+        return straggler.decision_timeout(p)
+
     @staticmethod
     def error_message(p: Player, values):
         """验证表单输入"""
@@ -453,10 +416,14 @@ class Bargain_Respond(Page):
         g: Group = p.group
 
         accepted_value = p.field_maybe_none('accepted_offer')
+        straggler.note_decision(p, timeout_happened, allow_takeover=True)
 
+        player_delta = {}
         if timeout_happened:
-            decision = False
-            print(f"[Bargain_Respond] Player {p.participant.id_in_session} TIMEOUT - default to REJECT")
+            decision = straggler.default_accept(p, GAME, g.offer_points, g.stage)
+            player_delta['auto_decisions'] = p.auto_decisions + 1
+            print(f"[Bargain_Respond] Player {p.participant.id_in_session} TIMEOUT - default to "
+                  f"{'ACCEPT' if decision else 'REJECT'}")
         elif accepted_value is None:
             decision = False
             print(f"[Bargain_Respond] Player {p.participant.id_in_session} NO CHOICE - default to REJECT")
@@ -466,214 +433,42 @@ class Bargain_Respond(Page):
                   f"{'ACCEPTS' if decision else 'REJECTS'}")
 
             #  根据当前stage保存回应到对应字段
-            if g.stage == 1:
-                p.stage_1_accepted = decision
-            elif g.stage == 2:
-                p.stage_2_accepted = decision
-            elif g.stage == 3:
-                p.stage_3_accepted = decision
+            player_delta[f'stage_{g.stage}_accepted'] = decision
+
+        old_stage = g.stage
+        finished = apply_transition(g, p, decision, player_delta)
 
         if decision:
-            g.accepted = True
-            g.finished = True
-            g.offer_locked = False
-            compute_payoffs_if_end(g)
-            print(f"[Bargain_Respond] ✅ Accepted at Stage {g.stage}")
+            print(f"[Bargain_Respond] ✅ Accepted at Stage {old_stage}")
+        elif finished:
+            print(f"[Bargain_Respond] ❌ Max stage reached")
         else:
-            g.accepted = False
-            old_stage = g.stage
+            print(f"[Bargain_Respond] ❌ Rejected, Stage {old_stage}→{g.stage}")
+            print(f"[Bargain_Respond] 🔄 Cleared all players' form fields for new stage")
 
-            g.stage += 1
-
-            if g.stage > C.MAX_STAGE:
-                g.finished = True
-                g.offer_locked = False
-                compute_payoffs_if_end(g)
-                print(f"[Bargain_Respond] ❌ Max stage reached")
-            else:
-                g.proposer = respondent_role(g)
-                g.offer_locked = False
-                g.offer_points = 0
-
-                # 🔴 清空所有玩家的表单字段，避免粘连
-                for player in g.get_players():
-                    player.offer_points = None
-                    player.accepted_offer = None  # 清空回应者的选择
-                print(f"[Bargain_Respond] ❌ Rejected, Stage {old_stage}→{g.stage}")
-                print(f"[Bargain_Respond] 🔄 Cleared all players' form fields for new stage")
 
 class WaitAfterResponse(WaitPage):
     title_text = "お待ちください"
     body_text = "相手の応答を待ってください..."
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        return (not g.finished) and g.offer_locked
-
-
-# ==================== Stage 2 页面 ====================
-
-class Bargain_Propose_Stage2(Page):
-    form_model = 'player'
-    form_fields = ['offer_points']
-    template_name = 'human_human/Bargain_Propose.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 2:
-            return False
-        return Bargain_Propose.is_displayed(p)
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Propose.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        """验证表单输入"""
-        if values['offer_points'] is None:
-            return '手渡すポイントを入力してください / Please enter an offer amount'
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Propose.before_next_page(p, timeout_happened)
-
-
-class WaitForOffer_Stage2(WaitPage):
-    title_text = "お待ちください"
-    body_text = "提案が相手に拒否されました。相手からの提案を待ってください..."
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 2:
-            return False
-        return WaitForOffer.is_displayed(p)
-
-
-class Bargain_Respond_Stage2(Page):
-    form_model = 'player'
-    form_fields = ['accepted_offer']
-    template_name = 'human_human/Bargain_Respond.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 2:
-            return False
-        return Bargain_Respond.is_displayed(p)
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Respond.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        """验证表单输入"""
-        if 'accepted_offer' not in values or values['accepted_offer'] is None:
-            return '受け入れるか拒否するかを選択してください / Please select Accept or Reject'
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Respond.before_next_page(p, timeout_happened)
-
-
-class WaitAfterResponse_Stage2(WaitPage):
-    title_text = "お待ちください"
-    body_text = "相手の応答を待ってください..."
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 2:
-            return False
-        return WaitAfterResponse.is_displayed(p)
-
-
-# ==================== Stage 3 页面 ====================
-
-class Bargain_Propose_Stage3(Page):
-    form_model = 'player'
-    form_fields = ['offer_points']
-    template_name = 'human_human/Bargain_Propose.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 3:
-            return False
-        return Bargain_Propose.is_displayed(p)
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Propose.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        """验证表单输入"""
-        if values['offer_points'] is None:
-            return '手渡すポイントを入力してください / Please enter an offer amount'
 
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Propose.before_next_page(p, timeout_happened)
+# ==================== Stage 2..MAX_STAGE 页面 ====================
+# 按 C.MAX_STAGE 生成 Bargain_Propose_Stage2, Bargain_Respond_Stage2, ...（见 common/stages.py）
 
-
-class WaitForOffer_Stage3(WaitPage):
-    title_text = "お待ちください"
-    body_text = "提案が相手に拒否されました。相手からの提案を待ってください..."
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 3:
-            return False
-        return WaitForOffer.is_displayed(p)
-
-
-class Bargain_Respond_Stage3(Page):
-    form_model = 'player'
-    form_fields = ['accepted_offer']
-    template_name = 'human_human/Bargain_Respond.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 3:
-            return False
-        return Bargain_Respond.is_displayed(p)
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Respond.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        """验证表单输入"""
-        if 'accepted_offer' not in values or values['accepted_offer'] is None:
-            return '受け入れるか拒否するかを選択してください / Please select Accept or Reject'
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Respond.before_next_page(p, timeout_happened)
-
-
-class WaitAfterResponse_Stage3(WaitPage):
-    title_text = "お待ちください"
-    body_text = "相手の応答を待ってください..."
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 3:
-            return False
-        return WaitAfterResponse.is_displayed(p)
+STAGE_PAGES = stages.stage_pages(
+    [
+        ('propose', Bargain_Propose, None),
+        ('wait_offer', WaitForOffer, dict(body_text="提案が相手に拒否されました。相手からの提案を待ってください...")),
+        ('respond', Bargain_Respond, None),
+        ('wait_response', WaitAfterResponse, None),
+    ],
+    current_step, C.MAX_STAGE, globals(),
+)
 
 
 # ==================== 结果页面 ====================
 
+
 class ResultsWait(WaitPage):
     title_text = "お待ちください"
     body_text = "結果待ちです..."
@@ -691,6 +486,10 @@ class Results(Page):
         g: Group = p.group
         return g.finished is True
 
+    @staticmethod
+    def get_timeout_seconds(p: Player):
+        return straggler.results_timeout(p)
+
     @staticmethod
     def vars_for_template(p: Player):
         g: Group = p.group
@@ -795,28 +594,30 @@ class WaitForFinalResults(WaitPage):
 
 
 
+# ==================== 数据导出 ====================
+
+def custom_export(players):
+    """每位玩家每轮一行：自己作为提议者在 stage 1..C.MAX_STAGE 提出的 offer（Player.my_offers）"""
+    yield (['session', 'participant_code', 'label', 'round_number', 'assigned_role']
+           + [f'my_stage{n}_offer' for n in range(1, C.MAX_STAGE + 1)])
+    players = list(players)
+    # 按 session 一次读出参与者，每行只查 dict（见 common/labels.py）
+    participants = labels.participant_index(players)
+    for p in players:
+        participant = labels.participant_of(participants, p)
+        yield [p.session.code, participant.code, participant.label, p.round_number, p.assigned_role] + p.my_offers()
+
+
 # ==================== 页面序列 ====================
 
 page_sequence = [
     Start,
-    # Stage 1
-    Bargain_Propose,
-    WaitForOffer,
-    Bargain_Respond,
-    WaitAfterResponse,
-    # Stage 2
-    Bargain_Propose_Stage2,
-    WaitForOffer_Stage2,
-    Bargain_Respond_Stage2,
-    WaitAfterResponse_Stage2,
-    # Stage 3
-    Bargain_Propose_Stage3,
-    WaitForOffer_Stage3,
-    Bargain_Respond_Stage3,
-    WaitAfterResponse_Stage3,
+    # Stage 1..MAX_STAGE
+    *STAGE_PAGES,
     # Results
     ResultsWait,
     Results,
     WaitForNextRound,
     WaitForFinalResults,
 ]
+instrument_pages(page_sequence)
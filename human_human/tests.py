@@ -0,0 +1,21 @@
+from otree.api import Currency as c, currency_range, expect, Bot, SubmissionMustFail, Submission
+from . import *
+from common.bots import submit, play_bargaining
+from common.stages import pages_by_stage
+from common.transitions import check_statement_bound
+
+PROPOSE_PAGES = pages_by_stage(STAGE_PAGES, 'propose')
+RESPOND_PAGES = pages_by_stage(STAGE_PAGES, 'respond')
+
+
+class PlayerBot(Bot):
+    def play_round(self):
+        if self.round_number == 1:
+            yield from submit(self, Start)
+
+        yield from play_bargaining(self, PROPOSE_PAGES, RESPOND_PAGES, get_discount_rate)
+        # 每次转移：每个被修改的行只有一条 UPDATE，且不超过 group + 两位玩家 + participant（见 common/transitions.py）
+        expect(check_statement_bound(max_statements=4) > 0, True)
+
+        expect(self.group.finished, True)
+        yield from submit(self, Results)
@@ -1,5 +1,7 @@
 from otree.api import *
-import random
+
+from common import assets, game, rng, stages, transitions
+from common.timing import instrument_pages
 
 doc = """
 练习回合 - 1轮讨价还价博弈
@@ -21,6 +23,10 @@ class C(BaseConstants):
     DISCOUNT_P2 = 0.4
 
 
+# 折扣率与结算点数的预先计算表（common/game.py）
+GAME = game.GameParams.from_constants(C)
+
+
 class Subsession(BaseSubsession):
     pass
 
@@ -39,9 +45,10 @@ def creating_session(subsession: Subsession):
     if N % 2 != 0:
         raise ValueError(f"参与者数量必须是偶数,当前为 {N} 人")
 
-    # 随机分组
+    # 随机分组（配对与角色各用 session 的随机数流，见 common/rng.py）
     player_indices = list(range(N))
-    random.shuffle(player_indices)
+    rng.stream(subsession.session, 'matching', __name__).shuffle(player_indices)
+    role_rng = rng.stream(subsession.session, 'roles', __name__)
 
     matrix = []
     print(f"\n{'=' * 60}")
@@ -55,7 +62,7 @@ def creating_session(subsession: Subsession):
         p_b = players[player_indices[i + 1]]
 
         # 随机决定谁是P1,谁是P2
-        if random.random() < 0.5:
+        if role_rng.random() < 0.5:
             matrix.append([p_a, p_b])
             p_a.assigned_role = C.ROLE_P1
             p_b.assigned_role = C.ROLE_P2
@@ -111,34 +118,18 @@ class Player(BasePlayer):
         label="あなたの選択"
     )
 
-    #  新增字段：记录每个stage的offer
-    stage_1_offer = models.IntegerField(blank=True, initial=None)
-    stage_2_offer = models.IntegerField(blank=True, initial=None)
-    stage_3_offer = models.IntegerField(blank=True, initial=None)
-
-    #  新增字段：记录每个stage的回应
-    stage_1_accepted = models.BooleanField(blank=True, initial=None)
-    stage_2_accepted = models.BooleanField(blank=True, initial=None)
-    stage_3_accepted = models.BooleanField(blank=True, initial=None)
-
     def role(self):
         return self.assigned_role
 
 
+# 每个 stage 的提议与回应：stage_N_offer / stage_N_accepted（按 C.MAX_STAGE 生成）
+stages.add_stage_fields(Player, C.MAX_STAGE)
+
+
 # ----------------- helpers -----------------
 def get_discount_rate(stage: int, player_role: str) -> float:
-    if stage == 1:
-        return 1.0
-    elif stage == 2:
-        if player_role == C.ROLE_P1:
-            return C.DISCOUNT_P1
-        else:
-            return C.DISCOUNT_P2
-    else:
-        if player_role == C.ROLE_P1:
-            return C.DISCOUNT_P1 ** 2
-        else:
-            return C.DISCOUNT_P2 ** 2
+    """获取指定阶段和玩家角色的折扣率（查 GAME 的表）"""
+    return GAME.discount_rate(stage, player_role)
 
 
 def is_current_proposer(p: Player) -> bool:
@@ -151,33 +142,33 @@ def respondent_role(g: Group) -> str:
     return C.ROLE_P2 if g.proposer == C.ROLE_P1 else C.ROLE_P1
 
 
-def compute_payoffs_if_end(g: Group):
-    if g.accepted:
-        if g.proposer == C.ROLE_P1:
-            g.p1_points = C.ENDOWMENT - g.offer_points
-            g.p2_points = g.offer_points
+def current_step(p: Player):
+    """本轮当前的步骤 (kind, stage)，本轮结束时为 None；各阶段页面据此决定是否显示"""
+    g: Group = p.group
+    if g.finished:
+        return None
+    if g.offer_locked:
+        return ('wait_response' if is_current_proposer(p) else 'respond', g.stage)
+    return ('propose' if is_current_proposer(p) else 'wait_offer', g.stage)
+
+
+def apply_transition(g: Group, p: Player, accepted: bool, responder_delta: dict) -> bool:
+    """回应后的结果：group 与两位玩家各写入一次（见 common/transitions.py）；返回本轮是否结束"""
+    stage = g.stage
+    delta, payoffs = transitions.resolve(GAME, stage, g.proposer, g.offer_points, accepted)
+    delta['offer_locked'] = False
+
+    writes = [(g, delta)]
+    for player in g.get_players():
+        if payoffs is None:
+            player_delta = dict(offer_points=None, accepted_offer=None)
         else:
-            g.p1_points = g.offer_points
-            g.p2_points = C.ENDOWMENT - g.offer_points
-    else:
-        g.p1_points = 0
-        g.p2_points = 0
-
-    discount_p1 = get_discount_rate(g.stage, C.ROLE_P1)
-    discount_p2 = get_discount_rate(g.stage, C.ROLE_P2)
-
-    g.p1_discounted_points = g.p1_points * discount_p1
-    g.p2_discounted_points = g.p2_points * discount_p2
-
-    p1 = g.get_player_by_id(1)
-    p2 = g.get_player_by_id(2)
-
-    if p1.role() == C.ROLE_P1:
-        p1.payoff = cu(g.p1_discounted_points)
-        p2.payoff = cu(g.p2_discounted_points)
-    else:
-        p1.payoff = cu(g.p2_discounted_points)
-        p2.payoff = cu(g.p1_discounted_points)
+            player_delta = dict(payoff=cu(payoffs[player.assigned_role]))
+        if player.id_in_group == p.id_in_group:
+            player_delta.update(responder_delta)
+        writes.append((player, player_delta))
+    transitions.write(writes, label=f'{__name__}/stage{stage}')
+    return payoffs is not None
 
 
 # ----------------- pages -----------------
@@ -197,13 +188,6 @@ class Bargain_Propose(Page):
     form_model = 'player'
     form_fields = ['offer_points']
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.offer_locked:
-            return False
-        return is_current_proposer(p)
-
     @staticmethod
     def vars_for_template(p: Player):
         g: Group = p.group
@@ -216,6 +200,8 @@ class Bargain_Propose(Page):
             you=p.assigned_role,
             other=respondent_role(g),
             my_discount=my_discount,
+            other_discount=round(get_discount_rate(g.stage, respondent_role(g)), 2),
+            **assets.bargaining_preview(),
         )
 
     @staticmethod
@@ -228,44 +214,22 @@ class Bargain_Propose(Page):
         g: Group = p.group
         offer = p.field_maybe_none('offer_points')
 
-        if timeout_happened or offer is None:
-            g.offer_points = 0
-        else:
-            g.offer_points = offer
-
-        g.offer_locked = True
-        p.accepted_offer = None
-
-        #  根据当前stage保存offer到对应字段
-        if g.stage == 1:
-            p.stage_1_offer = offer
-        elif g.stage == 2:
-            p.stage_2_offer = offer
-        elif g.stage == 3:
-            p.stage_3_offer = offer
+        #  根据当前stage保存offer到对应字段；group 与玩家各写入一次
+        transitions.write([
+            (g, dict(offer_points=0 if timeout_happened or offer is None else offer, offer_locked=True)),
+            (p, {'accepted_offer': None, f'stage_{g.stage}_offer': offer}),
+        ], label=f'{__name__}/propose')
 
 
 class WaitForOffer(WaitPage):
     title_text = "お待ちください"
     body_text = "相手からの提案を待ってください..."
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        return (not g.finished) and (not g.offer_locked)
-
 
 class Bargain_Respond(Page):
     form_model = 'player'
     form_fields = ['accepted_offer']
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or not g.offer_locked:
-            return False
-        return not is_current_proposer(p)
-
     @staticmethod
     def vars_for_template(p: Player):
         g: Group = p.group
@@ -278,6 +242,8 @@ class Bargain_Respond(Page):
             other=g.proposer,
             endowment=C.ENDOWMENT,
             my_discount=my_discount,
+            other_discount=round(get_discount_rate(g.stage, g.proposer), 2),
+            **assets.bargaining_preview(),
         )
 
     @staticmethod
@@ -296,198 +262,30 @@ class Bargain_Respond(Page):
             decision = accepted_value
 
 
-        if decision:
-            g.accepted = True
-            g.finished = True
-            g.offer_locked = False
-            compute_payoffs_if_end(g)
-        else:
-            g.accepted = False
-            g.stage += 1
+        #  拒绝后根据下一stage保存回应到对应字段
+        responder_delta = {}
+        if not decision and g.stage + 1 <= C.MAX_STAGE:
+            responder_delta[f'stage_{g.stage + 1}_accepted'] = decision
+        apply_transition(g, p, decision, responder_delta)
 
-            if g.stage > C.MAX_STAGE:
-                g.finished = True
-                g.offer_locked = False
-                compute_payoffs_if_end(g)
-            else:
-                g.proposer = respondent_role(g)
-                g.offer_locked = False
-                g.offer_points = 0
-
-                for player in g.get_players():
-                    player.offer_points = None
-                    player.accepted_offer = None
-
-            #  根据当前stage保存回应到对应字段
-            if g.stage == 1:
-                    p.stage_1_accepted = decision
-            elif g.stage == 2:
-                    p.stage_2_accepted = decision
-            elif g.stage == 3:
-                    p.stage_3_accepted = decision
 
 class WaitAfterResponse(WaitPage):
     title_text = "お待ちください"
     body_text = "相手の応答を待ってください..."
 
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        return (not g.finished) and g.offer_locked
-
-
-# Stage 2
-class Bargain_Propose_Stage2(Page):
-    form_model = 'player'
-    form_fields = ['offer_points']
-    template_name = 'human_human_Practice/Bargain_Propose.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 2:
-            return False
-        return Bargain_Propose.is_displayed(p)
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Propose.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        if values['offer_points'] is None:
-            return '手渡すポイントを入力してください / Please enter an offer'
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Propose.before_next_page(p, timeout_happened)
-
-
-class WaitForOffer_Stage2(WaitPage):
-    title_text = "お待ちください"
-    body_text = "提案が相手に拒否されました。相手からの提案を待ってください..."
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 2:
-            return False
-        return WaitForOffer.is_displayed(p)
-
-
-class Bargain_Respond_Stage2(Page):
-    form_model = 'player'
-    form_fields = ['accepted_offer']
-    template_name = 'human_human_Practice/Bargain_Respond.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 2:
-            return False
-        return Bargain_Respond.is_displayed(p)
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Respond.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        if 'accepted_offer' not in values or values['accepted_offer'] is None:
-            return '受け入れるか拒否するかを選択してください / Please select Accept or Reject'
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Respond.before_next_page(p, timeout_happened)
-
-
-class WaitAfterResponse_Stage2(WaitPage):
-    title_text = "お待ちください"
-    body_text = "相手の応答を待ってください..."
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 2:
-            return False
-        return WaitAfterResponse.is_displayed(p)
 
+# ==================== Stage 2..MAX_STAGE 页面 ====================
+# 按 C.MAX_STAGE 生成 Bargain_Propose_Stage2, Bargain_Respond_Stage2, ...（见 common/stages.py）
 
-# Stage 3
-class Bargain_Propose_Stage3(Page):
-    form_model = 'player'
-    form_fields = ['offer_points']
-    template_name = 'human_human_Practice/Bargain_Propose.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 3:
-            return False
-        return Bargain_Propose.is_displayed(p)
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Propose.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        if values['offer_points'] is None:
-            return '手渡すポイントを入力してください / Please enter an offer'
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Propose.before_next_page(p, timeout_happened)
-
-
-class WaitForOffer_Stage3(WaitPage):
-    title_text = "お待ちください"
-    body_text = "提案が相手に拒否されました。相手からの提案を待ってください..."
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 3:
-            return False
-        return WaitForOffer.is_displayed(p)
-
-
-class Bargain_Respond_Stage3(Page):
-    form_model = 'player'
-    form_fields = ['accepted_offer']
-    template_name = 'human_human_Practice/Bargain_Respond.html'
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 3:
-            return False
-        return Bargain_Respond.is_displayed(p)
-
-    @staticmethod
-    def vars_for_template(p: Player):
-        return Bargain_Respond.vars_for_template(p)
-
-    @staticmethod
-    def error_message(p: Player, values):
-        if 'accepted_offer' not in values or values['accepted_offer'] is None:
-            return '受け入れるか拒否するかを選択してください / Please select Accept or Reject'
-
-    @staticmethod
-    def before_next_page(p: Player, timeout_happened):
-        return Bargain_Respond.before_next_page(p, timeout_happened)
-
-
-class WaitAfterResponse_Stage3(WaitPage):
-    title_text = "お待ちください"
-    body_text = "相手の応答を待ってください..."
-
-    @staticmethod
-    def is_displayed(p: Player):
-        g: Group = p.group
-        if g.finished or g.stage < 3:
-            return False
-        return WaitAfterResponse.is_displayed(p)
+STAGE_PAGES = stages.stage_pages(
+    [
+        ('propose', Bargain_Propose, None),
+        ('wait_offer', WaitForOffer, dict(body_text="提案が相手に拒否されました。相手からの提案を待ってください...")),
+        ('respond', Bargain_Respond, None),
+        ('wait_response', WaitAfterResponse, None),
+    ],
+    current_step, C.MAX_STAGE, globals(),
+)
 
 
 class ResultsWait(WaitPage):
@@ -552,23 +350,11 @@ class WaitForPlayers(WaitPage):
 page_sequence = [
     Start,
     Intro,
-    # Stage 1
-    Bargain_Propose,
-    WaitForOffer,
-    Bargain_Respond,
-    WaitAfterResponse,
-    # Stage 2
-    Bargain_Propose_Stage2,
-    WaitForOffer_Stage2,
-    Bargain_Respond_Stage2,
-    WaitAfterResponse_Stage2,
-    # Stage 3
-    Bargain_Propose_Stage3,
-    WaitForOffer_Stage3,
-    Bargain_Respond_Stage3,
-    WaitAfterResponse_Stage3,
+    # Stage 1..MAX_STAGE
+    *STAGE_PAGES,
     # Results
     ResultsWait,
     Results,
     WaitForPlayers
-]
\ No newline at end of file
+]
+instrument_pages(page_sequence)
@@ -1,5 +1,7 @@
 from otree.api import *
 
+from common.timing import instrument_pages
+
 doc = """
 Your app description
 """
@@ -23,6 +25,46 @@ class Player(BasePlayer):
     pass
 
 
+TREATMENTS = ('T1', 'T2', 'T3')
+
+# 旧的 session config 没有 treatment 时，按 config 名判断
+CONFIG_NAME_TREATMENTS = [
+    ('human_human', 'T1'),
+    ('human_AI_bargaining1', 'T2'),
+    ('human_AI_bargaining2', 'T3'),
+]
+
+
+def resolve_treatment(config: dict) -> str:
+    treatment = config.get('treatment')
+    if treatment in TREATMENTS:
+        return treatment
+    for pattern, name in CONFIG_NAME_TREATMENTS:
+        if pattern in config['name']:
+            return name
+    return 'T1'
+
+
+# 各 treatment 的说明幻灯片（Google Slides 的发布用嵌入 URL），模板中的 iframe 直接加载
+SLIDE_URLS = {
+    'T1': 'https://docs.google.com/presentation/d/e/2PACX-1vSrtQDsjAnpMxz7EQt8Dlh_fkEtSk8lBDRz_VqpNhEkboJQ4ItpTswFtnCFYdnVxwlZNHpyC8SRqPpu/pubembed?start=true&loop=true&delayms=30000',
+    'T2': 'https://docs.google.com/presentation/d/e/2PACX-1vRuAHRC9ZEV9hFsR04JdgvchvGE36SR2nDkDVL3rGTOvs18MWS8m_i-MfyWiNh-1VQhPQu_uMqu_GJl/pubembed?start=false&loop=false&delayms=30000',
+    'T3': 'https://docs.google.com/presentation/d/e/2PACX-1vRoI1T0X3_vYleG95vprs4zV4dv7poT46dDN4iYUSn3vKIjiLp5xFB_c0iYJqVxvWnH4wYvDV7qBHub/pubembed?start=false&loop=false&delayms=30000',
+}
+
+
+def slide_url(treatment: str) -> str:
+    return SLIDE_URLS[treatment]
+
+
+def creating_session(subsession: Subsession):
+    # treatment 在创建 session 时确定一次，之后的页面直接读取 participant.treatment
+    treatment = resolve_treatment(subsession.session.config)
+    for p in subsession.get_players():
+        p.participant.treatment = treatment
+    print(f"[instruction] Session {subsession.session.code}: treatment={treatment}")
+
+
 # PAGES
 class Waitplease(Page):
     pass
@@ -31,30 +73,12 @@ class Waitplease(Page):
 class Instruction(Page):
     @staticmethod
     def vars_for_template(player: Player):
-        session = player.session
-
-        # 根据 session 的 config_name 来判断 treatment
-        if 'human_human' in session.config['name']:
-            treatment = 'T1'
-            slide_path = 'instruction/T1.html'
-        elif 'human_AI_bargaining1' in session.config['name']:
-            treatment = 'T2'
-            slide_path = 'instruction/T2.html'
-        elif 'human_AI_bargaining2' in session.config['name']:
-            treatment = 'T3'
-            slide_path = 'instruction/T3.html'
-        else:
-            # 默认值
-            treatment = 'T1'
-            slide_path = 'instruction/T1.html'
-
-        # 保存 treatment 到 participant
-        player.participant.treatment = treatment
-
+        treatment = player.participant.treatment
         return dict(
-            slide_path=slide_path,
+            slide_url=slide_url(treatment),
             treatment=treatment
         )
 
 
-page_sequence = [Waitplease, Instruction]
\ No newline at end of file
+page_sequence = [Waitplease, Instruction]
+instrument_pages(page_sequence)
@@ -0,0 +1,10 @@
+from otree.api import Currency as c, currency_range, expect, Bot, SubmissionMustFail, Submission
+from . import *
+from common.bots import submit
+
+
+class PlayerBot(Bot):
+    def play_round(self):
+        # Waitplease 没有按钮（由实验者推进），bot 直接提交
+        yield from submit(self, Waitplease, check_html=False)
+        yield from submit(self, Instruction)
@@ -1,10 +1,16 @@
 from otree.api import *
 from ._lexicon_q import Lexicon
+from common import questionnaire
+from common.timing import instrument_pages
 
 doc = """
 questionnaireT1
 """
 
+# 问题列表由 Lexicon 生成（见 common/questionnaire.py）
+SPEC = questionnaire.build_spec(Lexicon)
+
+
 class C(BaseConstants):
     NAME_IN_URL = 'questionnaireT1'
     PLAYERS_PER_GROUP = None
@@ -19,71 +25,27 @@ class Group(BaseGroup):
 
 
 class Player(BasePlayer):
+    pass
+
+
+# 问题字段由 SPEC 生成（见 common/questionnaire.py）
+questionnaire.add_fields(Player, SPEC)
+
 
-    age = models.IntegerField(
-        min=17, max=100,
-        label = Lexicon.q_age
-    )
-    gender = models.IntegerField(
-        label = Lexicon.q_gender,
-        choices = Lexicon.q_gender_opts
-    )
-    affiliate = models.IntegerField(
-        label = Lexicon.q_affiliate,
-        choices = Lexicon.q_affiliate_opts
-    )
-    rule = models.IntegerField(
-        label = Lexicon.q_rule,
-        choices = Lexicon.q_rule_opts
-    )
-    offer_1 = models.IntegerField(
-        label=Lexicon.q_offer_1,
-        choices=Lexicon.q_offer_1_opts
-    )
-    offer_2= models.IntegerField(
-        label = Lexicon.q_offer_2,
-        choices = Lexicon.q_offer_2_opts
-    )
-    offer_3 = models.IntegerField(
-        label=Lexicon.q_offer_3,
-        choices=Lexicon.q_offer_3_opts
-    )
-    offer_4 = models.IntegerField(
-        label=Lexicon.q_offer_4,
-        choices=Lexicon.q_offer_4_opts,
-    )
 # PAGES
 
 class Start(Page):
     pass
 
-def custom_export(players):
-    # header row
-    yield ['session', 'participant_code', 'label',  'id_in_group',
-    'age','gender',
-    'affiliate','rule','offer_1','offer_2','offer_3','offer_4']
-    for p in players:
-        participant = p.participant
-        session = p.session
-        yield [
-        session.code, participant.code, participant.label,  p.id_in_group, 
-        p.age, p.gender,
-        p.affiliate, p.rule, p.offer_1,p.offer_2
-        ]      
+custom_export = questionnaire.make_custom_export(SPEC)
 
 
 class Questions(Page):
     form_model = 'player'
-    form_fields = ['age', 'gender',
-                    'affiliate','rule','offer_1',
-                    'offer_2','offer_3','offer_4']
-    @staticmethod
-    def vars_for_template(player: Player):
-        return dict(
-            Lexicon=Lexicon,
-        )
+    form_fields = questionnaire.form_fields(SPEC)
 
 class Qfinish(Page):
     pass
 
 page_sequence = [Questions,Qfinish]
+instrument_pages(page_sequence)
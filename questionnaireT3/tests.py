@@ -0,0 +1,10 @@
+from otree.api import Currency as c, currency_range, expect, Bot, SubmissionMustFail, Submission
+from . import *
+from common.bots import submit, questionnaire_answers
+
+
+class PlayerBot(Bot):
+    def play_round(self):
+        yield from submit(self, Start)
+        yield from submit(self, Questions, questionnaire_answers(Questions.form_fields, Lexicon))
+        yield from submit(self, Qfinish)
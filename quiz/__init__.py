@@ -1,14 +1,18 @@
 from otree.api import *
+import json
+
+from common.timing import instrument_pages
 
 doc = """
 実験クイズアプリ - 6問の理解度確認テスト
+全ての問題を1ページに表示し、ブラウザ側で即時に正誤を確認する（送信時にサーバー側でも確認）。
 """
 
 
 class C(BaseConstants):
     NAME_IN_URL = 'quiz'
     PLAYERS_PER_GROUP = None
-    NUM_ROUNDS = 6
+    NUM_ROUNDS = 1
 
     QUESTIONS = [
         {
@@ -78,6 +82,28 @@ class C(BaseConstants):
     ]
 
 
+# 模板与 JS 使用的问题数据，在 import 时生成一次
+QUESTION_ITEMS = [
+    dict(
+        num=i,
+        field=f'answer_{i}',
+        text=q['question'],
+        choices=q['choices'],
+    )
+    for i, q in enumerate(C.QUESTIONS, start=1)
+]
+ANSWER_FIELDS = [item['field'] for item in QUESTION_ITEMS]
+
+
+def make_answer_field(num: int):
+    question = C.QUESTIONS[num - 1]
+    return models.IntegerField(
+        label=question['question'],
+        choices=question['choices'],
+        widget=widgets.RadioSelect,
+    )
+
+
 class Subsession(BaseSubsession):
     pass
 
@@ -87,40 +113,84 @@ class Group(BaseGroup):
 
 
 class Player(BasePlayer):
-    answer = models.IntegerField()
+    answer_1 = make_answer_field(1)
+    answer_2 = make_answer_field(2)
+    answer_3 = make_answer_field(3)
+    answer_4 = make_answer_field(4)
+    answer_5 = make_answer_field(5)
+    answer_6 = make_answer_field(6)
+
+    # 浏览器端记录的每题尝试次数与答对时间，随最终答案一起提交（格式见 parse_quiz_log）
+    quiz_log = models.LongStringField(blank=True)
+
+
+def _int_or_none(value, upper: int):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return max(0, min(upper, int(value)))
+
+
+def parse_quiz_log(raw: str) -> dict:
+    """
+    解析并规范化浏览器提交的 quiz_log：
+        {"v": 1, "attempts": [每题尝试次数], "ms_to_correct": [每题答对时的毫秒数], "page_ms": 页面停留毫秒数}
+    缺失或格式不对的项为 None（例如浏览器禁用了 JS）。
+    """
+    n = len(C.QUESTIONS)
+    log = dict(v=1, attempts=[None] * n, ms_to_correct=[None] * n, page_ms=None)
+    try:
+        data = json.loads(raw) if raw else {}
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    for key, upper in (('attempts', 1000), ('ms_to_correct', 24 * 3600 * 1000)):
+        values = data.get(key)
+        if isinstance(values, list) and len(values) == n:
+            log[key] = [_int_or_none(v, upper) for v in values]
+    log['page_ms'] = _int_or_none(data.get('page_ms'), 24 * 3600 * 1000)
+    return log
 
 
 class Start(Page):
-    @staticmethod
-    def is_displayed(p: Player):
-        # 只在最后一轮显示
-        return p.round_number == 1
+    pass
 
 
 class QuestionPage(Page):
     form_model = 'player'
-    form_fields = ['answer']
+    form_fields = ANSWER_FIELDS + ['quiz_log']
 
     @staticmethod
     def vars_for_template(player: Player):
-        question_data = C.QUESTIONS[player.round_number - 1]
-        return {
-            'question_num': player.round_number,
-            'question_text': question_data['question'],
-            'choices': question_data['choices'],
-        }
+        return dict(questions=QUESTION_ITEMS)
+
+    @staticmethod
+    def js_vars(player: Player):
+        return dict(
+            correct=[q['correct'] for q in C.QUESTIONS],
+            error_msgs=[q['error_msg'] for q in C.QUESTIONS],
+        )
 
     @staticmethod
     def error_message(player: Player, values):
-        question_data = C.QUESTIONS[player.round_number - 1]
-        if values['answer'] != question_data['correct']:
-            return question_data['error_msg']
+        # 服务器端再确认一次（浏览器端的检查可以被绕过）
+        wrong = [
+            f"問題{i}: {q['error_msg']}"
+            for i, q in enumerate(C.QUESTIONS, start=1)
+            if values[f'answer_{i}'] != q['correct']
+        ]
+        if wrong:
+            return ' / '.join(wrong)
+
+    @staticmethod
+    def before_next_page(player: Player, timeout_happened):
+        # 保存规范化后的紧凑 JSON（一个字段，一次写入）
+        log = parse_quiz_log(player.field_maybe_none('quiz_log'))
+        player.quiz_log = json.dumps(log, separators=(',', ':'))
 
 
 class Results(Page):
-    @staticmethod
-    def is_displayed(player: Player):
-        return player.round_number == C.NUM_ROUNDS
+    pass
 
 class WaitForPlayers(WaitPage):
     """等待所有玩家完成所有轮次后再显示最终结果"""
@@ -129,14 +199,27 @@ class WaitForPlayers(WaitPage):
     body_text = "全ての参加者がクイズを終了するのを待ってください..."
     wait_for_all_groups = True
 
-    @staticmethod
-    def is_displayed(p: Player):
-        # 只在最后一轮显示
-        return p.round_number == C.NUM_ROUNDS
-
     @staticmethod
     def after_all_players_arrive(subsession: Subsession):
         pass
 
 
-page_sequence = [Start,QuestionPage, Results, WaitForPlayers]
\ No newline at end of file
+def custom_export(players):
+    """每位参与者一行：每题的尝试次数、答对所用时间（毫秒）与页面停留时间"""
+    n = len(C.QUESTIONS)
+    yield (['session', 'participant_code', 'label']
+           + [f'attempts_{i}' for i in range(1, n + 1)]
+           + [f'ms_to_correct_{i}' for i in range(1, n + 1)]
+           + ['page_ms'])
+    for p in players:
+        raw = p.field_maybe_none('quiz_log')
+        if raw is None:
+            continue
+        log = parse_quiz_log(raw)
+        participant = p.participant
+        yield ([p.session.code, participant.code, participant.label]
+               + log['attempts'] + log['ms_to_correct'] + [log['page_ms']])
+
+
+page_sequence = [Start,QuestionPage, Results, WaitForPlayers]
+instrument_pages(page_sequence)
@@ -0,0 +1,26 @@
+from otree.api import Currency as c, currency_range, expect, Bot, SubmissionMustFail, Submission
+from . import *
+from common import timing
+from common.bots import submit
+
+
+class PlayerBot(Bot):
+    def play_round(self):
+        yield from submit(self, Start)
+
+        answers = {f'answer_{i}': q['correct'] for i, q in enumerate(C.QUESTIONS, start=1)}
+        first = C.QUESTIONS[0]
+        wrong = next(value for value, _ in first['choices'] if value != first['correct'])
+        yield SubmissionMustFail(QuestionPage, dict(answers, answer_1=wrong))
+
+        log = '{"v": 1, "attempts": [2, 1, 1, 1, 1, 1], "ms_to_correct": [900, 400, 500, 600, 700, 800], "page_ms": 5000}'
+        yield from submit(self, QuestionPage, dict(answers, quiz_log=log))
+        expect(self.player.answer_1, first['correct'])
+        expect('"attempts":[2,1,1,1,1,1]', 'in', self.player.quiz_log)
+        yield from submit(self, Results)
+
+        # 离开 WaitForPlayers 之后才回到这里：after_all_players_arrive（oTree 以 subsession= 调用）
+        # 经过 common/timing.py 的包装后正常执行并被计时
+        if timing.enabled():
+            hooks = {(row['page'], row['hook']) for row in timing.snapshot() if row['app'] == 'quiz'}
+            expect(('WaitForPlayers', 'after_all_players_arrive'), 'in', hooks)
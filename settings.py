@@ -6,6 +6,10 @@ SESSION_CONFIGS = [
         app_sequence=['instruction','quiz','human_human_Practice','human_human','questionnaireT1', 'FinalResults'],
         num_demo_participants=2,
         treatment='T1',  # 👈 添加 treatment 参数
+        # 超时与掉队处理（0 = 不限时；见 common/straggler.py）
+        decision_timeout_seconds=0,
+        results_timeout_seconds=0,
+        straggler_policy='default',  # 'default' 或 'ai'
     ),
     dict(
         name='human_AI_bargaining1_demo',
@@ -13,6 +17,13 @@ SESSION_CONFIGS = [
         app_sequence=['instruction','quiz','human_AI_bargaining_Practice','human_AI_bargaining1', 'questionnaireT3','FinalResults'],
         num_demo_participants=3,
         treatment='T2',  # 👈 添加 treatment 参数 jdhjskhdj
+        # 轮次推进方式: round / cohort / final / free（见 common/progression.py）
+        progression='round',
+        cohort_rounds=5,
+        # 超时与掉队处理（0 = 不限时；见 common/straggler.py）
+        decision_timeout_seconds=0,
+        results_timeout_seconds=0,
+        straggler_policy='default',  # 'default' 或 'ai'
     ),
     dict(
         name='human_AI_bargaining2_demo',
@@ -20,12 +31,25 @@ SESSION_CONFIGS = [
         app_sequence=['instruction','quiz','human_AI_bargaining_Practice','human_AI_bargaining2', 'questionnaireT3','FinalResults'],
         num_demo_participants=2,
         treatment='T3',  # 👈 添加 treatment 参数
+        # 轮次推进方式: round / cohort / final / free（见 common/progression.py）
+        progression='round',
+        cohort_rounds=5,
+        # 超时与掉队处理（0 = 不限时；见 common/straggler.py）
+        decision_timeout_seconds=0,
+        results_timeout_seconds=0,
+        straggler_policy='default',  # 'default' 或 'ai'
     ),
 ]
 
+# 只加载指定的 session config 及其 app（BARGAINING_SESSION_CONFIGS，见 common/startup.py）
+from common.startup import select_session_configs
+SESSION_CONFIGS = select_session_configs(SESSION_CONFIGS)
+
 SESSION_CONFIG_DEFAULTS = dict(
     real_world_currency_per_point=1.0,
     participation_fee=0.0,
+    # session 的随机数种子（common/rng.py）；为空时使用 BARGAINING_RNG_SEED 或随机生成
+    rng_seed='',
     doc="",
 )
 
@@ -51,7 +75,9 @@ PARTICIPANT_FIELDS = [
     'payment_source_player_id',
     'ai_role_in_that_game',
     'used_fallback',
-    'original_pay_round'
+    'original_pay_round',
+    'idle_seconds',
+    'ai_takeover',
 ]
 SESSION_FIELDS = []
 
@@ -89,6 +115,10 @@ DEMO_PAGE_INTRO_HTML = """
 
 INSTALLED_APPS = ['otree']
 
+# 数据库 profile（BARGAINING_DB_PROFILE=sqlite-wal / postgres，见 common/db.py）
+from common.db import install_db_profile
+install_db_profile()
+
 SECRET_KEY = 'dev-secret-key'
 
 